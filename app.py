@@ -1,17 +1,204 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, Response, send_file
+from flask import Flask, render_template, request, redirect, url_for, session, flash, Response, send_file, g, jsonify, make_response, has_request_context, has_app_context
+from flask import before_render_template, template_rendered, send_from_directory, stream_template
 import os
+import numpy as np
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from datetime import datetime
-from werkzeug.security import generate_password_hash, check_password_hash
+import psycopg2.errors
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor, execute_values
+from datetime import date, datetime, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
 from functools import wraps
+from contextlib import contextmanager
+import base64
+import csv
+import gzip
+import hashlib
+import hmac
 import io
+import json
+import mimetypes
+import queue
+import re
+import select
+import shutil
+import subprocess
+import sys
+import click
+import tempfile
+import threading
+import time
+import urllib.request
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.http import is_resource_modified
+from werkzeug.security import safe_join
+from flask_talisman import Talisman
+from prometheus_client import CollectorRegistry, Histogram, REGISTRY, generate_latest, CONTENT_TYPE_LATEST, multiprocess
+
+ARRANQUE = time.perf_counter()
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'eterno_calculadora_secret_key_2026')
 
 DATABASE_URL = os.environ.get('DATABASE_URL')
 
+# Pool de conexiones (uno por proceso/worker de gunicorn)
+DB_POOL_MAX = int(os.environ.get('DB_POOL_MAX', 5))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+DB_POOL_PING_SEGUNDOS = float(os.environ.get('DB_POOL_PING_SEGUNDOS', 30))
+
+# Réplicas de lectura (opcional, URLs separadas por comas): las rutas de sólo lectura
+# las usan en rotación; una réplica que no responde queda fuera REPLICA_REINTENTO_SEGUNDOS
+DATABASE_READ_URLS = [url.strip() for url in os.environ.get('DATABASE_READ_URL', '').split(',') if url.strip()]
+REPLICA_CONNECT_TIMEOUT = int(os.environ.get('REPLICA_CONNECT_TIMEOUT', 2))
+REPLICA_POOL_TIMEOUT = float(os.environ.get('REPLICA_POOL_TIMEOUT', 1))
+REPLICA_REINTENTO_SEGUNDOS = float(os.environ.get('REPLICA_REINTENTO_SEGUNDOS', 30))
+# Tras escribir, la sesión lee del primario estos segundos para ver sus propios cambios
+LECTURA_PRIMARIO_SEGUNDOS = float(os.environ.get('LECTURA_PRIMARIO_SEGUNDOS', 5))
+
+POR_PAGINA_DEFECTO = 50
+POR_PAGINA_MAX = 200
+
+# Búsqueda de clientes (/api/clientes/buscar)
+BUSQUEDA_MIN_CARACTERES = 2
+BUSQUEDA_LIMITE_DEFECTO = 10
+BUSQUEDA_LIMITE_MAX = 50
+# Letras con tilde y su reemplazo: la misma tabla que translate() en normalizar_texto()
+# (migrations/0012_normalizar_texto_ampliado.sql); tests/test_busqueda.py compara ambas
+TILDES_ORIGEN = ('ÁÀÂÄÃÅĀĂĄáàâäãåāăąÉÈÊËĒĖĘĚéèêëēėęěÍÌÎÏĪĮíìîïīįıÓÒÔÖÕØŌŐóòôöõøōő'
+                 'ÚÙÛÜŪŮŰŲúùûüūůűųÝŸýÿÑŃŇñńňÇĆČçćčĎĐďđĞğŁłŘřŚŞŠśşšŢŤţťŹŻŽźżž')
+TILDES_DESTINO = ('AAAAAAAAAaaaaaaaaaEEEEEEEEeeeeeeeeIIIIIIiiiiiiiOOOOOOOOoooooooo'
+                  'UUUUUUUUuuuuuuuuYYyyNNNnnnCCCcccDDddGgLlRrSSSsssTTttZZZzzz')
+TABLA_TILDES = str.maketrans(TILDES_ORIGEN, TILDES_DESTINO)
+
+# Listado completo de pedidos (/pedidos/listado): se envía mientras se lee la base
+LISTADO_LOTE = int(os.environ.get('LISTADO_LOTE', 1000))
+LISTADO_BLOQUE_BYTES = int(os.environ.get('LISTADO_BLOQUE_BYTES', 16 * 1024))
+LISTADO_GZIP = os.environ.get('LISTADO_GZIP', '1') == '1'
+
+# Exportación a Excel
+EXPORT_LOTE = int(os.environ.get('EXPORT_LOTE', 2000))
+EXPORT_SPOOL_BYTES = int(os.environ.get('EXPORT_SPOOL_BYTES', 8 * 1024 * 1024))
+EXPORT_DIR = os.environ.get('EXPORT_DIR', os.path.join(tempfile.gettempdir(), 'eterno_exportaciones'))
+EXPORT_WORKERS = int(os.environ.get('EXPORT_WORKERS', 2))
+EXPORT_MAX_HORAS = float(os.environ.get('EXPORT_MAX_HORAS', 24))
+EXPORT_MAX_BYTES = int(os.environ.get('EXPORT_MAX_BYTES', 500 * 1024 * 1024))
+EXPORT_TRABAJO_TIMEOUT_MINUTOS = int(os.environ.get('EXPORT_TRABAJO_TIMEOUT_MINUTOS', 30))
+# Exportación CSV (/exportar-csv): la base genera el archivo con COPY y se envía mientras lo produce
+EXPORT_CSV_BLOQUE_BYTES = int(os.environ.get('EXPORT_CSV_BLOQUE_BYTES', 64 * 1024))
+EXPORT_CSV_COLA = 16  # bloques listos en espera; si el cliente no los recibe, el COPY se detiene
+
+# Instrumentación: /metrics (con gunicorn, definir PROMETHEUS_MULTIPROC_DIR) y perfiles por petición
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+PERFIL_DIR = os.environ.get('PERFIL_DIR', os.path.join(tempfile.gettempdir(), 'eterno_perfiles'))
+PERFIL_INTERVALO = float(os.environ.get('PERFIL_INTERVALO', 0.005))
+
+# Importación masiva de pedidos
+IMPORT_LOTE = int(os.environ.get('IMPORT_LOTE', 1000))
+IMPORT_MAX_ERRORES_MOSTRADOS = 200
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_MB', 20)) * 1024 * 1024
+
+# Dashboard en vivo (/api/eventos): Server-Sent Events alimentados por LISTEN/NOTIFY.
+# Cada conexión abierta ocupa un hilo del worker mientras dura, así que viene desactivado:
+# gunicorn.conf.py (workers gthread) lo activa en cada worker con sus hilos menos
+# EVENTOS_HILOS_RESERVADOS, que quedan para las demás peticiones. Con un servidor que
+# no se queda sin hilos (`flask run`) se activa con EVENTOS_EN_VIVO=1.
+EVENTOS_CANAL = 'pedidos_eventos'
+EVENTOS_EN_VIVO = os.environ.get('EVENTOS_EN_VIVO', '0') == '1'
+EVENTOS_MAX_CLIENTES = int(os.environ.get('EVENTOS_MAX_CLIENTES', 50))  # tope por worker
+EVENTOS_HILOS_RESERVADOS = int(os.environ.get('EVENTOS_HILOS_RESERVADOS', 8))
+EVENTOS_LATIDO_SEGUNDOS = float(os.environ.get('EVENTOS_LATIDO_SEGUNDOS', 15))
+# Pasado este tiempo se cierra la conexión y el navegador reconecta con Last-Event-ID
+EVENTOS_DURACION_MAX = float(os.environ.get('EVENTOS_DURACION_MAX', 300))
+EVENTOS_RETENCION_HORAS = float(os.environ.get('EVENTOS_RETENCION_HORAS', 24))
+EVENTOS_COLA = 100  # eventos sin enviar por conexión; si se llena, el navegador recarga
+EVENTOS_REENVIO_MAX = 500  # a un navegador más atrasado se le pide recargar en vez de reenviarle todo
+EVENTOS_MAX_PEDIDOS = 50  # una escritura con más pedidos publica un solo evento 'recargar'
+
+# Catálogo
+CATALOGO_TTL = float(os.environ.get('CATALOGO_TTL', 30))
+CATALOGO_CANAL = 'catalogo'
+
+# Migraciones de esquema (se aplican con `flask db upgrade`, no al importar)
+MIGRACIONES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+MIGRACIONES_LOCK_ID = 7365001
+# Particiones anuales de pedidos que `flask db upgrade` deja creadas después del año en curso
+PARTICIONES_ANIOS_ADELANTE = int(os.environ.get('PARTICIONES_ANIOS_ADELANTE', 1))
+JINJA_CACHE_DIR = os.environ.get('JINJA_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'eterno_jinja'))
+
+# Contraseñas y protección del login
+PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+HASH_CONCURRENCIA = int(os.environ.get('HASH_CONCURRENCIA', 2))
+HASH_ESPERA_SEGUNDOS = float(os.environ.get('HASH_ESPERA_SEGUNDOS', 0.5))
+# memory:// cuenta por worker; en producción usar un backend compartido (redis://...)
+RATELIMIT_STORAGE_URI = os.environ.get('RATELIMIT_STORAGE_URI', 'memory://')
+LOGIN_LIMITE_IP = os.environ.get('LOGIN_LIMITE_IP', '20 per minute')
+LOGIN_LIMITE_USUARIO = os.environ.get('LOGIN_LIMITE_USUARIO', '5 per minute;20 per hour')
+# Proxies delante de la app (Render, nginx): para tomar la IP real de X-Forwarded-For
+PROXY_SALTOS = int(os.environ.get('PROXY_SALTOS', 0))
+# Redirigir a HTTPS, HSTS y cookie de sesión Secure (activar detrás de TLS)
+FORZAR_HTTPS = os.environ.get('FORZAR_HTTPS', '0') == '1'
+
+# Recursos estáticos: las librerías están commiteadas en static/vendor (`flask assets vendorizar`
+# las vuelve a bajar) y `flask assets construir` genera static/dist (nombres con hash, .gz/.br, variantes del logo)
+ASSETS_DIST = 'dist'
+ASSETS_MAX_AGE = 365 * 24 * 3600
+ASSETS_COMPRIMIBLES = ('.css', '.js', '.svg', '.json', '.txt', '.map', '.ttf')
+ASSETS_IMAGENES = ('.png', '.jpg', '.jpeg')
+# Ruta en static/ -> (origen, hash SRI fijado). vendorizar y construir rechazan un archivo que no
+# coincida con su hash; si falta en static/, asset_url usa el origen con integrity.
+ASSETS_VENDOR = {
+    'vendor/bootstrap/bootstrap.min.css': (
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css',
+        'sha384-9ndCyUaIbzAi2FUVXJi0CjmCapSmO7SnpJef0486qhLnuZ2cdeRhO02iuK6FUUVM'),
+    'vendor/bootstrap/bootstrap.min.js': (
+        'https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.min.js',
+        'sha384-fbbOQedDUMZZ5KreZpsbe1LCZPVmfTnH7ois6mU1QK+m14rQ1l2bGBq41eYeM/fS'),
+    'vendor/popper/popper.min.js': (
+        'https://cdn.jsdelivr.net/npm/@popperjs/core@2.11.8/dist/umd/popper.min.js',
+        'sha384-I7E8VVD/ismYTF4hNIPjVp/Zjvgyol6VFvRkX/vR+Vc4jQkC+hVqc2pM8ODewa9r'),
+    'vendor/bootstrap-icons/bootstrap-icons.min.css': (
+        'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.13.1/font/bootstrap-icons.min.css',
+        'sha384-CK2SzKma4jA5H/MXDUU7i1TqZlCFaD4T01vtyDFvPlD97JQyS+IsSh1nI2EFbpyk'),
+    'vendor/bootstrap-icons/fonts/bootstrap-icons.woff2': (
+        'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.13.1/font/fonts/bootstrap-icons.woff2',
+        'sha384-xEoI56EFpIZiDZZKBZxsn3gO3u/FvXtOpHbtkMWmSdfzDw3x9XdVc3i70O9hm4SC'),
+    'vendor/bootstrap-icons/fonts/bootstrap-icons.woff': (
+        'https://cdn.jsdelivr.net/npm/bootstrap-icons@1.13.1/font/fonts/bootstrap-icons.woff',
+        'sha384-IYfD9pNP/nesQsPyYtTdGCb4uhEWUmNF8GxaCvqcJFH+Of3c1b0VbH6hdHUonDSC'),
+    'vendor/chart.js/chart.umd.js': (
+        'https://cdn.jsdelivr.net/npm/chart.js@4.4.0/dist/chart.umd.js',
+        'sha384-3gbdZELRJ4fKFgxE8isyt8mOdw8uL9UXmiUID5xyi1JQmahtCI1g4ENDAx53FOPB'),
+    # Sin origen: subconjunto latin (pesos 300-700) de Montserrat[wght].ttf de google/fonts
+    'vendor/montserrat/montserrat-latin.woff2': (
+        None,
+        'sha384-VK3cLY1d72WdYUYAdIBp8We7dDO+y9E9qzwShJod+CRvw5TvbOLNg2eFnjecwxDR'),
+}
+# Entrada de Tailwind para el login: `flask assets estilos` la compila en static/css/login.css
+# con sólo las clases que usa la plantilla (en lugar del runtime que las generaba en el navegador)
+ESTILOS_LOGIN = '''@import "tailwindcss" source(none);
+@source "../../templates/login.html";
+
+@font-face {
+    font-family: 'Montserrat';
+    font-style: normal;
+    font-weight: 300 700;
+    font-display: swap;
+    src: url("../vendor/montserrat/montserrat-latin.woff2") format("woff2");
+}
+
+body { font-family: 'Montserrat', sans-serif; }
+'''
+
+# Valores iniciales del catálogo; los vigentes viven en las tablas catalogo_*
 PRODUCTOS_CONFIG = {
     'Grande': {
         'medidas': '94 x 152 cms',
@@ -49,114 +236,1625 @@ COSTOS_VISA = {
 
 METODOS_PAGO = ['Efectivo', 'Transferencia', 'Tarjeta débito']
 
+class HashSaturado(Exception):
+    """No hay cupo para calcular un hash de contraseña en este momento."""
+
+hash_cupos = threading.BoundedSemaphore(HASH_CONCURRENCIA)
+
+def con_cupo_hash(funcion, *args, **kwargs):
+    """Ejecuta un hash de contraseña sin pasar de HASH_CONCURRENCIA a la vez.
+
+    Si no hay cupo en HASH_ESPERA_SEGUNDOS falla con HashSaturado en lugar de
+    encolar: una ráfaga de logins no debe acaparar el worker.
+    """
+    if not hash_cupos.acquire(timeout=HASH_ESPERA_SEGUNDOS):
+        raise HashSaturado()
+    try:
+        return funcion(*args, **kwargs)
+    finally:
+        hash_cupos.release()
+
+def hashear_password(password):
+    return con_cupo_hash(generate_password_hash, password, method=PASSWORD_HASH_METHOD)
+
+def verificar_password(hashed, password):
+    return con_cupo_hash(check_password_hash, hashed, password)
+
+def prefijo_hash(metodo):
+    """Prefijo que Werkzeug escribe para `metodo`, con sus parámetros por defecto ('scrypt' -> 'scrypt:32768:8:1')."""
+    nombre, *parametros = metodo.split(':')
+    if nombre == 'scrypt':
+        n, r, p = parametros or (2 ** 15, 8, 1)
+        return f'scrypt:{int(n)}:{int(r)}:{int(p)}'
+    if nombre == 'pbkdf2':
+        hash_name = parametros[0] if parametros else 'sha256'
+        iteraciones = int(parametros[1]) if len(parametros) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iteraciones}'
+    raise ValueError(f'Método de hash no soportado: {metodo}')
+
+_prefijo_hash_vigente = prefijo_hash(PASSWORD_HASH_METHOD)
+
+def necesita_rehash(hashed):
+    """True si el hash guardado usa otro método o parámetros que PASSWORD_HASH_METHOD."""
+    return hashed.split('$', 1)[0] != _prefijo_hash_vigente
+
+# Histogramas por ruta; en multiproceso prometheus_client los comparte vía PROMETHEUS_MULTIPROC_DIR
+PETICION_SEGUNDOS = Histogram('eterno_peticion_segundos', 'Duración de la petición',
+                              ['endpoint', 'metodo', 'estado'],
+                              buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30))
+PETICION_DB_SEGUNDOS = Histogram('eterno_peticion_db_segundos', 'Tiempo en consultas SQL por petición', ['endpoint'],
+                                 buckets=(.001, .005, .01, .025, .05, .1, .25, .5, 1, 5, 30))
+PETICION_CONSULTAS = Histogram('eterno_peticion_consultas', 'Consultas SQL por petición', ['endpoint'],
+                               buckets=(1, 2, 3, 5, 10, 20, 50, 100))
+
+def registrar_consulta(segundos):
+    if has_request_context() and 'metricas' in g:
+        g.metricas['db'] += segundos
+        g.metricas['consultas'] += 1
+
+@contextmanager
+def fase(nombre):
+    """Suma la duración del bloque a la fase `nombre` de la petición (aparece en Server-Timing)."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        if has_request_context() and 'metricas' in g:
+            fases = g.metricas['fases']
+            fases[nombre] = fases.get(nombre, 0) + time.perf_counter() - inicio
+
+class CursorMedido(RealDictCursor):
+    """RealDictCursor que suma a la petición en curso el número y la duración de las consultas.
+
+    En cursores del servidor (con nombre) la consulta corre al pedir filas,
+    así que también se miden los fetch.
+    """
+
+    def execute(self, query, vars=None):
+        inicio = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            registrar_consulta(time.perf_counter() - inicio)
+
+    def executemany(self, query, vars_list):
+        inicio = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            registrar_consulta(time.perf_counter() - inicio)
+
+    def _fetch_medido(self, fetch, *args):
+        if not self.name:
+            return fetch(*args)
+        inicio = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            registrar_consulta(time.perf_counter() - inicio)
+
+    def fetchone(self):
+        return self._fetch_medido(super().fetchone)
+
+    def fetchmany(self, size=None):
+        return self._fetch_medido(super().fetchmany, size)
+
+    def fetchall(self):
+        return self._fetch_medido(super().fetchall)
+
+class PoolAgotado(Exception):
+    pass
+
+class PoolConexiones:
+    """Pool de conexiones por proceso.
+
+    Entrega como máximo `maxconn` conexiones; si no hay libres espera hasta
+    `timeout` segundos. Las conexiones ociosas se verifican antes de
+    reutilizarse y el pool se reinicia en el proceso hijo tras un fork.
+    """
+
+    def __init__(self, dsn, maxconn, timeout, ping_segundos, opciones_conexion=None):
+        self.dsn = dsn
+        self.opciones_conexion = opciones_conexion or {}
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.ping_segundos = ping_segundos
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._cupos = threading.BoundedSemaphore(self.maxconn)
+        self._libres = []
+        self._en_uso = 0
+        self._esperando = 0
+        self._checkouts = 0
+        self._tiempo_espera_total = 0.0
+        self._tiempo_espera_max = 0.0
+        self._reconexiones = 0
+        self._timeouts = 0
+
+    def despues_de_fork(self):
+        # Las conexiones heredadas comparten socket con el proceso padre: no se
+        # cierran (eso terminaría la sesión del padre), sólo se abandonan.
+        self._heredadas = getattr(self, '_heredadas', []) + [c for c, _ in self._libres]
+        self._reiniciar()
+
+    def _conectar(self):
+        return psycopg2.connect(self.dsn, cursor_factory=CursorMedido, **self.opciones_conexion)
+
+    def _conexion_sana(self, conn, ociosa_desde):
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        if time.monotonic() - ociosa_desde < self.ping_segundos:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute('SELECT 1')
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def obtener(self):
+        if os.getpid() != self._pid:
+            self.despues_de_fork()
+        inicio = time.monotonic()
+        with self._lock:
+            self._esperando += 1
+        try:
+            disponible = self._cupos.acquire(timeout=self.timeout)
+        finally:
+            with self._lock:
+                self._esperando -= 1
+        espera = time.monotonic() - inicio
+        if not disponible:
+            with self._lock:
+                self._timeouts += 1
+            raise PoolAgotado(f'No hay conexiones disponibles tras {self.timeout}s')
+        try:
+            conn = None
+            while conn is None:
+                with self._lock:
+                    candidata = self._libres.pop() if self._libres else None
+                if candidata is None:
+                    conn = self._conectar()
+                elif self._conexion_sana(*candidata):
+                    conn = candidata[0]
+                else:
+                    self._descartar(candidata[0])
+                    with self._lock:
+                        self._reconexiones += 1
+        except Exception:
+            self._cupos.release()
+            raise
+        with self._lock:
+            self._en_uso += 1
+            self._checkouts += 1
+            self._tiempo_espera_total += espera
+            self._tiempo_espera_max = max(self._tiempo_espera_max, espera)
+        return conn
+
+    def devolver(self, conn):
+        if os.getpid() != self._pid:
+            return
+        try:
+            if not conn.closed and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            self._descartar(conn)
+        with self._lock:
+            self._en_uso -= 1
+            if not conn.closed and len(self._libres) < self.maxconn:
+                self._libres.append((conn, time.monotonic()))
+                conn = None
+        if conn is not None:
+            self._descartar(conn)
+        self._cupos.release()
+
+    def _descartar(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def cerrar_todo(self):
+        with self._lock:
+            libres, self._libres = self._libres, []
+        for conn, _ in libres:
+            self._descartar(conn)
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                'pid': self._pid,
+                'max': self.maxconn,
+                'en_uso': self._en_uso,
+                'libres': len(self._libres),
+                'esperando': self._esperando,
+                'checkouts': self._checkouts,
+                'espera_promedio_ms': round(self._tiempo_espera_total / self._checkouts * 1000, 3) if self._checkouts else 0,
+                'espera_max_ms': round(self._tiempo_espera_max * 1000, 3),
+                'timeouts': self._timeouts,
+                'reconexiones': self._reconexiones
+            }
+
+class Replicas:
+    """Un pool por réplica de lectura, usadas en rotación.
+
+    Una réplica que no acepta conexiones (o cuya conexión se corta durante una
+    petición) queda fuera de la rotación REPLICA_REINTENTO_SEGUNDOS.
+    """
+
+    def __init__(self, dsns):
+        opciones = {'connect_timeout': REPLICA_CONNECT_TIMEOUT}
+        self.pools = [PoolConexiones(dsn, DB_POOL_MAX, REPLICA_POOL_TIMEOUT, DB_POOL_PING_SEGUNDOS, opciones)
+                      for dsn in dsns]
+        self._lock = threading.Lock()
+        self._turno = 0
+        self._caida_hasta = [0.0] * len(self.pools)
+        self._caidas = [0] * len(self.pools)
+        self._atrasadas = [0] * len(self.pools)
+
+    def __bool__(self):
+        return bool(self.pools)
+
+    def marcar_caida(self, indice, motivo):
+        with self._lock:
+            self._caida_hasta[indice] = time.monotonic() + REPLICA_REINTENTO_SEGUNDOS
+            self._caidas[indice] += 1
+        app.logger.warning('Réplica %s fuera de rotación por %.0fs: %s', indice, REPLICA_REINTENTO_SEGUNDOS, motivo)
+
+    def obtener(self, version_minima=None):
+        """(índice, conexión) de la siguiente réplica disponible; None si ninguna sirve.
+
+        Con `version_minima` se saltan las réplicas que todavía no replicaron
+        esa versión de los pedidos.
+        """
+        with self._lock:
+            inicio = self._turno
+            self._turno = (self._turno + 1) % len(self.pools)
+        for paso in range(len(self.pools)):
+            indice = (inicio + paso) % len(self.pools)
+            if self._caida_hasta[indice] > time.monotonic():
+                continue
+            pool = self.pools[indice]
+            try:
+                conn = pool.obtener()
+            except PoolAgotado:
+                continue
+            except psycopg2.Error as e:
+                self.marcar_caida(indice, e)
+                continue
+            try:
+                if version_minima is None or self.version(conn) >= version_minima:
+                    return indice, conn
+                with self._lock:
+                    self._atrasadas[indice] += 1
+            except psycopg2.Error as e:
+                self.marcar_caida(indice, e)
+            pool.devolver(conn)
+        return None
+
+    def version(self, conn):
+        cur = conn.cursor()
+        version, _ = version_datos_pedidos(cur)
+        cur.close()
+        return version
+
+    def devolver(self, indice, conn):
+        if conn.closed:
+            self.marcar_caida(indice, 'la conexión se cerró durante la petición')
+        self.pools[indice].devolver(conn)
+
+    def estadisticas(self):
+        ahora = time.monotonic()
+        with self._lock:
+            estados = list(zip(self._caida_hasta, self._caidas, self._atrasadas))
+        return [dict(pool.estadisticas(), caida=caida_hasta > ahora, caidas=caidas, atrasadas=atrasadas)
+                for pool, (caida_hasta, caidas, atrasadas) in zip(self.pools, estados)]
+
+db_pool = PoolConexiones(DATABASE_URL, DB_POOL_MAX, DB_POOL_TIMEOUT, DB_POOL_PING_SEGUNDOS)
+replicas = Replicas(DATABASE_READ_URLS)
+
+if hasattr(os, 'register_at_fork'):
+    for pool in [db_pool] + replicas.pools:
+        os.register_at_fork(after_in_child=pool.despues_de_fork)
+
 def get_db_connection():
-    conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
-    return conn
+    """Conexión del pool asociada al contexto de la petición; se devuelve en el teardown."""
+    if 'db' not in g:
+        g.db = db_pool.obtener()
+    return g.db
 
-def init_db():
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS usuarios (
-            id SERIAL PRIMARY KEY,
-            username VARCHAR(50) UNIQUE NOT NULL,
-            password VARCHAR(255) NOT NULL,
-            nombre VARCHAR(100) NOT NULL,
-            rol VARCHAR(20) DEFAULT 'usuario',
-            activo BOOLEAN DEFAULT TRUE,
-            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+def get_db_lectura(version_minima=None):
+    """Conexión para consultas de sólo lectura de la petición; se devuelve en el teardown.
+
+    Es una réplica salvo que no haya ninguna disponible, que la petición ya use
+    el primario o que la sesión haya escrito hace menos de LECTURA_PRIMARIO_SEGUNDOS.
+    Con `version_minima` sólo sirve una réplica que ya replicó esa versión de los
+    pedidos, y entonces se acepta aunque la petición ya use el primario.
+    """
+    if 'db_lectura' in g:
+        indice, conn = g.db_lectura
+        try:
+            if version_minima is None or replicas.version(conn) >= version_minima:
+                return conn
+        except psycopg2.Error as e:
+            replicas.marcar_caida(indice, e)
+        return get_db_connection()
+    if not replicas or session.get('primario_hasta', 0) > time.time() or ('db' in g and version_minima is None):
+        return get_db_connection()
+    replica = replicas.obtener(version_minima)
+    if replica is None:
+        return get_db_connection()
+    g.db_lectura = replica
+    return replica[1]
+
+def leer_del_primario():
+    """La sesión lee del primario los próximos LECTURA_PRIMARIO_SEGUNDOS (llamar tras escribir)."""
+    if replicas:
+        session['primario_hasta'] = time.time() + LECTURA_PRIMARIO_SEGUNDOS
+
+@app.after_request
+def fijar_lecturas_tras_escribir(response):
+    # Cualquier POST que usó el primario se considera una escritura
+    if 'db' in g and request.method not in ('GET', 'HEAD', 'OPTIONS'):
+        leer_del_primario()
+    return response
+
+@app.teardown_appcontext
+def devolver_db_connection(exception):
+    conn = g.pop('db', None)
+    if conn is not None:
+        db_pool.devolver(conn)
+    replica = g.pop('db_lectura', None)
+    if replica is not None:
+        replicas.devolver(*replica)
+
+class Perfilador(threading.Thread):
+    """Muestrea la pila de un hilo cada PERFIL_INTERVALO segundos (perfil estadístico).
+
+    Guarda las pilas en formato "collapsed" (una línea `f1;f2;f3 muestras`),
+    que leen speedscope y flamegraph.pl.
+    """
+
+    def __init__(self, hilo_id):
+        super().__init__(daemon=True)
+        self.hilo_id = hilo_id
+        self.muestras = {}
+        self._detener = threading.Event()
+
+    def run(self):
+        while not self._detener.wait(PERFIL_INTERVALO):
+            frame = sys._current_frames().get(self.hilo_id)
+            pila = []
+            while frame is not None:
+                codigo = frame.f_code
+                pila.append(f'{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if pila:
+                clave = ';'.join(reversed(pila))
+                self.muestras[clave] = self.muestras.get(clave, 0) + 1
+
+    def detener(self, nombre):
+        self._detener.set()
+        self.join()
+        os.makedirs(PERFIL_DIR, exist_ok=True)
+        ruta = os.path.join(PERFIL_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{nombre}.txt")
+        with open(ruta, 'w', encoding='utf-8') as archivo:
+            for pila, muestras in sorted(self.muestras.items()):
+                archivo.write(f'{pila} {muestras}\n')
+        return ruta
+
+@app.before_request
+def iniciar_metricas():
+    g.metricas = {'inicio': time.perf_counter(), 'db': 0.0, 'consultas': 0, 'fases': {}}
+    # Perfil de una sola petición: sólo administradores, agregando ?perfilar=1 a la URL
+    if request.args.get('perfilar') == '1' and session.get('rol') == 'admin':
+        g.perfilador = Perfilador(threading.get_ident())
+        g.perfilador.start()
+
+def _inicio_render(sender, template, context, **extra):
+    if 'metricas' in g:
+        g.metricas['inicio_render'] = time.perf_counter()
+
+def _fin_render(sender, template, context, **extra):
+    if 'metricas' in g and 'inicio_render' in g.metricas:
+        fases = g.metricas['fases']
+        fases['render'] = fases.get('render', 0) + time.perf_counter() - g.metricas.pop('inicio_render')
+
+before_render_template.connect(_inicio_render, app)
+template_rendered.connect(_fin_render, app)
+
+@app.after_request
+def registrar_metricas(response):
+    metricas = g.pop('metricas', None)
+    if metricas is None:
+        return response
+    total = time.perf_counter() - metricas['inicio']
+    endpoint = request.endpoint or 'desconocido'
+    if endpoint != 'static':
+        PETICION_SEGUNDOS.labels(endpoint, request.method, response.status_code).observe(total)
+        PETICION_DB_SEGUNDOS.labels(endpoint).observe(metricas['db'])
+        PETICION_CONSULTAS.labels(endpoint).observe(metricas['consultas'])
     
-    cur.execute('''
-        CREATE TABLE IF NOT EXISTS pedidos (
-            id SERIAL PRIMARY KEY,
-            fecha DATE NOT NULL,
-            cliente VARCHAR(100) NOT NULL,
-            producto VARCHAR(50) NOT NULL,
-            cantidad INTEGER DEFAULT 1,
-            precio_unitario DECIMAL(10,2) NOT NULL,
-            descuento DECIMAL(5,4) DEFAULT 0,
-            anticipo DECIMAL(10,2) DEFAULT 0,
-            metodo_pago_anticipo VARCHAR(50),
-            cuotas_visa_anticipo INTEGER DEFAULT 0,
-            fecha_sesion DATE,
-            metodo_pago_saldo VARCHAR(50),
-            cuotas_visa_saldo INTEGER DEFAULT 0,
-            usuario_id INTEGER REFERENCES usuarios(id),
-            fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
+    partes = [f'db;dur={metricas["db"] * 1000:.1f};desc="{metricas["consultas"]} consultas"']
+    partes += [f'{nombre};dur={segundos * 1000:.1f}' for nombre, segundos in metricas['fases'].items()]
+    partes.append(f'total;dur={total * 1000:.1f}')
+    response.headers['Server-Timing'] = ', '.join(partes)
     
+    perfilador = g.pop('perfilador', None)
+    if perfilador:
+        ruta = perfilador.detener(endpoint)
+        response.headers['X-Perfil'] = os.path.basename(ruta)
+        app.logger.info('Perfil de %s guardado en %s', request.path, ruta)
+    return response
+
+def _numero(valor):
+    valor = float(valor)
+    return int(valor) if valor.is_integer() else valor
+
+def cargar_catalogo(cur, version):
+    """Lee una versión del catálogo con la misma forma que PRODUCTOS_CONFIG/COSTOS_VISA/METODOS_PAGO."""
+    cur.execute('SELECT producto, medidas, precio, costos FROM catalogo_productos WHERE version = %s ORDER BY orden, producto', (version,))
+    productos = {
+        fila['producto']: {'medidas': fila['medidas'], 'precio': _numero(fila['precio']), 'costos': fila['costos']}
+        for fila in cur.fetchall()
+    }
+    cur.execute('SELECT cuotas, tasa FROM catalogo_visa WHERE version = %s ORDER BY cuotas', (version,))
+    costos_visa = {fila['cuotas']: float(fila['tasa']) for fila in cur.fetchall()}
+    cur.execute('SELECT metodo FROM catalogo_metodos_pago WHERE version = %s ORDER BY orden, metodo', (version,))
+    metodos_pago = [fila['metodo'] for fila in cur.fetchall()]
+    return {'version': version, 'productos': productos, 'costos_visa': costos_visa, 'metodos_pago': metodos_pago}
+
+def publicar_catalogo(cur, productos, costos_visa, metodos_pago, descripcion='', usuario_id=None):
+    """Crea una nueva versión del catálogo y avisa a los workers al confirmar la transacción."""
+    cur.execute('INSERT INTO catalogo_versiones (descripcion, usuario_id) VALUES (%s, %s) RETURNING version',
+                (descripcion, usuario_id))
+    version = cur.fetchone()['version']
+    for orden, (nombre, config) in enumerate(productos.items()):
+        cur.execute('''
+            INSERT INTO catalogo_productos (version, producto, medidas, precio, costos, costo_unitario, orden)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ''', (version, nombre, config.get('medidas'), config['precio'], json.dumps(config['costos']),
+              sum(config['costos'].values()), orden))
+    for cuotas, tasa in costos_visa.items():
+        cur.execute('INSERT INTO catalogo_visa (version, cuotas, tasa) VALUES (%s, %s, %s)', (version, int(cuotas), tasa))
+    for orden, metodo in enumerate(metodos_pago):
+        cur.execute('INSERT INTO catalogo_metodos_pago (version, metodo, orden) VALUES (%s, %s, %s)', (version, metodo, orden))
+    cur.execute('SELECT pg_notify(%s, %s)', (CATALOGO_CANAL, str(version)))
+    return version
+
+class CatalogoCache:
+    """Caché en proceso del catálogo.
+
+    Las versiones publicadas no cambian, así que se guardan para siempre. La
+    versión vigente se vuelve a consultar cuando llega un NOTIFY en el canal
+    del catálogo o, si el listener no está disponible, cada `ttl` segundos.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._versiones = {}
+        self._vigente = None
+        self._verificado = 0.0
+        self._listener_pid = None
+
+    def invalidar(self):
+        self._verificado = 0.0
+
+    def _con_cursor(self, funcion):
+        if has_app_context() and 'db' in g:
+            cur = g.db.cursor()
+            try:
+                return funcion(cur)
+            finally:
+                cur.close()
+        conn = db_pool.obtener()
+        try:
+            cur = conn.cursor()
+            resultado = funcion(cur)
+            cur.close()
+            return resultado
+        finally:
+            db_pool.devolver(conn)
+
+    def version(self, version):
+        catalogo = self._versiones.get(version)
+        if catalogo is None:
+            catalogo = self._con_cursor(lambda cur: cargar_catalogo(cur, version))
+            with self._lock:
+                self._versiones[version] = catalogo
+        return catalogo
+
+    def vigente(self):
+        if self._listener_pid != os.getpid():
+            self._iniciar_listener()
+        if self._vigente is None or time.monotonic() - self._verificado > self.ttl:
+            def consultar(cur):
+                cur.execute('SELECT MAX(version) AS version FROM catalogo_versiones')
+                return cur.fetchone()['version']
+            version = self._con_cursor(consultar)
+            self._vigente = self.version(version)
+            self._verificado = time.monotonic()
+        return self._vigente
+
+    def _iniciar_listener(self):
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+        threading.Thread(target=self._escuchar, name='catalogo-listener', daemon=True).start()
+
+    def _escuchar(self):
+        while True:
+            try:
+                conn = psycopg2.connect(DATABASE_URL)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                conn.cursor().execute(f'LISTEN {CATALOGO_CANAL}')
+                # Lo publicado mientras el listener estaba desconectado se recoge aquí
+                self.invalidar()
+                while True:
+                    if select.select([conn], [], [], 60) != ([], [], []):
+                        conn.poll()
+                        if conn.notifies:
+                            conn.notifies.clear()
+                            self.invalidar()
+            except psycopg2.Error:
+                app.logger.warning('Listener del catálogo desconectado; se usa el TTL de %ss', self.ttl)
+                time.sleep(5)
+
+catalogo_cache = CatalogoCache(CATALOGO_TTL)
+
+def catalogo_vigente():
+    return catalogo_cache.vigente()
+
+def catalogo_de(pedido):
+    """Catálogo con el que se cotizó el pedido (el vigente si no tiene versión)."""
+    version = pedido.get('catalogo_version')
+    return catalogo_cache.version(version) if version else catalogo_vigente()
+
+class SuscripcionEventos:
+    """Cola de una conexión de /api/eventos; `desbordada` si se perdieron eventos por no leerlos a tiempo."""
+    __slots__ = ('cola', 'desbordada')
+
+    def __init__(self):
+        self.cola = queue.Queue(EVENTOS_COLA)
+        self.desbordada = False
+
+class EventosPedidos:
+    """Reparte los eventos de pedidos a las conexiones SSE de este proceso.
+
+    Un solo hilo por worker escucha EVENTOS_CANAL y copia cada evento a la cola
+    de cada conexión, así que una conexión inactiva sólo cuesta un hilo
+    esperando en su cola: ni consultas ni conexiones a la base. Al reconectar,
+    el listener recupera de eventos_pedidos lo que se publicó mientras tanto.
+    """
+
+    def __init__(self, max_clientes):
+        self.max_clientes = max_clientes
+        self._lock = threading.Lock()
+        self._suscripciones = set()
+        self._ultimo = None
+        self._listener_pid = None
+        self._repartidos = 0
+        self._rechazadas = 0
+        self._escuchando = threading.Event()
+
+    def suscribir(self):
+        """Nueva suscripción, o None si este worker ya tiene max_clientes conexiones."""
+        if self._listener_pid != os.getpid():
+            self._iniciar_listener()
+        # Lo que llegue antes de que el listener escuche sólo se recupera reenviando desde la tabla
+        self._escuchando.wait(5)
+        with self._lock:
+            if len(self._suscripciones) >= self.max_clientes:
+                self._rechazadas += 1
+                return None
+            suscripcion = SuscripcionEventos()
+            self._suscripciones.add(suscripcion)
+            return suscripcion
+
+    def cancelar(self, suscripcion):
+        with self._lock:
+            self._suscripciones.discard(suscripcion)
+
+    def _repartir(self, evento):
+        with self._lock:
+            if self._ultimo is not None and evento['id'] <= self._ultimo:
+                return
+            self._ultimo = evento['id']
+            self._repartidos += 1
+            suscripciones = list(self._suscripciones)
+        for suscripcion in suscripciones:
+            try:
+                suscripcion.cola.put_nowait(evento)
+            except queue.Full:
+                suscripcion.desbordada = True
+
+    def _iniciar_listener(self):
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+            self._suscripciones = set()
+            self._escuchando.clear()
+        threading.Thread(target=self._escuchar, name='eventos-listener', daemon=True).start()
+
+    def _escuchar(self):
+        while True:
+            try:
+                conn = psycopg2.connect(DATABASE_URL)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+                cur.execute(f'LISTEN {EVENTOS_CANAL}')
+                # Lo publicado mientras el listener estaba desconectado se recoge aquí
+                if self._ultimo is None:
+                    cur.execute('SELECT COALESCE(MAX(id), 0) AS id FROM eventos_pedidos')
+                    self._ultimo = cur.fetchone()['id']
+                else:
+                    for evento in leer_eventos(cur, self._ultimo):
+                        self._repartir(evento)
+                self._escuchando.set()
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        cur.execute('DELETE FROM eventos_pedidos WHERE creado < CURRENT_TIMESTAMP - %s * INTERVAL \'1 hour\'',
+                                    (EVENTOS_RETENCION_HORAS,))
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        evento = json.loads(conn.notifies.pop(0).payload)
+                        if 'tipo' not in evento:
+                            cur.execute('SELECT id, tipo, datos FROM eventos_pedidos WHERE id = %s', (evento['id'],))
+                            fila = cur.fetchone()
+                            evento = dict(fila['datos'], id=fila['id'], tipo=fila['tipo'])
+                        self._repartir(evento)
+            except psycopg2.Error:
+                self._escuchando.clear()
+                app.logger.warning('Listener de eventos desconectado; se reintenta en 5s')
+                time.sleep(5)
+
+    def estadisticas(self):
+        with self._lock:
+            return {'conexiones': len(self._suscripciones), 'max_conexiones': self.max_clientes,
+                    'ultimo_evento': self._ultimo, 'repartidos': self._repartidos, 'rechazadas': self._rechazadas}
+
+eventos_pedidos = EventosPedidos(EVENTOS_MAX_CLIENTES if EVENTOS_EN_VIVO else 0)
+
+def limitar_eventos_a_hilos(hilos):
+    """Cupo de conexiones de eventos del worker según sus hilos (lo llama gunicorn.conf.py al iniciarlo).
+
+    Sin hilos de sobra (worker sync, o menos hilos que los reservados) el
+    dashboard en vivo queda desactivado en ese worker. Devuelve el cupo.
+    """
+    eventos_pedidos.max_clientes = max(0, min(EVENTOS_MAX_CLIENTES, hilos - EVENTOS_HILOS_RESERVADOS))
+    return eventos_pedidos.max_clientes
+
+def leer_eventos(cur, desde, limite=None):
+    """Eventos con id mayor que `desde`, en orden (como los reparte el listener)."""
+    cur.execute('SELECT id, tipo, datos FROM eventos_pedidos WHERE id > %s ORDER BY id' + (' LIMIT %s' if limite else ''),
+                (desde, limite) if limite else (desde,))
+    return [dict(fila['datos'], id=fila['id'], tipo=fila['tipo']) for fila in cur.fetchall()]
+
+def publicar_evento(cur, tipo, datos=None):
+    """Guarda un evento de pedidos y lo avisa por NOTIFY; ambos se confirman o descartan con la transacción.
+
+    Toma el lock de la fila de datos_version (el mismo que el trigger de
+    pedidos) para que los ids de evento sigan el orden en que se confirman.
+    """
+    datos = datos or {}
+    cur.execute("SELECT version FROM datos_version WHERE tabla = 'pedidos' FOR UPDATE")
+    cur.execute('INSERT INTO eventos_pedidos (tipo, datos) VALUES (%s, %s) RETURNING id', (tipo, json.dumps(datos)))
+    evento_id = cur.fetchone()['id']
+    carga = json.dumps(dict(datos, id=evento_id, tipo=tipo), separators=(',', ':'))
+    # NOTIFY admite menos de 8000 bytes; si no cabe, el listener lo lee de la tabla
+    if len(carga) >= 7900:
+        carga = json.dumps({'id': evento_id})
+    cur.execute('SELECT pg_notify(%s, %s)', (EVENTOS_CANAL, carga))
+    return evento_id
+
+def listar_migraciones():
+    """Migraciones disponibles como (version, nombre, ruta), ordenadas por versión."""
+    migraciones = []
+    for archivo in os.listdir(MIGRACIONES_DIR):
+        base, extension = os.path.splitext(archivo)
+        numero, _, nombre = base.partition('_')
+        if extension == '.sql' and numero.isdigit():
+            migraciones.append((int(numero), nombre, os.path.join(MIGRACIONES_DIR, archivo)))
+    return sorted(migraciones)
+
+def version_esquema(cur):
+    """Última migración aplicada (0 si la base nunca se migró)."""
+    try:
+        cur.execute('SELECT COALESCE(MAX(version), 0) AS version FROM schema_version')
+    except psycopg2.errors.UndefinedTable:
+        cur.connection.rollback()
+        return 0
+    return cur.fetchone()['version']
+
+def aplicar_migraciones(conn, aviso=print):
+    """Aplica las migraciones pendientes, cada una en su propia transacción.
+
+    El advisory lock evita que dos despliegues migren a la vez; el segundo
+    espera y encuentra todo aplicado. Devuelve las versiones aplicadas.
+    """
+    cur = conn.cursor()
+    cur.execute('SELECT pg_advisory_lock(%s)', (MIGRACIONES_LOCK_ID,))
+    conn.commit()
+    aplicadas = []
     try:
-        cur.execute('ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS anticipo DECIMAL(10,2) DEFAULT 0')
-        cur.execute('ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS metodo_pago_anticipo VARCHAR(50)')
-        cur.execute('ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS cuotas_visa_anticipo INTEGER DEFAULT 0')
-        cur.execute('ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS fecha_sesion DATE')
-        cur.execute('ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS metodo_pago_saldo VARCHAR(50)')
-        cur.execute('ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS cuotas_visa_saldo INTEGER DEFAULT 0')
-    except:
-        pass
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                nombre VARCHAR(100) NOT NULL,
+                aplicado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.commit()
+        actual = version_esquema(cur)
+        for version, nombre, ruta in listar_migraciones():
+            if version <= actual:
+                continue
+            with open(ruta, encoding='utf-8') as archivo:
+                sql = archivo.read()
+            try:
+                cur.execute(sql)
+                cur.execute('INSERT INTO schema_version (version, nombre) VALUES (%s, %s)', (version, nombre))
+                conn.commit()
+            except psycopg2.Error:
+                conn.rollback()
+                raise
+            aviso(f'Migración {version:04d} {nombre} aplicada')
+            aplicadas.append(version)
+        sembrar_datos(cur)
+        conn.commit()
+    finally:
+        conn.rollback()
+        cur.execute('SELECT pg_advisory_unlock(%s)', (MIGRACIONES_LOCK_ID,))
+        conn.commit()
+        cur.close()
+    return aplicadas
+
+def sembrar_datos(cur):
+    """Datos mínimos que necesita la app: particiones por adelantado, usuario admin, catálogo inicial y resumen diario."""
+    crear_particiones_adelante(cur)
+    cur.execute('SELECT EXISTS (SELECT 1 FROM catalogo_versiones) AS hay')
+    if not cur.fetchone()['hay']:
+        publicar_catalogo(cur, PRODUCTOS_CONFIG, COSTOS_VISA, METODOS_PAGO, 'Catálogo inicial')
+    cur.execute('UPDATE pedidos SET catalogo_version = catalogo_version_vigente() WHERE catalogo_version IS NULL')
+    
+    cur.execute('SELECT EXISTS (SELECT 1 FROM pedidos_resumen_diario WHERE NOT fecha_archivada(fecha)) AS hay')
+    if not cur.fetchone()['hay']:
+        reconstruir_resumen_diario(cur)
     
     cur.execute("SELECT * FROM usuarios WHERE username = 'admin'")
     if not cur.fetchone():
-        hashed_password = generate_password_hash('eterno2026')
+        hashed_password = generate_password_hash('eterno2026', method=PASSWORD_HASH_METHOD)
         cur.execute('''
             INSERT INTO usuarios (username, password, nombre, rol)
             VALUES (%s, %s, %s, %s)
         ''', ('admin', hashed_password, 'Administrador', 'admin'))
-    
-    conn.commit()
+
+def verificar_esquema():
+    """Chequeo de arranque: una sola consulta; avisa si faltan migraciones."""
+    cur = get_db_connection().cursor()
+    actual = version_esquema(cur)
     cur.close()
-    conn.close()
+    pendientes = [v for v, _, _ in listar_migraciones() if v > actual]
+    if pendientes:
+        app.logger.warning('Esquema en la versión %s; faltan %s migraciones. Ejecute `flask db upgrade`.',
+                           actual, len(pendientes))
+    return actual
 
-try:
-    init_db()
-except Exception as e:
-    print(f"Error inicializando DB: {e}")
-
-def calcular_totales(producto, cantidad, descuento=0, anticipo=0, cuotas_visa_anticipo=0, cuotas_visa_saldo=0):
-    config = PRODUCTOS_CONFIG[producto]
-    precio_unitario = config['precio']
-    costos_detalle = {k: v * cantidad for k, v in config['costos'].items()}
-    costo_produccion = sum(costos_detalle.values())
-    
-    subtotal = precio_unitario * cantidad
-    total_venta = subtotal * (1 - descuento)
+class AnioArchivado(Exception):
+    """El pedido cae en un año cuya partición fue archivada."""
+
+def crear_particion(cur, anio):
+    """Crea la partición anual de pedidos si falta; devuelve 'creada', 'existente' o 'archivada'."""
+    cur.execute('SELECT crear_particion_pedidos(%s) AS estado', (anio,))
+    return cur.fetchone()['estado']
+
+def crear_particiones_adelante(cur, anios=PARTICIONES_ANIOS_ADELANTE):
+    """Particiones del año en curso y de los `anios` siguientes; devuelve las que se crearon."""
+    actual = date.today().year
+    return [f'pedidos_{anio}' for anio in range(actual, actual + anios + 1) if crear_particion(cur, anio) == 'creada']
+
+def asegurar_particiones(cur, fechas):
+    """Crea las particiones que falten para `fechas` antes de escribir pedidos con esas fechas.
+
+    Debe llamarse en la transacción de la escritura. Lanza AnioArchivado si
+    alguna fecha cae en un año archivado.
+    """
+    for anio in sorted({fecha.year for fecha in fechas}):
+        if crear_particion(cur, anio) == 'archivada':
+            raise AnioArchivado(f'El año {anio} está archivado')
+
+def listar_particiones(cur):
+    """Particiones de pedidos, vigentes y archivadas, con sus pedidos (según el resumen diario) y tamaño."""
+    cur.execute('''
+        WITH por_anio AS (
+            SELECT EXTRACT(YEAR FROM fecha)::int AS anio, SUM(pedidos)::int AS pedidos
+            FROM pedidos_resumen_diario
+            GROUP BY 1
+        ),
+        particiones AS (
+            SELECT c.relname::text AS tabla, right(c.relname, 4)::int AS anio, FALSE AS archivada, c.oid
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'pedidos'::regclass
+            UNION ALL
+            SELECT tabla, anio, TRUE, tabla::text::regclass::oid FROM pedidos_archivados
+        )
+        SELECT p.tabla, p.anio, p.archivada, COALESCE(a.pedidos, 0) AS pedidos,
+               pg_total_relation_size(p.oid) AS tamano
+        FROM particiones p
+        LEFT JOIN por_anio a ON a.anio = p.anio
+        ORDER BY p.anio
+    ''')
+    return cur.fetchall()
+
+def marcar_pedidos_modificados(cur):
+    """Incrementa la versión de datos de pedidos (lo que hace el trigger) para invalidar ETags y exportaciones.
+
+    También pide a los dashboards abiertos que recarguen: el cambio no se puede describir pedido por pedido.
+    """
+    cur.execute("UPDATE datos_version SET version = version + 1, actualizado = CURRENT_TIMESTAMP WHERE tabla = 'pedidos'")
+    publicar_evento(cur, 'recargar')
+
+def archivar_anio(cur, anio):
+    """Separa la partición de `anio` de pedidos y la mueve al esquema archivo.
+
+    Los totales del año quedan en pedidos_archivados y sus filas de
+    pedidos_resumen_diario se conservan: el dashboard sigue sumándolos, pero
+    listados, exportaciones y búsquedas ya no recorren esos pedidos.
+    """
+    if anio >= date.today().year:
+        raise ValueError(f'Sólo se archivan años cerrados (anteriores a {date.today().year})')
+    tabla = f'pedidos_{anio}'
+    cur.execute('SELECT to_regclass(%s) IS NOT NULL AS existe', (f'public.{tabla}',))
+    if not cur.fetchone()['existe']:
+        raise ValueError(f'No existe la partición {tabla}')
+    cur.execute('LOCK TABLE pedidos IN SHARE MODE')
+    if any(fila['fecha'].year == anio for fila in diferencias_resumen_diario(cur)):
+        raise ValueError(f'El resumen diario de {anio} no coincide con los pedidos; ejecute `flask reconstruir-resumen`')
+    
+    cur.execute(f'ALTER TABLE pedidos DETACH PARTITION {tabla}')
+    cur.execute(f'ALTER TABLE {tabla} SET SCHEMA archivo')
+    cur.execute(f'''
+        INSERT INTO pedidos_archivados (anio, tabla, {', '.join(COLUMNAS_RESUMEN)})
+        SELECT %s, %s, {', '.join(f'COALESCE(SUM({c}), 0)' for c in COLUMNAS_RESUMEN)}
+        FROM pedidos_resumen_diario
+        WHERE fecha >= %s AND fecha < %s
+    ''', (anio, f'archivo.{tabla}', date(anio, 1, 1), date(anio + 1, 1, 1)))
+    marcar_pedidos_modificados(cur)
+
+def restaurar_anio(cur, anio):
+    """Vuelve a adjuntar a pedidos la partición archivada de `anio`."""
+    cur.execute('DELETE FROM pedidos_archivados WHERE anio = %s RETURNING tabla', (anio,))
+    if cur.fetchone() is None:
+        raise ValueError(f'El año {anio} no está archivado')
+    tabla = f'pedidos_{anio}'
+    cur.execute(f'ALTER TABLE archivo.{tabla} SET SCHEMA public')
+    cur.execute(f'ALTER TABLE pedidos ATTACH PARTITION {tabla} FOR VALUES FROM (%s) TO (%s)',
+                (date(anio, 1, 1), date(anio + 1, 1, 1)))
+    marcar_pedidos_modificados(cur)
+
+def particiones_del_plan(cur, sql, params):
+    """Particiones de pedidos que recorre el plan de `sql` (EXPLAIN, sin ejecutarla)."""
+    cur.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+    nodos = [cur.fetchone()['QUERY PLAN'][0]['Plan']]
+    tablas = set()
+    while nodos:
+        nodo = nodos.pop()
+        if re.fullmatch(r'pedidos_\d{4}', nodo.get('Relation Name', '')):
+            tablas.add(nodo['Relation Name'])
+        nodos.extend(nodo.get('Plans', []))
+    return tablas
+
+# Montos en centavos (enteros de Python o int64 de numpy). Los DECIMAL de la base
+# se convierten sin pasar por float, tasas y descuentos se llevan en diezmilésimos
+# (sus columnas tienen 4 decimales) y cada monto por pedido se redondea a
+# centavos como ROUND(x, 2) de PostgreSQL: la mitad se aleja de cero.
+ESCALA_TASA = 10000
+
+def _escalar_decimal(valor, decimales):
+    if not valor:
+        return 0
+    if not isinstance(valor, Decimal):
+        valor = Decimal(str(valor))
+    return int(valor.scaleb(decimales).quantize(1, ROUND_HALF_UP))
+
+def a_centavos(valor):
+    """Monto (Decimal, int, float o texto) a centavos enteros; None cuenta como 0."""
+    return _escalar_decimal(valor, 2)
+
+def a_diezmilesimos(valor):
+    """Tasa o descuento (0.0575) a diezmilésimos enteros (575); None cuenta como 0."""
+    return _escalar_decimal(valor, 4)
+
+def dividir_redondeando(numerador, divisor):
+    """numerador / divisor al entero más cercano, la mitad alejándose de cero (como ROUND de PostgreSQL)."""
+    cociente = (2 * abs(numerador) + divisor) // (2 * divisor)
+    return cociente if numerador >= 0 else -cociente
+
+def dividir_redondeando_batch(numeradores, divisor):
+    """dividir_redondeando sobre un arreglo int64."""
+    cocientes = (2 * np.abs(numeradores) + divisor) // (2 * divisor)
+    return np.where(numeradores >= 0, cocientes, -cocientes)
+
+_tarifas_centavos = {}
+
+def tarifas_centavos(catalogo):
+    """Precios y costos del catálogo en centavos y tasas Visa en diezmilésimos.
+
+    Se calculan una vez por catálogo (las versiones publicadas no cambian).
+    Devuelve {'productos': {nombre: (precio, {concepto: costo})}, 'costos_visa': {cuotas: tasa}}.
+    """
+    entrada = _tarifas_centavos.get(id(catalogo))
+    if entrada is None or entrada[0] is not catalogo:
+        tarifas = {
+            'productos': {
+                nombre: (a_centavos(config['precio']), {k: a_centavos(v) for k, v in config['costos'].items()})
+                for nombre, config in catalogo['productos'].items()
+            },
+            'costos_visa': {int(c): a_diezmilesimos(t) for c, t in catalogo['costos_visa'].items() if int(c) > 0}
+        }
+        entrada = _tarifas_centavos[id(catalogo)] = (catalogo, tarifas)
+    return entrada[1]
+
+def _quetzales(campo):
+    return property(lambda self: getattr(self, campo) / 100)
+
+class TotalesPedido:
+    """Totales de un pedido, en centavos.
+
+    Guarda sólo los montos base; saldo, costo total, utilidad, etc. se derivan
+    al leerlos. Los nombres sin `_c` devuelven quetzales (float) para las
+    plantillas, el JSON y el Excel: las sumas se hacen sobre los `_c`.
+    """
+    __slots__ = ('cantidad', 'precio_unitario_c', 'total_venta_c', 'anticipo_c', 'costo_produccion_c',
+                 'costo_visa_anticipo_c', 'costo_visa_saldo_c', 'costos_unitarios_c')
+
+    def __init__(self, cantidad, precio_unitario_c, total_venta_c, anticipo_c, costo_produccion_c,
+                 costo_visa_anticipo_c, costo_visa_saldo_c, costos_unitarios_c=None):
+        self.cantidad = cantidad
+        self.precio_unitario_c = precio_unitario_c
+        self.total_venta_c = total_venta_c
+        self.anticipo_c = anticipo_c
+        self.costo_produccion_c = costo_produccion_c
+        self.costo_visa_anticipo_c = costo_visa_anticipo_c
+        self.costo_visa_saldo_c = costo_visa_saldo_c
+        self.costos_unitarios_c = costos_unitarios_c
+    
+    @property
+    def subtotal_c(self):
+        return self.precio_unitario_c * self.cantidad
+    
+    @property
+    def saldo_restante_c(self):
+        return self.total_venta_c - self.anticipo_c
+    
+    @property
+    def costo_visa_total_c(self):
+        return self.costo_visa_anticipo_c + self.costo_visa_saldo_c
+    
+    @property
+    def costo_total_c(self):
+        return self.costo_produccion_c + self.costo_visa_anticipo_c + self.costo_visa_saldo_c
+    
+    @property
+    def utilidad_c(self):
+        return self.total_venta_c - self.costo_total_c
+    
+    @property
+    def disponible_anticipo_c(self):
+        return self.anticipo_c - self.costo_produccion_c - self.costo_visa_anticipo_c
+    
+    @property
+    def costos_detalle_c(self):
+        """Costo de producción por concepto; {} si el registro viene de un cálculo sin el detalle."""
+        return {k: v * self.cantidad for k, v in (self.costos_unitarios_c or {}).items()}
+    
+    @property
+    def porcentaje_utilidad(self):
+        return self.utilidad_c / self.total_venta_c * 100 if self.total_venta_c > 0 else 0
+    
+    precio_unitario = _quetzales('precio_unitario_c')
+    subtotal = _quetzales('subtotal_c')
+    total_venta = _quetzales('total_venta_c')
+    anticipo = _quetzales('anticipo_c')
+    saldo_restante = _quetzales('saldo_restante_c')
+    costo_produccion = _quetzales('costo_produccion_c')
+    costo_visa_anticipo = _quetzales('costo_visa_anticipo_c')
+    costo_visa_saldo = _quetzales('costo_visa_saldo_c')
+    costo_visa_total = _quetzales('costo_visa_total_c')
+    costo_total = _quetzales('costo_total_c')
+    utilidad = _quetzales('utilidad_c')
+    disponible_anticipo = _quetzales('disponible_anticipo_c')
+
+# Columnas de calcular_totales_batch que forman un TotalesPedido, en el orden del constructor
+CAMPOS_TOTALES = TotalesPedido.__slots__[:-1]
+
+class PedidoCalculado(TotalesPedido):
+    """Fila del listado/API: los campos del pedido que se muestran más sus totales, sin copiar dicts."""
+    __slots__ = ('id', 'fecha', 'cliente', 'producto', 'fecha_sesion', 'metodo_pago_anticipo',
+                 'metodo_pago_saldo', 'cuotas_visa_anticipo', 'cuotas_visa_saldo')
+
+    def __init__(self, pedido, *totales):
+        super().__init__(*totales)
+        self.id = pedido['id']
+        self.fecha = pedido['fecha']
+        self.cliente = pedido['cliente']
+        self.producto = pedido['producto']
+        self.fecha_sesion = pedido.get('fecha_sesion')
+        self.metodo_pago_anticipo = pedido.get('metodo_pago_anticipo', '')
+        self.metodo_pago_saldo = pedido.get('metodo_pago_saldo', '')
+        self.cuotas_visa_anticipo = pedido.get('cuotas_visa_anticipo') or 0
+        self.cuotas_visa_saldo = pedido.get('cuotas_visa_saldo') or 0
+
+def calcular_totales(producto, cantidad, descuento=0, anticipo=0, cuotas_visa_anticipo=0, cuotas_visa_saldo=0, catalogo=None):
+    """Totales de un pedido como TotalesPedido; descuento y anticipo de preferencia como Decimal (como vienen de la base)."""
+    tarifas = tarifas_centavos(catalogo or catalogo_vigente())
+    precio_unitario_c, costos_unitarios_c = tarifas['productos'][producto]
+    costos_visa = tarifas['costos_visa']
+    costo_produccion_c = sum(costos_unitarios_c.values()) * cantidad
+    
+    anticipo_c = a_centavos(anticipo)
+    total_venta_c = dividir_redondeando(precio_unitario_c * cantidad * (ESCALA_TASA - a_diezmilesimos(descuento)), ESCALA_TASA)
+    costo_visa_anticipo_c = dividir_redondeando(anticipo_c * costos_visa.get(cuotas_visa_anticipo, 0), ESCALA_TASA)
+    costo_visa_saldo_c = dividir_redondeando((total_venta_c - anticipo_c) * costos_visa.get(cuotas_visa_saldo, 0), ESCALA_TASA)
+    
+    return TotalesPedido(cantidad, precio_unitario_c, total_venta_c, anticipo_c, costo_produccion_c,
+                         costo_visa_anticipo_c, costo_visa_saldo_c, costos_unitarios_c)
+
+def calcular_totales_batch(productos, cantidades, descuentos, anticipos, cuotas_visa_anticipo, cuotas_visa_saldo, versiones=None, catalogo=None):
+    """Versión columnar de calcular_totales para muchos pedidos a la vez.
+
+    Recibe una secuencia por campo (descuentos en diezmilésimos y anticipos en
+    centavos, enteros) y devuelve un dict de arreglos int64 en centavos: uno por
+    cada campo de CAMPOS_TOTALES, más saldo_restante_c, costo_total_c,
+    utilidad_c, costos_detalle_c (dict de arreglos) y `valido`: False donde
+    calcular_totales fallaría (producto desconocido o sin cantidad).
+    `versiones` indica el catálogo de cada pedido; si no se da, se usa
+    `catalogo` (o el vigente) para todos. Con aritmética entera y el mismo
+    redondeo, los resultados coinciden exactamente con la versión escalar.
+    """
+    productos = np.asarray(productos, dtype=object)
+    n = len(productos)
+    valido = np.array([c is not None for c in cantidades], dtype=bool)
+    cantidad = np.array([c or 0 for c in cantidades], dtype=np.int64)
+    descuento = np.asarray(descuentos, dtype=np.int64)
+    anticipo = np.asarray(anticipos, dtype=np.int64)
+    cuotas_anticipo = np.asarray(cuotas_visa_anticipo, dtype=np.int64)
+    cuotas_saldo = np.asarray(cuotas_visa_saldo, dtype=np.int64)
+    
+    if versiones is None:
+        grupos = [(catalogo or catalogo_vigente(), np.ones(n, dtype=bool))]
+    else:
+        versiones = np.array([v or 0 for v in versiones], dtype=np.int64)
+        grupos = [(catalogo_cache.version(int(v)) if v else catalogo_vigente(), versiones == v) for v in np.unique(versiones)]
+    
+    existe = np.zeros(n, dtype=bool)
+    precio_unitario = np.zeros(n, dtype=np.int64)
+    costos_detalle = {}
+    tasa_anticipo = np.zeros(n, dtype=np.int64)
+    tasa_saldo = np.zeros(n, dtype=np.int64)
+    for catalogo, en_version in grupos:
+        tarifas = tarifas_centavos(catalogo)
+        for nombre, (precio, costos) in tarifas['productos'].items():
+            mascara = en_version & (productos == nombre)
+            existe |= mascara
+            precio_unitario[mascara] = precio
+            for concepto, costo in costos.items():
+                costos_detalle.setdefault(concepto, np.zeros(n, dtype=np.int64))[mascara] = costo
+        for cuotas, tasa in tarifas['costos_visa'].items():
+            tasa_anticipo[en_version & (cuotas_anticipo == cuotas)] = tasa
+            tasa_saldo[en_version & (cuotas_saldo == cuotas)] = tasa
+    valido &= existe
+    cantidad = np.where(valido, cantidad, 0)
+    for concepto in costos_detalle:
+        costos_detalle[concepto] *= cantidad
+    costo_produccion = sum(costos_detalle.values()) if costos_detalle else np.zeros(n, dtype=np.int64)
+    
+    total_venta = dividir_redondeando_batch(precio_unitario * cantidad * (ESCALA_TASA - descuento), ESCALA_TASA)
     saldo_restante = total_venta - anticipo
+    costo_visa_anticipo = dividir_redondeando_batch(anticipo * tasa_anticipo, ESCALA_TASA)
+    costo_visa_saldo = dividir_redondeando_batch(saldo_restante * tasa_saldo, ESCALA_TASA)
+    costo_total = costo_produccion + costo_visa_anticipo + costo_visa_saldo
+    
+    return {
+        'cantidad': cantidad,
+        'precio_unitario_c': precio_unitario,
+        'total_venta_c': total_venta,
+        'anticipo_c': anticipo,
+        'costo_produccion_c': costo_produccion,
+        'costo_visa_anticipo_c': costo_visa_anticipo,
+        'costo_visa_saldo_c': costo_visa_saldo,
+        'saldo_restante_c': saldo_restante,
+        'costo_total_c': costo_total,
+        'utilidad_c': total_venta - costo_total,
+        'costos_detalle_c': costos_detalle,
+        'valido': valido
+    }
+
+def totales_de_pedidos(pedidos):
+    """calcular_totales_batch sobre filas de la tabla pedidos, con el mismo manejo de nulos que las rutas."""
+    with fase('totales'):
+        return calcular_totales_batch(
+            [p['producto'] for p in pedidos],
+            [p['cantidad'] for p in pedidos],
+            [a_diezmilesimos(p['descuento']) for p in pedidos],
+            [a_centavos(p.get('anticipo')) for p in pedidos],
+            [p.get('cuotas_visa_anticipo') or 0 for p in pedidos],
+            [p.get('cuotas_visa_saldo') or 0 for p in pedidos],
+            [p.get('catalogo_version') for p in pedidos]
+        )
+
+def filas_totales(totales):
+    """Recorre el resultado columnar como tuplas de enteros de Python con los argumentos de TotalesPedido."""
+    return zip(*(totales[k].tolist() for k in CAMPOS_TOTALES))
+
+def filtro_fechas(fecha_inicio, fecha_fin, columna='fecha'):
+    """Condición SQL (sin WHERE) y parámetros para el filtro de fechas del dashboard/exportación."""
+    if fecha_inicio and fecha_fin:
+        return f'{columna} BETWEEN %s AND %s', [fecha_inicio, fecha_fin]
+    elif fecha_inicio:
+        return f'{columna} >= %s', [fecha_inicio]
+    elif fecha_fin:
+        return f'{columna} <= %s', [fecha_fin]
+    return 'TRUE', []
+
+def sql_pedidos_calculados(condicion='TRUE', params_condicion=()):
+    """CTEs que calculan en SQL los totales de cada pedido con el catálogo con el que se cotizó.
+
+    Replica la lógica de calcular_totales: cada monto se redondea a centavos con
+    ROUND(x, 2) y los pedidos con producto desconocido o sin cantidad quedan
+    fuera, igual que en el ciclo de Python. Devuelve (sql, params);
+    el llamador agrega su SELECT sobre `pedidos_calculados`.
+    """
+    sql = f'''
+        WITH pedidos_base AS (
+            SELECT p.*,
+                   COALESCE(p.anticipo, 0) AS anticipo_neto,
+                   ROUND(pr.precio * p.cantidad * (1 - COALESCE(p.descuento, 0)), 2) AS total_venta,
+                   pr.costo_unitario * p.cantidad AS costo_produccion,
+                   pr.costos AS costos_unitarios,
+                   COALESCE(va.tasa, 0) AS tasa_visa_anticipo,
+                   COALESCE(vs.tasa, 0) AS tasa_visa_saldo
+            FROM pedidos p
+            JOIN catalogo_productos pr ON pr.version = p.catalogo_version AND pr.producto = p.producto
+            LEFT JOIN catalogo_visa va ON va.version = p.catalogo_version AND va.cuotas = p.cuotas_visa_anticipo AND va.cuotas > 0
+            LEFT JOIN catalogo_visa vs ON vs.version = p.catalogo_version AND vs.cuotas = p.cuotas_visa_saldo AND vs.cuotas > 0
+            WHERE p.cantidad IS NOT NULL AND ({condicion})
+        ),
+        pedidos_calculados AS (
+            SELECT b.*,
+                   b.total_venta - b.anticipo_neto AS saldo_restante,
+                   ROUND(b.anticipo_neto * b.tasa_visa_anticipo, 2) AS costo_visa_anticipo,
+                   ROUND((b.total_venta - b.anticipo_neto) * b.tasa_visa_saldo, 2) AS costo_visa_saldo
+            FROM pedidos_base b
+        )
+    '''
+    return sql, list(params_condicion)
+
+def leer_por_pagina(valor):
+    try:
+        return max(1, min(int(valor), POR_PAGINA_MAX))
+    except (TypeError, ValueError):
+        return POR_PAGINA_DEFECTO
+
+def leer_cursor(valor):
+    """Convierte un cursor 'AAAA-MM-DD_id' en (fecha, id); None si no es válido."""
+    try:
+        fecha, pedido_id = valor.split('_')
+        return datetime.strptime(fecha, '%Y-%m-%d').date(), int(pedido_id)
+    except (AttributeError, ValueError):
+        return None
+
+def crear_cursor(pedido):
+    return f"{pedido['fecha'].isoformat()}_{pedido['id']}"
+
+def sql_pagina_pedidos(fecha_inicio='', fecha_fin='', cursor_despues=None, cursor_antes=None, por_pagina=POR_PAGINA_DEFECTO):
+    """SELECT de una página de obtener_pagina_pedidos; devuelve (sql, params)."""
+    condicion, params = filtro_fechas(fecha_inicio, fecha_fin)
+    # La condición sobre `fecha` sola repite la de la fila (fecha, id), pero
+    # sólo con ella el planificador descarta las particiones fuera del cursor
+    if cursor_antes:
+        condicion += ' AND fecha >= %s AND (fecha, id) > (%s, %s)'
+        params += [cursor_antes[0], *cursor_antes]
+        orden = 'fecha ASC, id ASC'
+    else:
+        if cursor_despues:
+            condicion += ' AND fecha <= %s AND (fecha, id) < (%s, %s)'
+            params += [cursor_despues[0], *cursor_despues]
+        orden = 'fecha DESC, id DESC'
+    return f'SELECT * FROM pedidos WHERE {condicion} ORDER BY {orden} LIMIT %s', params + [por_pagina + 1]
+
+def obtener_pagina_pedidos(cur, fecha_inicio='', fecha_fin='', despues=None, antes=None, por_pagina=POR_PAGINA_DEFECTO):
+    """Página de pedidos ordenada por (fecha, id) descendente usando paginación por cursor.
+
+    `despues` avanza a pedidos más antiguos y `antes` regresa a los más recientes;
+    cada página es un recorrido por rango de idx_pedidos_fecha_id. Devuelve
+    (pedidos, cursor_siguiente, cursor_anterior).
+    """
+    cursor_antes = leer_cursor(antes)
+    cursor_despues = leer_cursor(despues)
     
-    costo_visa_anticipo = 0
-    if cuotas_visa_anticipo > 0 and cuotas_visa_anticipo in COSTOS_VISA:
-        costo_visa_anticipo = anticipo * COSTOS_VISA[cuotas_visa_anticipo]
+    cur.execute(*sql_pagina_pedidos(fecha_inicio, fecha_fin, cursor_despues, cursor_antes, por_pagina))
+    pedidos = cur.fetchall()
+    hay_mas = len(pedidos) > por_pagina
+    pedidos = pedidos[:por_pagina]
     
-    costo_visa_saldo = 0
-    if cuotas_visa_saldo > 0 and cuotas_visa_saldo in COSTOS_VISA:
-        costo_visa_saldo = saldo_restante * COSTOS_VISA[cuotas_visa_saldo]
+    if cursor_antes:
+        pedidos.reverse()
+        tiene_siguiente, tiene_anterior = True, hay_mas
+    else:
+        tiene_siguiente, tiene_anterior = hay_mas, cursor_despues is not None
     
-    costo_visa_total = costo_visa_anticipo + costo_visa_saldo
-    costo_total = costo_produccion + costo_visa_total
-    utilidad = total_venta - costo_total
-    porcentaje_utilidad = (utilidad / total_venta * 100) if total_venta > 0 else 0
-    disponible_anticipo = anticipo - costo_produccion - costo_visa_anticipo
+    siguiente = crear_cursor(pedidos[-1]) if pedidos and tiene_siguiente else None
+    anterior = crear_cursor(pedidos[0]) if pedidos and tiene_anterior else None
+    return pedidos, siguiente, anterior
+
+def estadisticas_vacias():
+    return {
+        'total_anticipos': 0,
+        'total_saldos_pendientes': 0,
+        'total_ventas_proyectadas': 0,
+        'total_costos': 0,
+        'total_utilidad': 0,
+        'margen_promedio': 0,
+        'total_pedidos': 0,
+        'pedidos_grande': 0,
+        'pedidos_mediano': 0,
+        'anticipos_grande': 0,
+        'anticipos_mediano': 0,
+        'saldos_grande': 0,
+        'saldos_mediano': 0,
+        'costos_grande': 0,
+        'costos_mediano': 0
+    }
+
+def completar_estadisticas(estadisticas):
+    total_ventas_proyectadas = estadisticas['total_anticipos'] + estadisticas['total_saldos_pendientes']
+    estadisticas['total_ventas_proyectadas'] = total_ventas_proyectadas
+    estadisticas['margen_promedio'] = (estadisticas['total_utilidad'] / total_ventas_proyectadas * 100) if total_ventas_proyectadas > 0 else 0
+    return estadisticas
+
+COLUMNAS_RESUMEN = ['pedidos', 'unidades', 'anticipo', 'saldo', 'total_venta', 'costo_produccion', 'costo_visa', 'utilidad']
+
+def sql_resumen_diario(condicion='TRUE', params_condicion=(), signo=1):
+    """Agregado por (fecha, producto) de los pedidos que cumplen `condicion`, multiplicado por `signo`."""
+    ctes, params = sql_pedidos_calculados(condicion, params_condicion)
+    signo = int(signo)
+    return ctes + f'''
+        SELECT fecha, producto,
+               {signo} * COUNT(*) AS pedidos,
+               {signo} * SUM(cantidad) AS unidades,
+               {signo} * SUM(anticipo_neto) AS anticipo,
+               {signo} * SUM(saldo_restante) AS saldo,
+               {signo} * SUM(total_venta) AS total_venta,
+               {signo} * SUM(costo_produccion) AS costo_produccion,
+               {signo} * SUM(costo_visa_anticipo + costo_visa_saldo) AS costo_visa,
+               {signo} * SUM(total_venta - costo_produccion - costo_visa_anticipo - costo_visa_saldo) AS utilidad
+        FROM pedidos_calculados
+        GROUP BY fecha, producto
+    ''', params
+
+def actualizar_resumen_diario(cur, condicion, params_condicion, signo):
+    """Suma (signo=1) o resta (signo=-1) los pedidos indicados en pedidos_resumen_diario.
+
+    Debe llamarse dentro de la misma transacción que la escritura: se resta el
+    estado anterior del pedido antes de modificarlo y se suma el nuevo después.
+    """
+    sql, params = sql_resumen_diario(condicion, params_condicion, signo)
+    columnas = ', '.join(COLUMNAS_RESUMEN)
+    actualizaciones = ', '.join(f'{c} = r.{c} + EXCLUDED.{c}' for c in COLUMNAS_RESUMEN)
+    cur.execute(f'''
+        INSERT INTO pedidos_resumen_diario AS r (fecha, producto, {columnas})
+        {sql}
+        ON CONFLICT (fecha, producto) DO UPDATE SET {actualizaciones}
+    ''', params)
+
+def reconstruir_resumen_diario(cur):
+    """Recalcula pedidos_resumen_diario desde cero; bloquea escrituras en pedidos mientras tanto.
+
+    Las filas de años archivados se conservan: sus pedidos ya no están en la tabla.
+    """
+    cur.execute('LOCK TABLE pedidos IN SHARE MODE')
+    cur.execute('DELETE FROM pedidos_resumen_diario WHERE NOT fecha_archivada(fecha)')
+    sql, params = sql_resumen_diario()
+    cur.execute(f'''
+        INSERT INTO pedidos_resumen_diario (fecha, producto, {', '.join(COLUMNAS_RESUMEN)})
+        {sql}
+    ''', params)
+
+def diferencias_resumen_diario(cur):
+    """Filas (fecha, producto) donde el resumen no coincide con lo calculado desde pedidos (sin años archivados)."""
+    sql, params = sql_resumen_diario()
+    diferente = ' OR '.join(f'COALESCE(r.{c}, 0) <> COALESCE(c.{c}, 0)' for c in COLUMNAS_RESUMEN)
+    cur.execute(f'''
+        WITH calculado AS ({sql})
+        SELECT COALESCE(r.fecha, c.fecha) AS fecha, COALESCE(r.producto, c.producto) AS producto,
+               {', '.join(f'r.{c} AS resumen_{c}, c.{c} AS calculado_{c}' for c in COLUMNAS_RESUMEN)}
+        FROM pedidos_resumen_diario r
+        FULL OUTER JOIN calculado c ON c.fecha = r.fecha AND c.producto = r.producto
+        WHERE ({diferente}) AND NOT fecha_archivada(COALESCE(r.fecha, c.fecha))
+        ORDER BY 1, 2
+    ''', params)
+    return cur.fetchall()
+
+def calcular_estadisticas(cur, fecha_inicio='', fecha_fin='', archivados=True):
+    """Estadísticas del dashboard a partir de pedidos_resumen_diario: el costo depende de los días, no de los pedidos.
+
+    Incluye los años archivados salvo con `archivados=False`. `ultimo_evento` es
+    el último evento de pedidos incluido: se lee en la misma consulta (la misma
+    foto de la base), así el dashboard sabe desde qué evento sumar cambios.
+    """
+    condicion, params = filtro_fechas(fecha_inicio, fecha_fin)
+    if not archivados:
+        condicion += ' AND NOT fecha_archivada(fecha)'
+    cur.execute(f'''
+        SELECT e.ultimo_evento, r.*
+        FROM (SELECT COALESCE(MAX(id), 0) AS ultimo_evento FROM eventos_pedidos) e
+        LEFT JOIN (
+            SELECT producto,
+                   SUM(pedidos) AS pedidos,
+                   SUM(unidades) AS unidades,
+                   SUM(anticipo) AS anticipos,
+                   SUM(saldo) AS saldos,
+                   SUM(costo_produccion + costo_visa) AS costos,
+                   SUM(utilidad) AS utilidad
+            FROM pedidos_resumen_diario
+            WHERE {condicion}
+            GROUP BY producto
+        ) r ON TRUE
+    ''', params)
     
+    estadisticas = estadisticas_vacias()
+    for fila in cur.fetchall():
+        estadisticas['ultimo_evento'] = fila['ultimo_evento']
+        if fila['producto'] is None:
+            continue
+        sufijo = 'grande' if fila['producto'] == 'Grande' else 'mediano'
+        estadisticas['total_pedidos'] += int(fila['pedidos'])
+        estadisticas['total_anticipos'] += float(fila['anticipos'])
+        estadisticas['total_saldos_pendientes'] += float(fila['saldos'])
+        estadisticas['total_costos'] += float(fila['costos'])
+        estadisticas['total_utilidad'] += float(fila['utilidad'])
+        estadisticas[f'pedidos_{sufijo}'] += int(fila['unidades'])
+        estadisticas[f'anticipos_{sufijo}'] += float(fila['anticipos'])
+        estadisticas[f'saldos_{sufijo}'] += float(fila['saldos'])
+        estadisticas[f'costos_{sufijo}'] += float(fila['costos'])
+    return completar_estadisticas(estadisticas)
+
+# Estadísticas que cuentan pedidos o unidades; el resto son montos
+ESTADISTICAS_CONTEOS = ['total_pedidos', 'pedidos_grande', 'pedidos_mediano']
+
+def aporte_estadisticas(totales, producto):
+    """Lo que suma un pedido a cada estadística del dashboard (montos en centavos)."""
+    sufijo = 'grande' if producto == 'Grande' else 'mediano'
     return {
-        'precio_unitario': precio_unitario,
-        'subtotal': subtotal,
-        'total_venta': total_venta,
-        'anticipo': anticipo,
-        'saldo_restante': saldo_restante,
-        'costos_detalle': costos_detalle,
-        'costo_produccion': costo_produccion,
-        'costo_visa_anticipo': costo_visa_anticipo,
-        'costo_visa_saldo': costo_visa_saldo,
-        'costo_visa_total': costo_visa_total,
-        'costo_total': costo_total,
-        'utilidad': utilidad,
-        'porcentaje_utilidad': porcentaje_utilidad,
-        'disponible_anticipo': disponible_anticipo
+        'total_pedidos': 1,
+        'total_anticipos': totales.anticipo_c,
+        'total_saldos_pendientes': totales.saldo_restante_c,
+        'total_costos': totales.costo_total_c,
+        'total_utilidad': totales.utilidad_c,
+        f'pedidos_{sufijo}': totales.cantidad,
+        f'anticipos_{sufijo}': totales.anticipo_c,
+        f'saldos_{sufijo}': totales.saldo_restante_c,
+        f'costos_{sufijo}': totales.costo_total_c
     }
 
+def calcular_estadisticas_python(pedidos):
+    """Versión de referencia: recorre los pedidos con calcular_totales (usada para verificar la de SQL).
+
+    Suma en centavos y convierte a quetzales al final.
+    """
+    estadisticas = estadisticas_vacias()
+    for pedido in pedidos:
+        try:
+            totales = calcular_totales(
+                pedido['producto'],
+                pedido['cantidad'],
+                pedido['descuento'],
+                pedido.get('anticipo'),
+                pedido.get('cuotas_visa_anticipo') or 0,
+                pedido.get('cuotas_visa_saldo') or 0,
+                catalogo_de(pedido)
+            )
+        except (KeyError, TypeError):
+            # Producto fuera del catálogo o sin cantidad: sql_pedidos_calculados tampoco lo cuenta
+            continue
+        for k, valor in aporte_estadisticas(totales, pedido['producto']).items():
+            estadisticas[k] += valor
+    for k in estadisticas:
+        if k not in ESTADISTICAS_CONTEOS:
+            estadisticas[k] /= 100
+    return completar_estadisticas(estadisticas)
+
+try:
+    with app.app_context():
+        verificar_esquema()
+except (psycopg2.Error, PoolAgotado) as e:
+    app.logger.warning('No se pudo verificar el esquema: %s', e)
+finally:
+    # Con `gunicorn --preload` esto corre en el master: no heredar conexiones abiertas.
+    db_pool.cerrar_todo()
+
+# Plantillas compiladas en disco: los workers nuevos no recompilan Jinja
+os.makedirs(JINJA_CACHE_DIR, exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(JINJA_CACHE_DIR)
+
+if PROXY_SALTOS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_SALTOS, x_proto=PROXY_SALTOS)
+
+limiter = Limiter(get_remote_address, app=app, storage_uri=RATELIMIT_STORAGE_URI, headers_enabled=True)
+if RATELIMIT_STORAGE_URI.startswith('memory://'):
+    app.logger.warning('Rate limit en memoria: cada worker cuenta por separado (configure RATELIMIT_STORAGE_URI)')
+
+def ruta_manifiesto():
+    return os.path.join(app.static_folder, ASSETS_DIST, 'manifest.json')
+
+_manifiesto = {'mtime': None, 'datos': {'archivos': {}, 'variantes': {}}, 'csp': None}
+
+def manifiesto_assets():
+    """Manifiesto de static/dist ({'archivos': ruta -> ruta con hash, 'variantes': imagen -> [(ruta, tipo)]}).
+
+    Se lee una vez por worker; en modo debug se vuelve a leer si `flask assets construir` lo cambió.
+    """
+    if _manifiesto['mtime'] is None or app.debug:
+        try:
+            mtime = os.path.getmtime(ruta_manifiesto())
+        except OSError:
+            mtime = 0
+        if mtime != _manifiesto['mtime']:
+            datos = {'archivos': {}, 'variantes': {}}
+            if mtime:
+                with open(ruta_manifiesto(), encoding='utf-8') as archivo:
+                    datos = json.load(archivo)
+            _manifiesto.update(mtime=mtime, datos=datos, csp=None)
+    return _manifiesto['datos']
+
+def asset_vendorizado(ruta):
+    return ruta in manifiesto_assets()['archivos'] or os.path.isfile(os.path.join(app.static_folder, ruta))
+
+def asset_desde_origen(ruta):
+    """Librería que falta en static/ y se sirve desde su CDN (sólo si tiene origen)."""
+    return ruta in ASSETS_VENDOR and ASSETS_VENDOR[ruta][0] is not None and not asset_vendorizado(ruta)
+
+def integridad(contenido):
+    return 'sha384-' + base64.b64encode(hashlib.sha384(contenido).digest()).decode('ascii')
+
+def assets_alterados():
+    """Rutas de ASSETS_VENDOR que faltan en static/ o no coinciden con su hash fijado."""
+    alterados = []
+    for ruta, (_, esperado) in ASSETS_VENDOR.items():
+        try:
+            with open(os.path.join(app.static_folder, ruta), 'rb') as archivo:
+                contenido = archivo.read()
+        except OSError:
+            alterados.append(f'{ruta} (falta)')
+            continue
+        if integridad(contenido) != esperado:
+            alterados.append(ruta)
+    return alterados
+
+@app.template_global()
+def asset_url(ruta):
+    """URL de un archivo de static/: la copia con hash si existe, si no el archivo tal cual o su CDN de origen."""
+    archivos = manifiesto_assets()['archivos']
+    if ruta in archivos:
+        return url_for('asset_dist', ruta=archivos[ruta])
+    if asset_desde_origen(ruta):
+        return ASSETS_VENDOR[ruta][0]
+    return url_for('static', filename=ruta)
+
+@app.template_global()
+def asset_integridad(ruta):
+    """Atributos integrity/crossorigin para el <script>/<link> de una librería servida desde su CDN."""
+    if not asset_desde_origen(ruta):
+        return ''
+    return Markup(f' integrity="{ASSETS_VENDOR[ruta][1]}" crossorigin="anonymous"')
+
+@app.template_global()
+def variantes_imagen(ruta):
+    """(url, tipo) de las versiones AVIF/WebP de una imagen, para los <source> de un <picture>."""
+    return [(url_for('asset_dist', ruta=variante), tipo) for variante, tipo in manifiesto_assets()['variantes'].get(ruta, [])]
+
+@app.route(f'/static/{ASSETS_DIST}/<path:ruta>')
+def asset_dist(ruta):
+    """Archivos con hash en el nombre: caché de un año sin revalidar, .br/.gz según Accept-Encoding."""
+    carpeta = os.path.join(app.static_folder, ASSETS_DIST)
+    for codificacion, extension in (('br', '.br'), ('gzip', '.gz')):
+        comprimido = safe_join(carpeta, ruta + extension)
+        if codificacion in request.accept_encodings and comprimido and os.path.isfile(comprimido):
+            respuesta = send_from_directory(carpeta, ruta + extension, max_age=ASSETS_MAX_AGE,
+                                            mimetype=mimetypes.guess_type(ruta)[0] or 'application/octet-stream')
+            respuesta.content_encoding = codificacion
+            break
+    else:
+        respuesta = send_from_directory(carpeta, ruta, max_age=ASSETS_MAX_AGE)
+    respuesta.cache_control.public = True
+    respuesta.cache_control.immutable = True
+    respuesta.vary.add('Accept-Encoding')
+    return respuesta
+
+def politica_csp():
+    """CSP de la app: sólo recursos propios, más el CDN de cada librería que falte en static/."""
+    externos = sorted({'https://' + ASSETS_VENDOR[ruta][0].split('/')[2] for ruta in ASSETS_VENDOR if asset_desde_origen(ruta)})
+    return {
+        'default-src': "'self'",
+        'script-src': ["'self'"] + externos,
+        # Estilos en línea de las plantillas (bloques <style> y atributos style)
+        'style-src': ["'self'", "'unsafe-inline'"] + externos,
+        'font-src': ["'self'"] + externos,
+        'img-src': ["'self'", 'data:'],
+        'connect-src': "'self'",
+        'object-src': "'none'",
+        'base-uri': "'self'",
+        'form-action': "'self'",
+        'frame-ancestors': "'none'"
+    }
+
+@app.after_request
+def csp_de_respuesta_guardada(response):
+    # Un 304 reutiliza el HTML guardado, cuyos <script> llevan el nonce anterior. Sin CSP en el 304
+    # el navegador conserva la que guardó con ese HTML. Se registra antes de Talisman para correr después.
+    if response.status_code == 304:
+        response.headers.pop('Content-Security-Policy', None)
+    return response
+
+# La política completa la arma csp_del_manifiesto; ésta sólo rige hasta la primera respuesta
+talisman = Talisman(app, force_https=FORZAR_HTTPS, strict_transport_security=FORZAR_HTTPS,
+                    session_cookie_secure=FORZAR_HTTPS, content_security_policy={'default-src': "'self'"},
+                    content_security_policy_nonce_in=['script-src'])
+
+@app.after_request
+def csp_del_manifiesto(response):
+    # La CSP depende de qué librerías hay en static/: se arma con el manifiesto ya cargado y se
+    # rehace cuando éste cambia, no al importar. Registrado después de Talisman para correr antes
+    # que él, que lee talisman.content_security_policy en cada respuesta.
+    manifiesto_assets()
+    if _manifiesto['csp'] is None:
+        _manifiesto['csp'] = politica_csp()
+        talisman.content_security_policy = _manifiesto['csp']
+    return response
+
+def usuario_del_formulario():
+    return 'usuario:' + request.form.get('username', '').strip().lower()
+
+def usuario_de_la_sesion():
+    return f"usuario:{session.get('user_id')}"
+
+# Formularios que calculan un hash de contraseña (ver hash_saturado); el resto es el login
+PLANTILLAS_FORMULARIO = {
+    'cambiar_contrasena': 'cambiar_contrasena.html',
+    'nuevo_usuario': 'nuevo_usuario.html'
+}
+
+def plantilla_del_formulario():
+    return PLANTILLAS_FORMULARIO.get(request.endpoint, 'login.html')
+
+@app.errorhandler(429)
+def demasiados_intentos(e):
+    flash('Demasiados intentos. Espera un momento antes de volver a intentarlo.', 'error')
+    return render_template(plantilla_del_formulario()), 429
+
+@app.errorhandler(HashSaturado)
+def hash_saturado(e):
+    flash('El servidor está ocupado verificando contraseñas. Intenta de nuevo en unos segundos.', 'error')
+    return render_template(plantilla_del_formulario()), 503
+
+@app.errorhandler(AnioArchivado)
+def anio_archivado(e):
+    flash(f'{e}: sus pedidos no se pueden crear ni modificar.', 'error')
+    return redirect(request.path)
+
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -176,6 +1874,56 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def version_app():
+    """Identifica el código desplegado (app.py y plantillas) para invalidar ETags entre deploys."""
+    rutas = [os.path.abspath(__file__)]
+    for carpeta, _, archivos in os.walk(os.path.join(app.root_path, app.template_folder)):
+        rutas.extend(os.path.join(carpeta, archivo) for archivo in archivos)
+    return os.environ.get('VERSION_APP') or str(int(max(os.path.getmtime(r) for r in rutas)))
+
+VERSION_APP = version_app()
+
+def respuesta_condicional(f):
+    """ETag y Last-Modified según la versión de los pedidos, los filtros y el usuario.
+
+    Si el navegador ya tiene esa versión se responde 304 con una sola consulta,
+    sin calcular estadísticas ni renderizar. Con mensajes flash pendientes se
+    responde completo para no perderlos.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if session.get('_flashes'):
+            return f(*args, **kwargs)
+        # La versión se lee de la misma base (réplica o primario) que arma la respuesta
+        cur = get_db_lectura().cursor()
+        cur.execute('''
+            SELECT version, actualizado AT TIME ZONE current_setting('TimeZone') AS actualizado
+            FROM datos_version WHERE tabla = 'pedidos'
+        ''')
+        fila = cur.fetchone()
+        cur.close()
+        if not fila:
+            return f(*args, **kwargs)
+        
+        clave = json.dumps([VERSION_APP, fila['version'], request.endpoint, sorted(request.args.items(multi=True)),
+                            session.get('user_id'), session.get('rol')])
+        etag = hashlib.sha1(clave.encode()).hexdigest()
+        ultima_modificacion = fila['actualizado'].replace(microsecond=0)
+        if is_resource_modified(request.environ, etag=etag, last_modified=ultima_modificacion):
+            respuesta = make_response(f(*args, **kwargs))
+            if respuesta.status_code != 200:
+                return respuesta
+        else:
+            respuesta = Response(status=304)
+        respuesta.set_etag(etag)
+        respuesta.last_modified = ultima_modificacion
+        # El navegador guarda la copia pero revalida siempre
+        respuesta.cache_control.private = True
+        respuesta.cache_control.no_cache = True
+        respuesta.vary.add('Cookie')
+        return respuesta
+    return decorated_function
+
 @app.route('/')
 def index():
     if 'user_id' in session:
@@ -183,6 +1931,10 @@ def index():
     return redirect(url_for('login'))
 
 @app.route('/login', methods=['GET', 'POST'])
+@limiter.limit(LOGIN_LIMITE_IP, methods=['POST'])
+# Por usuario solo cuentan los intentos fallidos (el login correcto redirige)
+@limiter.limit(LOGIN_LIMITE_USUARIO, key_func=usuario_del_formulario, methods=['POST'],
+               deduct_when=lambda response: response.status_code != 302)
 def login():
     if request.method == 'POST':
         username = request.form['username']
@@ -193,9 +1945,16 @@ def login():
         cur.execute('SELECT * FROM usuarios WHERE username = %s AND activo = TRUE', (username,))
         user = cur.fetchone()
         cur.close()
-        conn.close()
         
-        if user and check_password_hash(user['password'], password):
+        if user and verificar_password(user['password'], password):
+            try:
+                if necesita_rehash(user['password']):
+                    cur = conn.cursor()
+                    cur.execute('UPDATE usuarios SET password = %s WHERE id = %s', (hashear_password(password), user['id']))
+                    conn.commit()
+                    cur.close()
+            except HashSaturado:
+                pass  # se actualiza en el próximo login
             session['user_id'] = user['id']
             session['username'] = user['username']
             session['nombre'] = user['nombre']
@@ -213,289 +1972,928 @@ def logout():
 
 @app.route('/dashboard')
 @login_required
+@respuesta_condicional
 def dashboard():
+    # Primer pintado liviano: tarjetas, gráfica y tabla se llenan desde /api/estadisticas y /api/pedidos
+    return render_template('dashboard.html',
+                         fecha_inicio=request.args.get('fecha_inicio', ''),
+                         fecha_fin=request.args.get('fecha_fin', ''),
+                         por_pagina=leer_por_pagina(request.args.get('por_pagina')),
+                         despues=request.args.get('despues', ''),
+                         antes=request.args.get('antes', ''),
+                         busqueda_min_caracteres=BUSQUEDA_MIN_CARACTERES,
+                         estadisticas_conteos=ESTADISTICAS_CONTEOS,
+                         eventos_en_vivo=eventos_pedidos.max_clientes > 0)
+
+# Campos que puede pedir /api/pedidos (?campos=a,b,c); sin `campos` van los de la tabla del dashboard
+CAMPOS_PEDIDO = ['id', 'fecha', 'cliente', 'producto', 'cantidad', 'fecha_sesion',
+                 'metodo_pago_anticipo', 'metodo_pago_saldo', 'cuotas_visa_anticipo', 'cuotas_visa_saldo',
+                 'precio_unitario', 'subtotal', 'total_venta', 'anticipo', 'saldo_restante',
+                 'costo_produccion', 'costo_visa_anticipo', 'costo_visa_saldo', 'costo_visa_total',
+                 'costo_total', 'utilidad', 'porcentaje_utilidad', 'disponible_anticipo']
+CAMPOS_PEDIDO_DEFECTO = ['id', 'fecha', 'cliente', 'producto', 'cantidad', 'total_venta', 'anticipo',
+                         'saldo_restante', 'fecha_sesion', 'costo_total', 'utilidad']
+
+def pedidos_con_totales(pedidos):
+    """Pedidos de la página como PedidoCalculado; omite los que calcular_totales no podría calcular."""
+    totales = totales_de_pedidos(pedidos)
+    return [PedidoCalculado(pedido, *fila)
+            for pedido, valido, fila in zip(pedidos, totales['valido'].tolist(), filas_totales(totales)) if valido]
+
+def valor_json(valor):
+    if isinstance(valor, float):
+        return round(valor, 2)
+    if hasattr(valor, 'isoformat'):
+        return valor.isoformat()
+    return valor
+
+def respuesta_json(datos):
+    """JSON compacto (sin espacios) para las rutas /api."""
+    return Response(json.dumps(datos, separators=(',', ':'), ensure_ascii=False), mimetype='application/json')
+
+@app.route('/api/pedidos')
+@login_required
+@respuesta_condicional
+def api_pedidos():
+    """Página de pedidos como {campos, filas, siguiente, anterior}; cada fila es una lista en el orden de `campos`."""
+    campos = [c for c in request.args.get('campos', '').split(',') if c] or CAMPOS_PEDIDO_DEFECTO
+    desconocidos = [c for c in campos if c not in CAMPOS_PEDIDO]
+    if desconocidos:
+        return jsonify(error=f"Campos desconocidos: {', '.join(desconocidos)}"), 400
+    
+    cur = get_db_lectura().cursor()
+    pedidos, siguiente, anterior = obtener_pagina_pedidos(
+        cur, request.args.get('fecha_inicio', ''), request.args.get('fecha_fin', ''),
+        despues=request.args.get('despues'),
+        antes=request.args.get('antes'),
+        por_pagina=leer_por_pagina(request.args.get('por_pagina'))
+    )
+    cur.close()
+    
+    filas = [[valor_json(getattr(pedido, c)) for c in campos] for pedido in pedidos_con_totales(pedidos)]
+    return respuesta_json({'campos': campos, 'filas': filas, 'siguiente': siguiente, 'anterior': anterior})
+
+@app.route('/api/estadisticas')
+@login_required
+@respuesta_condicional
+def api_estadisticas():
+    """Las mismas estadísticas que las tarjetas y la gráfica del dashboard."""
+    cur = get_db_lectura().cursor()
+    estadisticas = calcular_estadisticas(cur, request.args.get('fecha_inicio', ''), request.args.get('fecha_fin', ''))
+    cur.close()
+    return respuesta_json({k: valor_json(v) for k, v in estadisticas.items()})
+
+def evento_pedido(pedido):
+    """Un PedidoCalculado como va en los eventos: su fila de la tabla del dashboard y su aporte a las estadísticas."""
+    if pedido is None:
+        return None
+    return {'fila': {c: valor_json(getattr(pedido, c)) for c in CAMPOS_PEDIDO_DEFECTO},
+            'aporte': aporte_estadisticas(pedido, pedido.producto)}
+
+def pedidos_para_evento(cur, ids):
+    """{id: PedidoCalculado} de los pedidos `ids` tal como están en la transacción."""
+    cur.execute('SELECT * FROM pedidos WHERE id = ANY(%s)', (list(ids),))
+    return {pedido.id: pedido for pedido in pedidos_con_totales(cur.fetchall())}
+
+def publicar_cambios(cur, antes, despues):
+    """Un evento 'creado', 'actualizado' o 'eliminado' por pedido, comparando dos pedidos_para_evento."""
+    for pedido_id in sorted(antes.keys() | despues.keys()):
+        previo, nuevo = antes.get(pedido_id), despues.get(pedido_id)
+        tipo = 'actualizado' if previo and nuevo else 'creado' if nuevo else 'eliminado'
+        publicar_evento(cur, tipo, {'antes': evento_pedido(previo), 'despues': evento_pedido(nuevo)})
+
+def leer_id_evento(valor):
+    try:
+        return max(0, int(valor))
+    except (TypeError, ValueError):
+        return None
+
+def mensaje_sse(evento):
+    nombre = 'recargar' if evento['tipo'] == 'recargar' else 'pedido'
+    return f"id: {evento['id']}\nevent: {nombre}\ndata: {json.dumps(evento, separators=(',', ':'), ensure_ascii=False)}\n\n"
+
+def flujo_eventos(suscripcion, desde):
+    """Mensajes SSE de una conexión: lo pendiente desde `desde`, luego lo que reparte el listener y latidos."""
+    yield f'retry: {int(EVENTOS_LATIDO_SEGUNDOS * 1000)}\n\n'
+    ultimo = desde
+    if desde is not None:
+        # La conexión de la petición ya se devolvió al pool: se pide una sólo para esta lectura
+        conn = db_pool.obtener()
+        try:
+            cur = conn.cursor()
+            pendientes = leer_eventos(cur, desde, EVENTOS_REENVIO_MAX + 1)
+            cur.execute('SELECT MIN(id) AS primero, COALESCE(MAX(id), 0) AS ultimo FROM eventos_pedidos')
+            extremos = cur.fetchone()
+            cur.close()
+            conn.rollback()
+        finally:
+            db_pool.devolver(conn)
+        purgados = extremos['primero'] is not None and desde < extremos['primero'] - 1
+        if len(pendientes) > EVENTOS_REENVIO_MAX or purgados:
+            # Demasiado atrasado: que el navegador vuelva a pedir estadísticas y tabla
+            ultimo = extremos['ultimo']
+            yield mensaje_sse({'id': ultimo, 'tipo': 'recargar'})
+        else:
+            for evento in pendientes:
+                ultimo = evento['id']
+                yield mensaje_sse(evento)
+    
+    fin = time.monotonic() + EVENTOS_DURACION_MAX
+    while time.monotonic() < fin:
+        try:
+            evento = suscripcion.cola.get(timeout=EVENTOS_LATIDO_SEGUNDOS)
+        except queue.Empty:
+            yield ': latido\n\n'
+            continue
+        if suscripcion.desbordada:
+            while not suscripcion.cola.empty():
+                evento = suscripcion.cola.get_nowait()
+            suscripcion.desbordada = False
+            evento = {'id': evento['id'], 'tipo': 'recargar'}
+        if ultimo is not None and evento['id'] <= ultimo:
+            continue
+        ultimo = evento['id']
+        yield mensaje_sse(evento)
+
+@app.route('/api/eventos')
+@login_required
+def api_eventos():
+    """Cambios de pedidos en vivo (Server-Sent Events) para el dashboard.
+
+    Eventos `pedido` (creado, actualizado o eliminado, con la fila y el aporte a
+    las estadísticas antes y después) y `recargar` cuando el cambio es masivo.
+    Reenvía primero lo posterior a Last-Event-ID (o ?desde=) y cierra a los
+    EVENTOS_DURACION_MAX segundos; el navegador reconecta solo.
+    """
+    if not eventos_pedidos.max_clientes:
+        return Response('Dashboard en vivo desactivado', 404)
+    desde = leer_id_evento(request.headers.get('Last-Event-ID') or request.args.get('desde'))
+    suscripcion = eventos_pedidos.suscribir()
+    if suscripcion is None:
+        return Response('Demasiadas conexiones de eventos', 503, headers={'Retry-After': '30'})
+    respuesta = Response(flujo_eventos(suscripcion, desde), mimetype='text/event-stream',
+                         headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    respuesta.call_on_close(lambda: eventos_pedidos.cancelar(suscripcion))
+    return respuesta
+
+def pedidos_por_lotes(fecha_inicio='', fecha_fin=''):
+    """Pedidos del filtro con sus totales, leídos de a LISTADO_LOTE con un cursor del servidor."""
+    condicion, params = filtro_fechas(fecha_inicio, fecha_fin)
+    cur = get_db_lectura().cursor(name='listado_pedidos')
+    try:
+        cur.execute(f'SELECT * FROM pedidos WHERE {condicion} ORDER BY fecha DESC, id DESC', params)
+        while True:
+            lote = cur.fetchmany(LISTADO_LOTE)
+            if not lote:
+                break
+            yield from pedidos_con_totales(lote)
+    finally:
+        cur.close()
+
+def agrupar_fragmentos(fragmentos, tamano=LISTADO_BLOQUE_BYTES):
+    """Junta los fragmentos que produce Jinja en bloques de ~`tamano` caracteres: una escritura al socket por bloque."""
+    bloque, acumulado = [], 0
+    for fragmento in fragmentos:
+        bloque.append(fragmento)
+        acumulado += len(fragmento)
+        if acumulado >= tamano:
+            yield ''.join(bloque)
+            bloque, acumulado = [], 0
+    if bloque:
+        yield ''.join(bloque)
+
+def comprimir_fragmentos(bloques):
+    """gzip sobre la marcha; cada bloque se cierra con Z_SYNC_FLUSH para que el navegador lo pinte al recibirlo."""
+    compresor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for bloque in bloques:
+        yield compresor.compress(bloque.encode('utf-8')) + compresor.flush(zlib.Z_SYNC_FLUSH)
+    yield compresor.flush()
+
+@app.route('/pedidos/listado')
+@login_required
+@respuesta_condicional
+def listado_pedidos():
+    """Todos los pedidos del filtro en una página, enviada mientras se genera.
+
+    El encabezado y el resumen salen antes de leer los pedidos; las filas se
+    calculan por lotes, así la memoria no crece con la cantidad de pedidos.
+    """
     fecha_inicio = request.args.get('fecha_inicio', '')
     fecha_fin = request.args.get('fecha_fin', '')
+    cur = get_db_lectura().cursor()
+    estadisticas = calcular_estadisticas(cur, fecha_inicio, fecha_fin)
+    cur.close()
+
+    bloques = agrupar_fragmentos(stream_template('listado_pedidos.html',
+                                                 pedidos=pedidos_por_lotes(fecha_inicio, fecha_fin),
+                                                 estadisticas=estadisticas,
+                                                 fecha_inicio=fecha_inicio,
+                                                 fecha_fin=fecha_fin))
+    if LISTADO_GZIP and 'gzip' in request.accept_encodings:
+        respuesta = Response(comprimir_fragmentos(bloques), mimetype='text/html')
+        respuesta.content_encoding = 'gzip'
+    else:
+        respuesta = Response(bloques, mimetype='text/html')
+    respuesta.vary.add('Accept-Encoding')
+    return respuesta
+
+def normalizar_texto(texto):
+    """Lo mismo que normalizar_texto() en la base: quita las tildes de TILDES_ORIGEN y pasa a minúsculas."""
+    return (texto or '').translate(TABLA_TILDES).lower()
+
+def normalizar_busqueda(texto):
+    """Palabras del texto buscado normalizadas como el índice de clientes (letras y números, sin _)."""
+    return re.findall(r'[^\W_]+', normalizar_texto(texto))
+
+@app.route('/api/clientes/buscar')
+@login_required
+@respuesta_condicional
+def api_buscar_clientes():
+    """Pedidos cuyo cliente tiene palabras que empiezan con las de ?q=, los más recientes primero, con su saldo.
+
+    'lopez mar' encuentra a "María López". Los totales se calculan sólo para los
+    `limite` pedidos devueltos, no para todas las coincidencias.
+    """
+    palabras = normalizar_busqueda(request.args.get('q', ''))
+    if len(''.join(palabras)) < BUSQUEDA_MIN_CARACTERES:
+        return respuesta_json({'pedidos': []})
+    try:
+        limite = max(1, min(int(request.args.get('limite', BUSQUEDA_LIMITE_DEFECTO)), BUSQUEDA_LIMITE_MAX))
+    except ValueError:
+        limite = BUSQUEDA_LIMITE_DEFECTO
+
+    sql, params = sql_pedidos_calculados('''p.id IN (
+        SELECT id FROM pedidos
+        WHERE to_tsvector('simple', normalizar_texto(cliente)) @@ to_tsquery('simple', %s)
+        ORDER BY fecha DESC, id DESC
+        LIMIT %s
+    )''', [' & '.join(f'{palabra}:*' for palabra in palabras), limite])
+    cur = get_db_lectura().cursor()
+    cur.execute(sql + '''
+        SELECT id, cliente, fecha, producto, saldo_restante::float AS saldo_restante, saldo_pagado
+        FROM pedidos_calculados
+        ORDER BY fecha DESC, id DESC
+    ''', params)
+    pedidos = [{k: valor_json(v) for k, v in fila.items()} for fila in cur.fetchall()]
+    cur.close()
+    return respuesta_json({'pedidos': pedidos})
+
+def estilos_excel():
+    """Estilos con nombre del reporte; se registran una vez por libro y las celdas sólo los referencian."""
+    from openpyxl.styles import NamedStyle, Font, Alignment, Border, Side, PatternFill
     
-    conn = get_db_connection()
-    cur = conn.cursor()
+    borde = Border(
+        left=Side(style='thin', color='CCCCCC'),
+        right=Side(style='thin', color='CCCCCC'),
+        top=Side(style='thin', color='CCCCCC'),
+        bottom=Side(style='thin', color='CCCCCC')
+    )
+    centro = Alignment(horizontal="center", vertical="center")
+    derecha = Alignment(horizontal="right", vertical="center")
+    formato_moneda = '"Q"#,##0.00'
+    fuente = Font(name='Calibri', size=11)
+    
+    def relleno(color):
+        return PatternFill(start_color=color, end_color=color, fill_type="solid")
+    
+    return [
+        NamedStyle(name='titulo', font=Font(bold=True, size=16), alignment=Alignment(horizontal="center")),
+        NamedStyle(name='subtitulo', font=Font(size=10, color="666666"), alignment=Alignment(horizontal="center")),
+        NamedStyle(name='encabezado', font=Font(bold=True, color="FFFFFF", size=11), fill=relleno("000000"), alignment=centro, border=borde),
+        NamedStyle(name='celda', font=fuente, border=borde),
+        NamedStyle(name='celda_centro', font=fuente, alignment=centro, border=borde),
+        NamedStyle(name='moneda', font=fuente, number_format=formato_moneda, alignment=derecha, border=borde),
+        NamedStyle(name='moneda_anticipo', font=fuente, number_format=formato_moneda, alignment=derecha, border=borde, fill=relleno("E8F5E9")),
+        NamedStyle(name='moneda_saldo', font=fuente, number_format=formato_moneda, alignment=derecha, border=borde, fill=relleno("FFF3E0")),
+        NamedStyle(name='moneda_costo', font=fuente, number_format=formato_moneda, alignment=derecha, border=borde, fill=relleno("FFEBEE")),
+        NamedStyle(name='total_etiqueta', font=Font(bold=True)),
+        NamedStyle(name='total_moneda', number_format=formato_moneda, font=Font(bold=True), alignment=derecha),
+        NamedStyle(name='porcentaje', font=fuente, number_format='0.0%', alignment=derecha, border=borde),
+        NamedStyle(name='total_porcentaje', number_format='0.0%', font=Font(bold=True), alignment=derecha)
+    ]
+
+def generar_excel_pedidos(conn, fecha_inicio, fecha_fin, destino, progreso=None, modo='pedidos'):
+    """Escribe el reporte de pedidos en `destino` con memoria constante.
+
+    Lee los pedidos con un cursor del servidor en lotes de EXPORT_LOTE filas y los
+    escribe con el modo write-only de openpyxl, que vuelca cada fila a disco.
+    Si se indica, `progreso(n)` se llama después de cada lote escrito. En modo
+    'analitico' agrega las hojas de resumen de escribir_hojas_analiticas.
+    Devuelve el número de pedidos exportados.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.utils import get_column_letter
     
-    query = 'SELECT * FROM pedidos'
-    params = []
+    wb = Workbook(write_only=True)
+    for estilo in estilos_excel():
+        wb.add_named_style(estilo)
+    ws = wb.create_sheet("Pedidos")
     
+    def celda(valor, estilo):
+        cell = WriteOnlyCell(ws, value=valor)
+        cell.style = estilo
+        return cell
+    
+    # Ajustar anchos (en write-only deben definirse antes de escribir filas)
+    column_widths = [12, 25, 12, 8, 15, 15, 15, 14, 15, 15]
+    for i, width in enumerate(column_widths, 1):
+        ws.column_dimensions[get_column_letter(i)].width = width
+    
+    # Título
+    fecha_reporte = f"Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}"
     if fecha_inicio and fecha_fin:
-        query += ' WHERE fecha BETWEEN %s AND %s'
-        params = [fecha_inicio, fecha_fin]
-    elif fecha_inicio:
-        query += ' WHERE fecha >= %s'
-        params = [fecha_inicio]
-    elif fecha_fin:
-        query += ' WHERE fecha <= %s'
-        params = [fecha_fin]
+        fecha_reporte += f" | Período: {fecha_inicio} a {fecha_fin}"
+    ws.merged_cells.add('A1:J1')
+    ws.merged_cells.add('A2:J2')
+    ws.append([celda('ETERNO by MK - Reporte de Pedidos', 'titulo')])
+    ws.append([celda(fecha_reporte, 'subtitulo')])
+    ws.append([])
     
-    query += ' ORDER BY fecha DESC, id DESC'
+    # Headers
+    headers = ['Fecha', 'Cliente', 'Producto', 'Cant.', 'Total Venta', 'Anticipo', 'Saldo', 'Fecha Sesión', 'Costo', 'Utilidad']
+    ws.append([celda(header, 'encabezado') for header in headers])
     
-    cur.execute(query, params)
-    pedidos = cur.fetchall()
-    cur.close()
-    conn.close()
+    # Datos
+    condicion, params = filtro_fechas(fecha_inicio, fecha_fin)
+    cur = conn.cursor(name='exportar_pedidos')
+    cur.execute(f'''
+        SELECT fecha, cliente, producto, cantidad, descuento, anticipo, cuotas_visa_anticipo, cuotas_visa_saldo, fecha_sesion,
+               catalogo_version
+        FROM pedidos WHERE {condicion} ORDER BY fecha DESC, id DESC
+    ''', params)
     
-    total_anticipos = 0
-    total_saldos_pendientes = 0
-    total_costos = 0
+    exportados = 0
+    total_venta = 0
+    total_anticipo = 0
+    total_saldo = 0
+    total_costo = 0
     total_utilidad = 0
-    pedidos_grande = 0
-    pedidos_mediano = 0
-    anticipos_grande = 0
-    anticipos_mediano = 0
-    saldos_grande = 0
-    saldos_mediano = 0
-    costos_grande = 0
-    costos_mediano = 0
-    
-    pedidos_procesados = []
-    for pedido in pedidos:
+    
+    while True:
+        lote = cur.fetchmany(EXPORT_LOTE)
+        if not lote:
+            break
+        totales = totales_de_pedidos(lote)
+        for pedido, valido, fila in zip(lote, totales['valido'].tolist(), filas_totales(totales)):
+            if not valido:
+                continue
+            fila = TotalesPedido(*fila)
+            ws.append([
+                celda(pedido['fecha'].strftime('%d/%m/%Y') if pedido['fecha'] else '', 'celda_centro'),
+                celda(pedido['cliente'], 'celda'),
+                celda(pedido['producto'], 'celda_centro'),
+                celda(pedido['cantidad'], 'celda_centro'),
+                celda(fila.total_venta, 'moneda'),
+                celda(fila.anticipo, 'moneda_anticipo'),
+                celda(fila.saldo_restante, 'moneda_saldo'),
+                celda(pedido['fecha_sesion'].strftime('%d/%m/%Y') if pedido.get('fecha_sesion') else '-', 'celda_centro'),
+                celda(fila.costo_total, 'moneda_costo'),
+                celda(fila.utilidad, 'moneda')
+            ])
+        
+        validos = totales['valido']
+        exportados += int(validos.sum())
+        total_venta += int(totales['total_venta_c'][validos].sum())
+        total_anticipo += int(totales['anticipo_c'][validos].sum())
+        total_saldo += int(totales['saldo_restante_c'][validos].sum())
+        total_costo += int(totales['costo_total_c'][validos].sum())
+        total_utilidad += int(totales['utilidad_c'][validos].sum())
+        if progreso:
+            progreso(exportados)
+    cur.close()
+    
+    # Totales (sumados en centavos)
+    ws.append([])
+    ws.append([None, None, None, celda('TOTALES:', 'total_etiqueta')] +
+              [celda(total / 100, 'total_moneda') for total in (total_venta, total_anticipo, total_saldo)] +
+              [None] +
+              [celda(total / 100, 'total_moneda') for total in (total_costo, total_utilidad)])
+    
+    if modo == 'analitico':
+        cur = conn.cursor()
+        escribir_hojas_analiticas(wb, cur, fecha_inicio, fecha_fin)
+        cur.close()
+    
+    wb.save(destino)
+    return exportados
+
+MODOS_EXPORTACION = ('pedidos', 'analitico')
+
+def componentes_de_costo(cur):
+    """Claves de costo por unidad: las de PRODUCTOS_CONFIG y luego las que agregaron versiones posteriores del catálogo."""
+    componentes = []
+    for config in PRODUCTOS_CONFIG.values():
+        componentes.extend(k for k in config['costos'] if k not in componentes)
+    cur.execute('SELECT DISTINCT jsonb_object_keys(costos) AS componente FROM catalogo_productos ORDER BY 1')
+    componentes.extend(f['componente'] for f in cur.fetchall() if f['componente'] not in componentes)
+    return componentes
+
+def resumenes_analiticos(cur, fecha_inicio, fecha_fin, componentes):
+    """Totales por mes y producto, por método de pago y por plan de cuotas Visa, en una sola pasada.
+
+    Cada pedido se abre en dos pagos (anticipo y saldo) para atribuir montos y
+    costo Visa a su método y cuotas; las medidas del pedido se cuentan sólo en
+    el pago del anticipo. Devuelve {conjunto: filas}, donde el conjunto es la
+    tupla de columnas agrupadas ('mes', 'producto'), ('metodo', 'tipo'), etc.
+    """
+    condicion, params = filtro_fechas(fecha_inicio, fecha_fin, 'p.fecha')
+    ctes, params = sql_pedidos_calculados(condicion, params)
+    costos = ',\n'.join(f"COALESCE(SUM((costos_unitarios->>%s)::numeric * cantidad) FILTER (WHERE principal), 0) AS costo_{i}"
+                        for i in range(len(componentes)))
+    cur.execute(ctes + f''',
+        pagos AS (
+            SELECT c.*, to_char(c.fecha, 'YYYY-MM') AS mes, pg.*
+            FROM pedidos_calculados c
+            CROSS JOIN LATERAL (VALUES
+                ('Anticipo', COALESCE(NULLIF(c.metodo_pago_anticipo, ''), '(sin método)'),
+                 COALESCE(c.cuotas_visa_anticipo, 0), c.anticipo_neto, c.costo_visa_anticipo, TRUE),
+                ('Saldo', COALESCE(NULLIF(c.metodo_pago_saldo, ''), '(sin método)'),
+                 COALESCE(c.cuotas_visa_saldo, 0), c.saldo_restante, c.costo_visa_saldo, FALSE)
+            ) AS pg (tipo, metodo, cuotas, monto, costo_visa_pago, principal)
+        )
+        SELECT GROUPING(mes) AS g_mes, GROUPING(producto) AS g_producto, GROUPING(metodo) AS g_metodo,
+               GROUPING(cuotas) AS g_cuotas, GROUPING(tipo) AS g_tipo,
+               mes, producto, metodo, cuotas, tipo,
+               COUNT(*) FILTER (WHERE principal) AS pedidos,
+               COALESCE(SUM(cantidad) FILTER (WHERE principal), 0) AS unidades,
+               COALESCE(SUM(total_venta) FILTER (WHERE principal), 0) AS total_venta,
+               COALESCE(SUM(anticipo_neto) FILTER (WHERE principal), 0) AS anticipo,
+               COALESCE(SUM(saldo_restante) FILTER (WHERE principal), 0) AS saldo,
+               {costos},
+               COALESCE(SUM(costo_produccion) FILTER (WHERE principal), 0) AS costo_produccion,
+               COALESCE(SUM(costo_visa_anticipo + costo_visa_saldo) FILTER (WHERE principal), 0) AS costo_visa,
+               COUNT(*) FILTER (WHERE monto <> 0) AS pagos,
+               COALESCE(SUM(monto), 0) AS monto,
+               COALESCE(SUM(costo_visa_pago), 0) AS costo_visa_pago
+        FROM pagos
+        GROUP BY GROUPING SETS ((mes, producto), (mes), (producto), (),
+                                (metodo, tipo), (metodo), (cuotas, tipo), (cuotas))
+        ORDER BY mes, producto, metodo, cuotas, tipo
+    ''', params + componentes)
+
+    resumenes = {}
+    for fila in cur.fetchall():
+        conjunto = tuple(c for c in ('mes', 'producto', 'metodo', 'cuotas', 'tipo') if not fila[f'g_{c}'])
+        resumenes.setdefault(conjunto, []).append(fila)
+    return resumenes
+
+def escribir_hojas_analiticas(wb, cur, fecha_inicio, fecha_fin):
+    """Agrega al libro (write-only) las hojas Por Mes, Por Producto, Métodos de Pago y Cuotas Visa."""
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.utils import get_column_letter
+
+    componentes = componentes_de_costo(cur)
+    resumenes = resumenes_analiticos(cur, fecha_inicio, fecha_fin, componentes)
+    vacio = {'pedidos': 0, 'unidades': 0, 'total_venta': 0, 'anticipo': 0, 'saldo': 0, 'costo_produccion': 0,
+             'costo_visa': 0, **{f'costo_{i}': 0 for i in range(len(componentes))}}
+    total = (resumenes.get(()) or [vacio])[0]
+
+    def hoja(titulo, encabezados, anchos):
+        ws = wb.create_sheet(titulo)
+        for i, ancho in enumerate(anchos, 1):
+            ws.column_dimensions[get_column_letter(i)].width = ancho
+        ws.append([celda(ws, e, 'encabezado') for e in encabezados])
+        return ws
+
+    def celda(ws, valor, estilo):
+        cell = WriteOnlyCell(ws, value=float(valor) if isinstance(valor, Decimal) else valor)
+        cell.style = estilo
+        return cell
+
+    # Ventas y costos (por componente) de cada grupo de pedidos
+    medidas = (['Pedidos', 'Unidades', 'Total Venta', 'Anticipo', 'Saldo'] +
+               [f'Costo {c.capitalize()}' for c in componentes] +
+               ['Costo Producción', 'Costo Visa', 'Costo Total', 'Utilidad', 'Margen'])
+
+    def fila_ventas(ws, etiquetas, f, es_total=False):
+        moneda, texto, porcentaje = ('total_moneda', 'total_etiqueta', 'total_porcentaje') if es_total else ('moneda', 'celda', 'porcentaje')
+        costo_total = f['costo_produccion'] + f['costo_visa']
+        utilidad = f['total_venta'] - costo_total
+        ws.append([celda(ws, e, texto) for e in etiquetas] +
+                  [celda(ws, f['pedidos'], texto), celda(ws, f['unidades'], texto)] +
+                  [celda(ws, f[k], moneda) for k in ('total_venta', 'anticipo', 'saldo')] +
+                  [celda(ws, f[f'costo_{i}'], moneda) for i in range(len(componentes))] +
+                  [celda(ws, f['costo_produccion'], moneda), celda(ws, f['costo_visa'], moneda),
+                   celda(ws, costo_total, moneda), celda(ws, utilidad, moneda),
+                   celda(ws, utilidad / f['total_venta'] if f['total_venta'] else 0, porcentaje)])
+
+    ws = hoja('Por Mes', ['Mes', 'Producto'] + medidas, [10, 12] + [14] * len(medidas))
+    subtotales = {f['mes']: f for f in resumenes.get(('mes',), [])}
+    mes_actual = None
+    for f in resumenes.get(('mes', 'producto'), []):
+        if mes_actual is not None and f['mes'] != mes_actual:
+            fila_ventas(ws, [mes_actual, 'Subtotal'], subtotales[mes_actual], es_total=True)
+        mes_actual = f['mes']
+        fila_ventas(ws, [f['mes'], f['producto']], f)
+    if mes_actual is not None:
+        fila_ventas(ws, [mes_actual, 'Subtotal'], subtotales[mes_actual], es_total=True)
+    fila_ventas(ws, ['TOTAL', ''], total, es_total=True)
+
+    ws = hoja('Por Producto', ['Producto'] + medidas, [12] + [14] * len(medidas))
+    for f in resumenes.get(('producto',), []):
+        fila_ventas(ws, [f['producto']], f)
+    fila_ventas(ws, ['TOTAL'], total, es_total=True)
+
+    # Pagos: el anticipo y el saldo de cada pedido con su método y cuotas
+    def fila_pagos(ws, etiquetas, f, es_total=False):
+        moneda, texto, porcentaje = ('total_moneda', 'total_etiqueta', 'total_porcentaje') if es_total else ('moneda', 'celda', 'porcentaje')
+        ws.append([celda(ws, e, texto) for e in etiquetas] +
+                  [celda(ws, f['pagos'], texto), celda(ws, f['monto'], moneda), celda(ws, f['costo_visa_pago'], moneda),
+                   celda(ws, f['costo_visa_pago'] / f['monto'] if f['monto'] else 0, porcentaje)])
+
+    for titulo, columna, encabezado, formato in (('Métodos de Pago', 'metodo', 'Método', str),
+                                                 ('Cuotas Visa', 'cuotas', 'Cuotas', lambda c: f'{c} cuotas' if c else 'Sin cuotas')):
+        ws = hoja(titulo, [encabezado, 'Tipo', 'Pagos', 'Monto', 'Costo Visa', 'Tasa Efectiva'], [18, 12, 10, 16, 14, 14])
+        por_tipo = {}
+        for f in resumenes.get((columna, 'tipo'), []):
+            por_tipo.setdefault(f[columna], []).append(f)
+        for f in resumenes.get((columna,), []):
+            for detalle in por_tipo.get(f[columna], []):
+                fila_pagos(ws, [formato(f[columna]), detalle['tipo']], detalle)
+            fila_pagos(ws, [formato(f[columna]), 'Total'], f, es_total=True)
+
+def version_datos_pedidos(cur):
+    """(versión, última modificación) de la tabla pedidos según el contador del trigger."""
+    cur.execute("SELECT version, actualizado FROM datos_version WHERE tabla = 'pedidos'")
+    fila = cur.fetchone()
+    return (fila['version'], fila['actualizado']) if fila else (0, None)
+
+_executor_exportaciones = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+def executor_exportaciones():
+    """Pool de hilos del worker actual para generar exportaciones (se crea de nuevo tras un fork)."""
+    global _executor_exportaciones, _executor_pid
+    with _executor_lock:
+        if _executor_exportaciones is None or _executor_pid != os.getpid():
+            _executor_exportaciones = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix='exportacion')
+            _executor_pid = os.getpid()
+        return _executor_exportaciones
+
+def ruta_exportacion(exportacion_id):
+    return os.path.join(EXPORT_DIR, f'pedidos_{exportacion_id}.xlsx')
+
+def expirar_exportacion(cur, exportacion):
+    if exportacion.get('archivo'):
         try:
-            anticipo = float(pedido['anticipo']) if pedido.get('anticipo') else 0
-            cuotas_visa_anticipo = pedido.get('cuotas_visa_anticipo') or 0
-            cuotas_visa_saldo = pedido.get('cuotas_visa_saldo') or 0
-            
-            totales = calcular_totales(
-                pedido['producto'],
-                pedido['cantidad'],
-                float(pedido['descuento']) if pedido['descuento'] else 0,
-                anticipo,
-                cuotas_visa_anticipo,
-                cuotas_visa_saldo
-            )
-            
-            pedidos_procesados.append({
-                'id': pedido['id'],
-                'fecha': pedido['fecha'],
-                'cliente': pedido['cliente'],
-                'producto': pedido['producto'],
-                'cantidad': pedido['cantidad'],
-                'fecha_sesion': pedido.get('fecha_sesion'),
-                'metodo_pago_anticipo': pedido.get('metodo_pago_anticipo', ''),
-                'metodo_pago_saldo': pedido.get('metodo_pago_saldo', ''),
-                **totales
-            })
-            
-            total_anticipos += anticipo
-            total_saldos_pendientes += totales['saldo_restante']
-            total_costos += totales['costo_total']
-            total_utilidad += totales['utilidad']
-            
-            if pedido['producto'] == 'Grande':
-                pedidos_grande += pedido['cantidad']
-                anticipos_grande += anticipo
-                saldos_grande += totales['saldo_restante']
-                costos_grande += totales['costo_total']
-            else:
-                pedidos_mediano += pedido['cantidad']
-                anticipos_mediano += anticipo
-                saldos_mediano += totales['saldo_restante']
-                costos_mediano += totales['costo_total']
-        except:
-            continue
+            os.remove(exportacion['archivo'])
+        except FileNotFoundError:
+            pass
+    cur.execute("UPDATE exportaciones SET estado = 'expirado', actualizado = CURRENT_TIMESTAMP WHERE id = %s", (exportacion['id'],))
+
+def depurar_exportaciones(cur):
+    """Elimina archivos más viejos que EXPORT_MAX_HORAS y, si el total supera EXPORT_MAX_BYTES, los más antiguos."""
+    cur.execute('''
+        UPDATE exportaciones SET estado = 'error', error = 'Tiempo de espera agotado', actualizado = CURRENT_TIMESTAMP
+        WHERE estado IN ('pendiente', 'procesando') AND actualizado < CURRENT_TIMESTAMP - make_interval(mins => %s)
+    ''', (EXPORT_TRABAJO_TIMEOUT_MINUTOS,))
     
-    total_ventas_proyectadas = total_anticipos + total_saldos_pendientes
-    margen_promedio = (total_utilidad / total_ventas_proyectadas * 100) if total_ventas_proyectadas > 0 else 0
-    
-    estadisticas = {
-        'total_anticipos': total_anticipos,
-        'total_saldos_pendientes': total_saldos_pendientes,
-        'total_ventas_proyectadas': total_ventas_proyectadas,
-        'total_costos': total_costos,
-        'total_utilidad': total_utilidad,
-        'margen_promedio': margen_promedio,
-        'total_pedidos': len(pedidos_procesados),
-        'pedidos_grande': pedidos_grande,
-        'pedidos_mediano': pedidos_mediano,
-        'anticipos_grande': anticipos_grande,
-        'anticipos_mediano': anticipos_mediano,
-        'saldos_grande': saldos_grande,
-        'saldos_mediano': saldos_mediano,
-        'costos_grande': costos_grande,
-        'costos_mediano': costos_mediano
+    cur.execute("SELECT id, archivo, tamano, terminado FROM exportaciones WHERE estado = 'listo' ORDER BY terminado DESC")
+    acumulado = 0
+    limite_edad = datetime.now() - timedelta(hours=EXPORT_MAX_HORAS)
+    for exportacion in cur.fetchall():
+        acumulado += exportacion['tamano'] or 0
+        if exportacion['terminado'] < limite_edad or acumulado > EXPORT_MAX_BYTES:
+            expirar_exportacion(cur, exportacion)
+
+def procesar_exportacion(exportacion_id):
+    """Genera el archivo de una exportación en segundo plano y registra su avance en la tabla.
+
+    El estado se escribe en el primario; los pedidos se leen de una réplica si
+    ya replicó la versión de datos de la exportación.
+    """
+    conn_estado = db_pool.obtener()
+    cur_estado = conn_estado.cursor()
+    replica = conn = None
+    try:
+        cur_estado.execute('''
+            UPDATE exportaciones SET estado = 'procesando', actualizado = CURRENT_TIMESTAMP
+            WHERE id = %s RETURNING fecha_inicio, fecha_fin, modo, version_datos
+        ''', (exportacion_id,))
+        exportacion = cur_estado.fetchone()
+        conn_estado.commit()
+        replica = replicas.obtener(exportacion['version_datos']) if replicas else None
+        conn = replica[1] if replica else db_pool.obtener()
+        
+        def progreso(exportados):
+            cur_estado.execute('UPDATE exportaciones SET progreso = %s, actualizado = CURRENT_TIMESTAMP WHERE id = %s',
+                               (exportados, exportacion_id))
+            conn_estado.commit()
+        
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        ruta = ruta_exportacion(exportacion_id)
+        with open(ruta + '.tmp', 'wb') as destino:
+            exportados = generar_excel_pedidos(conn, exportacion['fecha_inicio'], exportacion['fecha_fin'], destino, progreso,
+                                               exportacion['modo'])
+        os.replace(ruta + '.tmp', ruta)
+        
+        cur_estado.execute('''
+            UPDATE exportaciones SET estado = 'listo', progreso = %s, archivo = %s, tamano = %s,
+                   actualizado = CURRENT_TIMESTAMP, terminado = CURRENT_TIMESTAMP
+            WHERE id = %s
+        ''', (exportados, ruta, os.path.getsize(ruta), exportacion_id))
+        depurar_exportaciones(cur_estado)
+        conn_estado.commit()
+    except Exception as e:
+        conn_estado.rollback()
+        cur_estado.execute("UPDATE exportaciones SET estado = 'error', error = %s, actualizado = CURRENT_TIMESTAMP WHERE id = %s",
+                           (str(e), exportacion_id))
+        conn_estado.commit()
+        app.logger.exception('Error generando exportación %s', exportacion_id)
+    finally:
+        cur_estado.close()
+        db_pool.devolver(conn_estado)
+        if replica:
+            replicas.devolver(*replica)
+        elif conn is not None:
+            db_pool.devolver(conn)
+
+def buscar_exportacion_vigente(cur, fecha_inicio, fecha_fin, version, modo='pedidos'):
+    cur.execute('''
+        SELECT * FROM exportaciones
+        WHERE fecha_inicio = %s AND fecha_fin = %s AND modo = %s AND version_datos = %s
+          AND estado IN ('pendiente', 'procesando', 'listo')
+    ''', (fecha_inicio, fecha_fin, modo, version))
+    exportacion = cur.fetchone()
+    if exportacion and exportacion['estado'] == 'listo' and not os.path.exists(exportacion['archivo']):
+        expirar_exportacion(cur, exportacion)
+        return None
+    return exportacion
+
+def leer_modo_exportacion(valor):
+    return valor if valor in MODOS_EXPORTACION else 'pedidos'
+
+def nombre_exportacion(modo, fecha):
+    prefijo = 'analisis' if modo == 'analitico' else 'pedidos'
+    return f"{prefijo}_eterno_{fecha.strftime('%Y%m%d')}.xlsx"
+
+def estado_exportacion(exportacion):
+    return {
+        'id': exportacion['id'],
+        'estado': exportacion['estado'],
+        'progreso': exportacion['progreso'],
+        'total': exportacion['total'],
+        'error': exportacion['error'],
+        'url_estado': url_for('ver_exportacion', exportacion_id=exportacion['id']),
+        'url_descarga': url_for('descargar_exportacion', exportacion_id=exportacion['id']) if exportacion['estado'] == 'listo' else None
     }
-    
-    return render_template('dashboard.html', 
-                         pedidos=pedidos_procesados, 
-                         estadisticas=estadisticas,
-                         fecha_inicio=fecha_inicio,
-                         fecha_fin=fecha_fin)
 
 @app.route('/exportar-excel')
 @login_required
+@respuesta_condicional
 def exportar_excel():
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
-    from openpyxl.utils import get_column_letter
-    
     fecha_inicio = request.args.get('fecha_inicio', '')
     fecha_fin = request.args.get('fecha_fin', '')
+    modo = leer_modo_exportacion(request.args.get('modo'))
     
     conn = get_db_connection()
     cur = conn.cursor()
-    
-    query = 'SELECT * FROM pedidos'
-    params = []
-    
-    if fecha_inicio and fecha_fin:
-        query += ' WHERE fecha BETWEEN %s AND %s'
-        params = [fecha_inicio, fecha_fin]
-    elif fecha_inicio:
-        query += ' WHERE fecha >= %s'
-        params = [fecha_inicio]
-    elif fecha_fin:
-        query += ' WHERE fecha <= %s'
-        params = [fecha_fin]
-    
-    query += ' ORDER BY fecha DESC'
-    cur.execute(query, params)
-    pedidos = cur.fetchall()
+    version, _ = version_datos_pedidos(cur)
+    exportacion = buscar_exportacion_vigente(cur, fecha_inicio, fecha_fin, version, modo)
+    conn.commit()
     cur.close()
-    conn.close()
+    if exportacion and exportacion['estado'] == 'listo':
+        # Mismo período sin cambios: se sirve el archivo ya generado
+        return redirect(url_for('descargar_exportacion', exportacion_id=exportacion['id']))
     
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Pedidos"
+    # El archivo se arma en memoria sólo hasta EXPORT_SPOOL_BYTES; luego pasa a disco
+    archivo = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)
+    with fase('excel'):
+        # Una réplica sirve si ya tiene los datos de la versión que se acaba de consultar
+        generar_excel_pedidos(get_db_lectura(version), fecha_inicio, fecha_fin, archivo, modo=modo)
+    archivo.seek(0)
     
-    # Estilos
-    header_font = Font(bold=True, color="FFFFFF", size=11)
-    header_fill = PatternFill(start_color="000000", end_color="000000", fill_type="solid")
-    header_alignment = Alignment(horizontal="center", vertical="center")
-    
-    cell_alignment = Alignment(horizontal="center", vertical="center")
-    money_alignment = Alignment(horizontal="right", vertical="center")
-    
-    thin_border = Border(
-        left=Side(style='thin', color='CCCCCC'),
-        right=Side(style='thin', color='CCCCCC'),
-        top=Side(style='thin', color='CCCCCC'),
-        bottom=Side(style='thin', color='CCCCCC')
+    return send_file(
+        archivo,
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        as_attachment=True,
+        download_name=nombre_exportacion(modo, datetime.now())
     )
+
+@app.route('/exportaciones', methods=['POST'])
+@login_required
+def crear_exportacion():
+    fecha_inicio = request.form.get('fecha_inicio', '')
+    fecha_fin = request.form.get('fecha_fin', '')
+    modo = leer_modo_exportacion(request.form.get('modo'))
     
-    green_fill = PatternFill(start_color="E8F5E9", end_color="E8F5E9", fill_type="solid")
-    orange_fill = PatternFill(start_color="FFF3E0", end_color="FFF3E0", fill_type="solid")
-    red_fill = PatternFill(start_color="FFEBEE", end_color="FFEBEE", fill_type="solid")
-    
-    # Título
-    ws.merge_cells('A1:J1')
-    ws['A1'] = 'ETERNO by MK - Reporte de Pedidos'
-    ws['A1'].font = Font(bold=True, size=16)
-    ws['A1'].alignment = Alignment(horizontal="center")
-    
-    ws.merge_cells('A2:J2')
-    fecha_reporte = f"Generado: {datetime.now().strftime('%d/%m/%Y %H:%M')}"
-    if fecha_inicio and fecha_fin:
-        fecha_reporte += f" | Período: {fecha_inicio} a {fecha_fin}"
-    ws['A2'] = fecha_reporte
-    ws['A2'].alignment = Alignment(horizontal="center")
-    ws['A2'].font = Font(size=10, color="666666")
-    
-    # Headers
-    headers = ['Fecha', 'Cliente', 'Producto', 'Cant.', 'Total Venta', 'Anticipo', 'Saldo', 'Fecha Sesión', 'Costo', 'Utilidad']
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=4, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.alignment = header_alignment
-        cell.border = thin_border
-    
-    # Datos
-    row = 5
-    total_venta = 0
-    total_anticipo = 0
-    total_saldo = 0
-    total_costo = 0
-    total_utilidad = 0
-    
-    for pedido in pedidos:
-        try:
-            anticipo = float(pedido['anticipo']) if pedido.get('anticipo') else 0
-            totales = calcular_totales(
-                pedido['producto'],
-                pedido['cantidad'],
-                float(pedido['descuento']) if pedido['descuento'] else 0,
-                anticipo,
-                pedido.get('cuotas_visa_anticipo') or 0,
-                pedido.get('cuotas_visa_saldo') or 0
-            )
-            
-            ws.cell(row=row, column=1, value=pedido['fecha'].strftime('%d/%m/%Y') if pedido['fecha'] else '').alignment = cell_alignment
-            ws.cell(row=row, column=2, value=pedido['cliente'])
-            ws.cell(row=row, column=3, value=pedido['producto']).alignment = cell_alignment
-            ws.cell(row=row, column=4, value=pedido['cantidad']).alignment = cell_alignment
-            
-            cell_venta = ws.cell(row=row, column=5, value=totales['total_venta'])
-            cell_venta.number_format = '"Q"#,##0.00'
-            cell_venta.alignment = money_alignment
-            
-            cell_anticipo = ws.cell(row=row, column=6, value=anticipo)
-            cell_anticipo.number_format = '"Q"#,##0.00'
-            cell_anticipo.alignment = money_alignment
-            cell_anticipo.fill = green_fill
-            
-            cell_saldo = ws.cell(row=row, column=7, value=totales['saldo_restante'])
-            cell_saldo.number_format = '"Q"#,##0.00'
-            cell_saldo.alignment = money_alignment
-            cell_saldo.fill = orange_fill
-            
-            ws.cell(row=row, column=8, value=pedido['fecha_sesion'].strftime('%d/%m/%Y') if pedido.get('fecha_sesion') else '-').alignment = cell_alignment
-            
-            cell_costo = ws.cell(row=row, column=9, value=totales['costo_total'])
-            cell_costo.number_format = '"Q"#,##0.00'
-            cell_costo.alignment = money_alignment
-            cell_costo.fill = red_fill
-            
-            cell_utilidad = ws.cell(row=row, column=10, value=totales['utilidad'])
-            cell_utilidad.number_format = '"Q"#,##0.00'
-            cell_utilidad.alignment = money_alignment
-            
-            for col in range(1, 11):
-                ws.cell(row=row, column=col).border = thin_border
-            
-            total_venta += totales['total_venta']
-            total_anticipo += anticipo
-            total_saldo += totales['saldo_restante']
-            total_costo += totales['costo_total']
-            total_utilidad += totales['utilidad']
-            
-            row += 1
-        except:
-            continue
-    
-    # Totales
-    row += 1
-    ws.cell(row=row, column=4, value='TOTALES:').font = Font(bold=True)
-    
-    for col, val in [(5, total_venta), (6, total_anticipo), (7, total_saldo), (9, total_costo), (10, total_utilidad)]:
-        cell = ws.cell(row=row, column=col, value=val)
-        cell.number_format = '"Q"#,##0.00'
-        cell.font = Font(bold=True)
-        cell.alignment = money_alignment
-    
-    # Ajustar anchos
-    column_widths = [12, 25, 12, 8, 15, 15, 15, 14, 15, 15]
-    for i, width in enumerate(column_widths, 1):
-        ws.column_dimensions[get_column_letter(i)].width = width
+    conn = get_db_connection()
+    cur = conn.cursor()
+    version, _ = version_datos_pedidos(cur)
+    depurar_exportaciones(cur)
+    exportacion = buscar_exportacion_vigente(cur, fecha_inicio, fecha_fin, version, modo)
     
-    # Guardar
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
+    if exportacion is None:
+        condicion, params = filtro_fechas(fecha_inicio, fecha_fin)
+        cur.execute(f'SELECT COUNT(*) AS total FROM pedidos WHERE {condicion}', params)
+        total = cur.fetchone()['total']
+        cur.execute('''
+            INSERT INTO exportaciones (fecha_inicio, fecha_fin, modo, version_datos, total, usuario_id)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON CONFLICT (fecha_inicio, fecha_fin, modo, version_datos) WHERE estado IN ('pendiente', 'procesando', 'listo') DO NOTHING
+            RETURNING *
+        ''', (fecha_inicio, fecha_fin, modo, version, total, session['user_id']))
+        exportacion = cur.fetchone()
+        conn.commit()
+        if exportacion is None:
+            # Otro worker creó el mismo trabajo al mismo tiempo
+            exportacion = buscar_exportacion_vigente(cur, fecha_inicio, fecha_fin, version, modo)
+        else:
+            executor_exportaciones().submit(procesar_exportacion, exportacion['id'])
+    else:
+        conn.commit()
+    cur.close()
     
-    filename = f"pedidos_eterno_{datetime.now().strftime('%Y%m%d')}.xlsx"
+    return jsonify(estado_exportacion(exportacion)), 200 if exportacion['estado'] == 'listo' else 202
+
+@app.route('/exportaciones/<int:exportacion_id>')
+@login_required
+def ver_exportacion(exportacion_id):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute('SELECT * FROM exportaciones WHERE id = %s', (exportacion_id,))
+    exportacion = cur.fetchone()
+    cur.close()
+    if exportacion is None:
+        return jsonify({'error': 'Exportación no encontrada'}), 404
+    return jsonify(estado_exportacion(exportacion))
+
+@app.route('/exportaciones/<int:exportacion_id>/descargar')
+@login_required
+def descargar_exportacion(exportacion_id):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM exportaciones WHERE id = %s AND estado = 'listo'", (exportacion_id,))
+    exportacion = cur.fetchone()
+    cur.close()
+    if exportacion is None or not os.path.exists(exportacion['archivo']):
+        flash('La exportación ya no está disponible', 'error')
+        return redirect(url_for('dashboard'))
     
     return send_file(
-        output,
+        exportacion['archivo'],
         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
         as_attachment=True,
-        download_name=filename
+        download_name=nombre_exportacion(exportacion['modo'], exportacion['terminado'])
     )
 
+COLUMNAS_CSV = ['id', 'fecha', 'cliente', 'producto', 'cantidad', 'precio_unitario', 'descuento', 'total_venta',
+                'anticipo', 'saldo_restante', 'metodo_pago_anticipo', 'cuotas_visa_anticipo', 'fecha_sesion',
+                'metodo_pago_saldo', 'cuotas_visa_saldo', 'saldo_pagado', 'costo_produccion', 'costo_visa_anticipo',
+                'costo_visa_saldo', 'costo_total', 'utilidad', 'catalogo_version']
+
+def sql_exportacion_csv(cur, fecha_inicio, fecha_fin):
+    """COPY ... TO STDOUT con los pedidos del filtro y sus totales calculados en SQL (mismas reglas que el Excel)."""
+    condicion, params = filtro_fechas(fecha_inicio, fecha_fin)
+    ctes, params = sql_pedidos_calculados(condicion, params)
+    # COPY no acepta parámetros: se interpolan con mogrify
+    consulta = cur.mogrify(ctes + """
+        SELECT id, fecha, cliente, producto, cantidad, precio_unitario, descuento, total_venta,
+               anticipo_neto AS anticipo, saldo_restante, metodo_pago_anticipo, cuotas_visa_anticipo, fecha_sesion,
+               metodo_pago_saldo, cuotas_visa_saldo, saldo_pagado, costo_produccion, costo_visa_anticipo,
+               costo_visa_saldo, costo_produccion + costo_visa_anticipo + costo_visa_saldo AS costo_total,
+               total_venta - costo_produccion - costo_visa_anticipo - costo_visa_saldo AS utilidad, catalogo_version
+        FROM pedidos_calculados ORDER BY fecha DESC, id DESC
+    """, params).decode()
+    return f'COPY ({consulta}) TO STDOUT WITH (FORMAT csv, HEADER)'
+
+class CopiaCancelada(Exception):
+    pass
+
+class SalidaCopy:
+    """Archivo de sólo escritura para copy_expert: junta lo que entrega COPY en bloques y los pasa a una cola acotada.
+
+    Con `comprimir` los bloques salen en gzip. Si la descarga se cancela, la
+    siguiente escritura cancela la consulta en el servidor y corta el COPY.
+    """
+
+    def __init__(self, conn, comprimir=False, tamano=EXPORT_CSV_BLOQUE_BYTES):
+        self.conn = conn
+        self.cola = queue.Queue(EXPORT_CSV_COLA)
+        self.cancelada = threading.Event()
+        self.compresor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if comprimir else None
+        self.tamano = tamano
+        self._bloque = []
+        self._acumulado = 0
+
+    def write(self, datos):
+        if self.cancelada.is_set():
+            self.conn.cancel()
+            raise CopiaCancelada()
+        self._bloque.append(datos)
+        self._acumulado += len(datos)
+        if self._acumulado >= self.tamano:
+            self._enviar(b''.join(self._bloque))
+            self._bloque, self._acumulado = [], 0
+
+    def _enviar(self, datos):
+        if self.compresor:
+            datos = self.compresor.compress(datos)
+        if datos and not self.poner(datos):
+            self.conn.cancel()
+            raise CopiaCancelada()
+
+    def poner(self, datos):
+        """Encola `datos` esperando al cliente; False si la descarga se canceló mientras tanto."""
+        while not self.cancelada.is_set():
+            try:
+                self.cola.put(datos, timeout=1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def terminar(self):
+        self._enviar(b''.join(self._bloque))
+        if self.compresor:
+            self.poner(self.compresor.flush())
+        self.poner(None)
+
+class CopiaEnBloques:
+    """Bytes de un COPY ... TO STDOUT a medida que la base los produce (iterable de una respuesta WSGI).
+
+    copy_expert sólo sabe escribir en un archivo, así que corre en un hilo aparte
+    y los bloques llegan por la cola de SalidaCopy. El servidor llama close() al
+    terminar la respuesta, aunque el cliente haya cortado: eso cancela el COPY.
+    `liberar(conn)` se llama en el hilo de la copia cuando termina o se cancela.
+    """
+
+    def __init__(self, conn, sql, comprimir=False, liberar=None):
+        self.conn = conn
+        self.sql = sql
+        self.liberar = liberar
+        self.salida = SalidaCopy(conn, comprimir)
+        self.error = None
+        threading.Thread(target=self._copiar, name='copia-csv', daemon=True).start()
+
+    def _copiar(self):
+        try:
+            cur = self.conn.cursor()
+            cur.copy_expert(self.sql, self.salida)
+            cur.close()
+            self.conn.rollback()
+            self.salida.terminar()
+        except CopiaCancelada:
+            self.conn.rollback()
+        except Exception as e:
+            self.error = e
+            self.salida.poner(None)
+        finally:
+            if self.liberar:
+                self.liberar(self.conn)
+
+    def __iter__(self):
+        while True:
+            bloque = self.salida.cola.get()
+            if bloque is None:
+                break
+            yield bloque
+        if self.error:
+            raise self.error
+
+    def close(self):
+        self.salida.cancelada.set()
+
+@app.route('/exportar-csv')
+@login_required
+@respuesta_condicional
+def exportar_csv():
+    """Pedidos del filtro con sus totales en CSV, para la contabilidad y scripts.
+
+    Lo genera la base con COPY (los montos salen de sql_pedidos_calculados) y
+    se envía en bloques mientras se produce, sin armar el archivo en memoria.
+    Con ?gzip=1 se descarga comprimido (.csv.gz).
+    """
+    fecha_inicio = request.args.get('fecha_inicio', '')
+    fecha_fin = request.args.get('fecha_fin', '')
+    comprimir = request.args.get('gzip') == '1'
+    
+    # El COPY sigue corriendo después de que la petición devuelve la respuesta:
+    # usa su propia conexión y la devuelve el hilo que copia
+    replica = None
+    if replicas and session.get('primario_hasta', 0) <= time.time():
+        replica = replicas.obtener()
+    if replica:
+        conn = replica[1]
+        liberar = lambda c: replicas.devolver(replica[0], c)
+    else:
+        conn = db_pool.obtener()
+        liberar = db_pool.devolver
+    try:
+        cur = conn.cursor()
+        sql = sql_exportacion_csv(cur, fecha_inicio, fecha_fin)
+        cur.close()
+    except Exception:
+        liberar(conn)
+        raise
+    
+    nombre = f"pedidos_eterno_{datetime.now().strftime('%Y%m%d')}.csv" + ('.gz' if comprimir else '')
+    return Response(CopiaEnBloques(conn, sql, comprimir, liberar),
+                    mimetype='application/gzip' if comprimir else 'text/csv',
+                    headers={'Content-Disposition': f'attachment; filename={nombre}', 'X-Accel-Buffering': 'no'})
+
 @app.route('/nuevo-pedido', methods=['GET', 'POST'])
 @login_required
 def nuevo_pedido():
@@ -512,25 +2910,31 @@ def nuevo_pedido():
         metodo_pago_saldo = request.form.get('metodo_pago_saldo', '')
         cuotas_visa_saldo = int(request.form.get('cuotas_visa_saldo', 0))
         
-        precio_unitario = PRODUCTOS_CONFIG[producto]['precio']
+        catalogo = catalogo_vigente()
+        precio_unitario = catalogo['productos'][producto]['precio']
         
         conn = get_db_connection()
         cur = conn.cursor()
+        asegurar_particiones(cur, [date.fromisoformat(fecha)])
         cur.execute('''
-            INSERT INTO pedidos (fecha, cliente, producto, cantidad, precio_unitario, descuento, anticipo, metodo_pago_anticipo, cuotas_visa_anticipo, fecha_sesion, metodo_pago_saldo, cuotas_visa_saldo, usuario_id)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ''', (fecha, cliente, producto, cantidad, precio_unitario, descuento, anticipo, metodo_pago_anticipo, cuotas_visa_anticipo, fecha_sesion, metodo_pago_saldo, cuotas_visa_saldo, session['user_id']))
+            INSERT INTO pedidos (fecha, cliente, producto, cantidad, precio_unitario, descuento, anticipo, metodo_pago_anticipo, cuotas_visa_anticipo, fecha_sesion, metodo_pago_saldo, cuotas_visa_saldo, usuario_id, catalogo_version)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            RETURNING id
+        ''', (fecha, cliente, producto, cantidad, precio_unitario, descuento, anticipo, metodo_pago_anticipo, cuotas_visa_anticipo, fecha_sesion, metodo_pago_saldo, cuotas_visa_saldo, session['user_id'], catalogo['version']))
+        pedido_id = cur.fetchone()['id']
+        actualizar_resumen_diario(cur, 'p.id = %s', [pedido_id], 1)
+        publicar_cambios(cur, {}, pedidos_para_evento(cur, [pedido_id]))
         conn.commit()
         cur.close()
-        conn.close()
         
         flash('Pedido registrado exitosamente', 'success')
         return redirect(url_for('dashboard'))
     
+    catalogo = catalogo_vigente()
     return render_template('nuevo_pedido.html', 
-                         productos=PRODUCTOS_CONFIG, 
-                         costos_visa=COSTOS_VISA,
-                         metodos_pago=METODOS_PAGO)
+                         productos=catalogo['productos'], 
+                         costos_visa=catalogo['costos_visa'],
+                         metodos_pago=catalogo['metodos_pago'])
 
 @app.route('/editar-pedido/<int:pedido_id>', methods=['GET', 'POST'])
 @login_required
@@ -550,14 +2954,25 @@ def editar_pedido(pedido_id):
         fecha_sesion = request.form.get('fecha_sesion') or None
         metodo_pago_saldo = request.form.get('metodo_pago_saldo', '')
         cuotas_visa_saldo = int(request.form.get('cuotas_visa_saldo', 0))
-        precio_unitario = PRODUCTOS_CONFIG[producto]['precio']
         
+        # El pedido conserva la versión del catálogo con la que se cotizó
+        cur.execute('SELECT catalogo_version FROM pedidos WHERE id = %s FOR UPDATE', (pedido_id,))
+        existente = cur.fetchone()
+        if existente is None:
+            cur.close()
+            flash('El pedido no existe', 'error')
+            return redirect(url_for('dashboard'))
+        precio_unitario = catalogo_de(existente)['productos'][producto]['precio']
+        asegurar_particiones(cur, [date.fromisoformat(fecha)])
+        antes = pedidos_para_evento(cur, [pedido_id])
+        actualizar_resumen_diario(cur, 'p.id = %s', [pedido_id], -1)
         cur.execute('''
             UPDATE pedidos SET fecha=%s, cliente=%s, producto=%s, cantidad=%s, precio_unitario=%s, descuento=%s, anticipo=%s, metodo_pago_anticipo=%s, cuotas_visa_anticipo=%s, fecha_sesion=%s, metodo_pago_saldo=%s, cuotas_visa_saldo=%s WHERE id=%s
         ''', (fecha, cliente, producto, cantidad, precio_unitario, descuento, anticipo, metodo_pago_anticipo, cuotas_visa_anticipo, fecha_sesion, metodo_pago_saldo, cuotas_visa_saldo, pedido_id))
+        actualizar_resumen_diario(cur, 'p.id = %s', [pedido_id], 1)
+        publicar_cambios(cur, antes, pedidos_para_evento(cur, [pedido_id]))
         conn.commit()
         cur.close()
-        conn.close()
         
         flash('Pedido actualizado', 'success')
         return redirect(url_for('dashboard'))
@@ -565,35 +2980,334 @@ def editar_pedido(pedido_id):
     cur.execute('SELECT * FROM pedidos WHERE id = %s', (pedido_id,))
     pedido = cur.fetchone()
     cur.close()
-    conn.close()
+    if pedido is None:
+        flash('El pedido no existe', 'error')
+        return redirect(url_for('dashboard'))
     
+    catalogo = catalogo_de(pedido)
     return render_template('editar_pedido.html', 
                          pedido=pedido, 
-                         productos=PRODUCTOS_CONFIG, 
-                         costos_visa=COSTOS_VISA,
-                         metodos_pago=METODOS_PAGO)
+                         productos=catalogo['productos'], 
+                         costos_visa=catalogo['costos_visa'],
+                         metodos_pago=catalogo['metodos_pago'])
 
 @app.route('/eliminar-pedido/<int:pedido_id>')
 @login_required
 def eliminar_pedido(pedido_id):
     conn = get_db_connection()
     cur = conn.cursor()
+    cur.execute('SELECT id FROM pedidos WHERE id = %s FOR UPDATE', (pedido_id,))
+    antes = pedidos_para_evento(cur, [pedido_id])
+    actualizar_resumen_diario(cur, 'p.id = %s', [pedido_id], -1)
     cur.execute('DELETE FROM pedidos WHERE id = %s', (pedido_id,))
+    publicar_cambios(cur, antes, {})
     conn.commit()
     cur.close()
-    conn.close()
+    leer_del_primario()
     flash('Pedido eliminado', 'success')
     return redirect(url_for('dashboard'))
 
+@app.route('/saldos-pendientes')
+@login_required
+def saldos_pendientes():
+    """Pedidos con saldo por cobrar, por fecha de sesión (las sesiones sin fecha al final)."""
+    cur = get_db_lectura().cursor()
+    sql, params = sql_pedidos_calculados('NOT p.saldo_pagado')
+    # Recorre idx_pedidos_saldo_pendiente: sólo pedidos no pagados, ya en orden
+    cur.execute(sql + '''
+        SELECT id, cliente, producto, fecha_sesion, metodo_pago_saldo, cuotas_visa_saldo, saldo_restante
+        FROM pedidos_calculados
+        WHERE saldo_restante > 0
+        ORDER BY fecha_sesion, id
+    ''', params)
+    pedidos = cur.fetchall()
+    cur.close()
+    
+    catalogo = catalogo_vigente()
+    return render_template('saldos_pendientes.html',
+                         pedidos=pedidos,
+                         metodos_pago=catalogo['metodos_pago'],
+                         costos_visa=catalogo['costos_visa'])
+
+@app.route('/saldos-pendientes/pagados', methods=['POST'])
+@login_required
+def marcar_saldo_pagado():
+    """Marca como pagados los saldos seleccionados (o el de la fila cuyo botón se usó) en un solo UPDATE."""
+    if request.form.get('pedido_id'):
+        ids = [request.form['pedido_id']]
+    else:
+        ids = request.form.getlist('pedidos')
+    
+    catalogo = catalogo_vigente()
+    pagos = []
+    for pedido_id in ids:
+        try:
+            pedido_id = int(pedido_id)
+            cuotas = int(request.form.get(f'cuotas_visa_saldo_{pedido_id}', 0))
+        except ValueError:
+            continue
+        metodo = request.form.get(f'metodo_pago_saldo_{pedido_id}', '')
+        if metodo not in catalogo['metodos_pago'] or (cuotas and cuotas not in catalogo['costos_visa']):
+            flash(f'Método de pago o cuotas inválidos para el pedido {pedido_id}', 'error')
+            return redirect(url_for('saldos_pendientes'))
+        pagos.append((pedido_id, metodo, cuotas))
+    if not pagos:
+        flash('Selecciona al menos un saldo', 'warning')
+        return redirect(url_for('saldos_pendientes'))
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    ids = [pago[0] for pago in pagos]
+    cur.execute('SELECT id FROM pedidos WHERE id = ANY(%s) AND NOT saldo_pagado FOR UPDATE', (ids,))
+    ids = [fila['id'] for fila in cur.fetchall()]
+    antes = pedidos_para_evento(cur, ids) if len(ids) <= EVENTOS_MAX_PEDIDOS else None
+    # Las cuotas del saldo cambian su costo Visa: se resta y se vuelve a sumar al resumen
+    actualizar_resumen_diario(cur, 'p.id = ANY(%s)', [ids], -1)
+    execute_values(cur, '''
+        UPDATE pedidos p
+        SET saldo_pagado = TRUE, fecha_pago_saldo = CURRENT_TIMESTAMP,
+            metodo_pago_saldo = v.metodo, cuotas_visa_saldo = v.cuotas
+        FROM (VALUES %s) AS v (id, metodo, cuotas)
+        WHERE p.id = v.id AND NOT p.saldo_pagado
+    ''', pagos, page_size=len(pagos))
+    actualizar_resumen_diario(cur, 'p.id = ANY(%s)', [ids], 1)
+    if antes is None:
+        publicar_evento(cur, 'recargar')
+    else:
+        publicar_cambios(cur, antes, pedidos_para_evento(cur, ids))
+    conn.commit()
+    cur.close()
+    
+    flash(f'{len(ids)} saldo(s) marcados como pagados', 'success')
+    return redirect(url_for('saldos_pendientes'))
+
+# Columnas del archivo de importación: los mismos nombres que el formulario de nuevo pedido
+COLUMNAS_IMPORTACION = ['fecha', 'cliente', 'producto', 'cantidad', 'descuento', 'anticipo',
+                        'metodo_pago_anticipo', 'cuotas_visa_anticipo', 'fecha_sesion',
+                        'metodo_pago_saldo', 'cuotas_visa_saldo']
+COLUMNAS_IMPORTACION_REQUERIDAS = ['fecha', 'cliente', 'producto', 'cantidad']
+
+def _encabezado(valor):
+    return str(valor or '').strip().lower().replace(' ', '_')
+
+def leer_filas_csv(archivo):
+    """Filas de un CSV como (número de fila, dict); detecta `,` o `;` como separador."""
+    texto = io.TextIOWrapper(archivo, encoding='utf-8-sig', newline='')
+    muestra = texto.read(4096)
+    texto.seek(0)
+    try:
+        dialecto = csv.Sniffer().sniff(muestra, delimiters=',;\t')
+    except csv.Error:
+        dialecto = csv.excel
+    lector = csv.reader(texto, dialecto)
+    encabezados = [_encabezado(c) for c in next(lector, [])]
+    for numero, valores in enumerate(lector, start=2):
+        if any(v.strip() for v in valores):
+            yield numero, dict(zip(encabezados, valores))
+
+def leer_filas_xlsx(archivo):
+    """Filas de la primera hoja de un XLSX en modo read-only (no carga el libro completo)."""
+    from openpyxl import load_workbook
+    from openpyxl.utils.exceptions import InvalidFileException
+    try:
+        libro = load_workbook(archivo, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, InvalidFileException) as e:
+        raise ValueError('no es un archivo XLSX válido') from e
+    try:
+        filas = libro.worksheets[0].iter_rows(values_only=True)
+        encabezados = [_encabezado(c) for c in next(filas, [])]
+        for numero, valores in enumerate(filas, start=2):
+            if any(v not in (None, '') for v in valores):
+                yield numero, dict(zip(encabezados, valores))
+    finally:
+        libro.close()
+
+def leer_filas_importacion(archivo, nombre):
+    if nombre.lower().endswith('.xlsx'):
+        return leer_filas_xlsx(archivo)
+    return leer_filas_csv(archivo)
+
+def _texto(valor):
+    return '' if valor is None else str(valor).strip()
+
+def _fecha_importada(valor):
+    if isinstance(valor, datetime):
+        return valor.date()
+    if hasattr(valor, 'isoformat'):
+        return valor
+    texto = _texto(valor)
+    for formato in ('%Y-%m-%d', '%d/%m/%Y'):
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            pass
+    raise ValueError(texto)
+
+def _numero_importado(valor, defecto=0):
+    texto = _texto(valor).replace('Q', '').replace(',', '').strip()
+    return float(texto) if texto else defecto
+
+def _entero_importado(valor):
+    # Excel guarda los enteros como 2.0; 1.5 es un error, no se trunca
+    numero = _numero_importado(valor)
+    if not float(numero).is_integer():
+        raise ValueError(valor)
+    return int(numero)
+
+def validar_fila_importacion(fila, catalogo):
+    """Convierte una fila del archivo a los valores de pedidos; devuelve (valores, errores)."""
+    errores = []
+    
+    def campo(nombre, conversion, defecto=None):
+        valor = fila.get(nombre)
+        if _texto(valor) == '':
+            if nombre in COLUMNAS_IMPORTACION_REQUERIDAS:
+                errores.append(f'{nombre}: requerido')
+            return defecto
+        try:
+            return conversion(valor)
+        except (TypeError, ValueError):
+            errores.append(f'{nombre}: valor inválido "{_texto(valor)}"')
+            return defecto
+    
+    fecha = campo('fecha', _fecha_importada)
+    cliente = _texto(fila.get('cliente'))
+    if not cliente:
+        errores.append('cliente: requerido')
+    elif len(cliente) > 100:
+        errores.append('cliente: máximo 100 caracteres')
+    producto = _texto(fila.get('producto'))
+    if producto and producto not in catalogo['productos']:
+        errores.append(f'producto: "{producto}" no está en el catálogo')
+    elif not producto:
+        errores.append('producto: requerido')
+    cantidad = campo('cantidad', _entero_importado)
+    if cantidad is not None and cantidad < 1:
+        errores.append('cantidad: debe ser mayor que cero')
+    descuento = campo('descuento', _numero_importado, 0)
+    if not 0 <= descuento <= 100:
+        errores.append('descuento: debe estar entre 0 y 100 (%)')
+    anticipo = campo('anticipo', _numero_importado, 0)
+    if anticipo < 0:
+        errores.append('anticipo: no puede ser negativo')
+    fecha_sesion = campo('fecha_sesion', _fecha_importada)
+    
+    metodo_pago_anticipo = _texto(fila.get('metodo_pago_anticipo'))
+    if metodo_pago_anticipo and metodo_pago_anticipo not in catalogo['metodos_pago']:
+        errores.append(f'metodo_pago_anticipo: "{metodo_pago_anticipo}" no es un método de pago')
+    metodo_pago_saldo = _texto(fila.get('metodo_pago_saldo')) or 'Pendiente'
+    if metodo_pago_saldo != 'Pendiente' and metodo_pago_saldo not in catalogo['metodos_pago']:
+        errores.append(f'metodo_pago_saldo: "{metodo_pago_saldo}" no es un método de pago')
+    cuotas = {}
+    for nombre in ('cuotas_visa_anticipo', 'cuotas_visa_saldo'):
+        cuotas[nombre] = campo(nombre, _entero_importado, 0)
+        if cuotas[nombre] and cuotas[nombre] not in catalogo['costos_visa']:
+            errores.append(f'{nombre}: {cuotas[nombre]} cuotas no está en la tabla Visa')
+    
+    if errores:
+        return None, errores
+    return (fecha, cliente, producto, cantidad, catalogo['productos'][producto]['precio'], descuento / 100,
+            anticipo, metodo_pago_anticipo, cuotas['cuotas_visa_anticipo'], fecha_sesion,
+            metodo_pago_saldo, cuotas['cuotas_visa_saldo']), []
+
+def importar_pedidos(cur, filas, catalogo, usuario_id=None, simular=False):
+    """Valida e inserta pedidos por lotes de IMPORT_LOTE con execute_values.
+
+    No confirma la transacción: el llamador hace commit o rollback según el
+    reporte. Con `simular` sólo valida. Devuelve el reporte por fila.
+    """
+    inicio = time.perf_counter()
+    reporte = {'filas': 0, 'validas': 0, 'importadas': 0, 'errores': [], 'simulacion': simular}
+    lote, ids = [], []
+    cur.execute('SELECT anio FROM pedidos_archivados')
+    archivados = {fila['anio'] for fila in cur.fetchall()}
+    
+    def insertar():
+        asegurar_particiones(cur, [valores[0] for valores in lote])
+        ids.extend(fila['id'] for fila in execute_values(cur, '''
+            INSERT INTO pedidos (fecha, cliente, producto, cantidad, precio_unitario, descuento, anticipo,
+                                 metodo_pago_anticipo, cuotas_visa_anticipo, fecha_sesion, metodo_pago_saldo,
+                                 cuotas_visa_saldo, usuario_id, catalogo_version)
+            VALUES %s RETURNING id
+        ''', lote, page_size=IMPORT_LOTE, fetch=True))
+        lote.clear()
+    
+    for numero, fila in filas:
+        reporte['filas'] += 1
+        if reporte['filas'] == 1:
+            faltantes = [c for c in COLUMNAS_IMPORTACION_REQUERIDAS if c not in fila]
+            if faltantes:
+                reporte['errores'].append({'fila': 1, 'errores': [f"faltan columnas: {', '.join(faltantes)}"]})
+                break
+        valores, errores = validar_fila_importacion(fila, catalogo)
+        if not errores and valores[0].year in archivados:
+            errores = [f'fecha: el año {valores[0].year} está archivado']
+        if errores:
+            reporte['errores'].append({'fila': numero, 'errores': errores})
+            continue
+        reporte['validas'] += 1
+        if not simular:
+            lote.append(valores + (usuario_id, catalogo['version']))
+            if len(lote) >= IMPORT_LOTE:
+                insertar()
+    if lote:
+        insertar()
+    
+    if ids:
+        actualizar_resumen_diario(cur, 'p.id = ANY(%s)', [ids], 1)
+        publicar_evento(cur, 'recargar')
+    reporte['importadas'] = len(ids)
+    reporte['segundos'] = time.perf_counter() - inicio
+    reporte['filas_por_segundo'] = reporte['filas'] / reporte['segundos'] if reporte['segundos'] else 0
+    return reporte
+
+def terminar_importacion(conn, reporte, omitir_invalidas=False):
+    """Confirma la importación salvo en simulación o si hay errores y no se pidió omitir esas filas."""
+    if reporte['simulacion'] or (reporte['errores'] and not omitir_invalidas) or not reporte['validas']:
+        conn.rollback()
+        reporte['importadas'] = 0
+    else:
+        conn.commit()
+    return reporte
+
+@app.route('/importar-pedidos', methods=['GET', 'POST'])
+@admin_required
+def importar_pedidos_archivo():
+    reporte = None
+    if request.method == 'POST':
+        archivo = request.files.get('archivo')
+        if not archivo or not archivo.filename:
+            flash('Selecciona un archivo CSV o XLSX', 'error')
+            return redirect(url_for('importar_pedidos_archivo'))
+        
+        conn = get_db_connection()
+        cur = conn.cursor()
+        try:
+            filas = leer_filas_importacion(archivo.stream, archivo.filename)
+            reporte = importar_pedidos(cur, filas, catalogo_vigente(), session['user_id'],
+                                       simular='simular' in request.form)
+        except (csv.Error, UnicodeDecodeError, ValueError, KeyError, OSError) as e:
+            # Archivo ilegible (p. ej. XLSX dañado o CSV que no es UTF-8)
+            conn.rollback()
+            cur.close()
+            flash(f'No se pudo leer el archivo: {e}', 'error')
+            return redirect(url_for('importar_pedidos_archivo'))
+        cur.close()
+        terminar_importacion(conn, reporte, 'omitir_invalidas' in request.form)
+        if reporte['importadas']:
+            flash(f"{reporte['importadas']} pedidos importados", 'success')
+    
+    return render_template('importar_pedidos.html', reporte=reporte, columnas=COLUMNAS_IMPORTACION,
+                           max_errores=IMPORT_MAX_ERRORES_MOSTRADOS)
+
 @app.route('/usuarios')
 @admin_required
 def usuarios():
-    conn = get_db_connection()
+    conn = get_db_lectura()
     cur = conn.cursor()
     cur.execute('SELECT * FROM usuarios ORDER BY id')
     users = cur.fetchall()
     cur.close()
-    conn.close()
     return render_template('usuarios.html', usuarios=users)
 
 @app.route('/usuarios/nuevo', methods=['GET', 'POST'])
@@ -604,7 +3318,7 @@ def nuevo_usuario():
         password = request.form['password']
         nombre = request.form['nombre']
         rol = request.form.get('rol', 'usuario')
-        hashed_password = generate_password_hash(password)
+        hashed_password = hashear_password(password)
         
         conn = get_db_connection()
         cur = conn.cursor()
@@ -616,7 +3330,6 @@ def nuevo_usuario():
         except:
             flash('El usuario ya existe', 'error')
         cur.close()
-        conn.close()
         return redirect(url_for('usuarios'))
     
     return render_template('nuevo_usuario.html')
@@ -634,14 +3347,12 @@ def editar_usuario(id):
         cur.execute('UPDATE usuarios SET nombre=%s, rol=%s, activo=%s WHERE id=%s', (nombre, rol, activo, id))
         conn.commit()
         cur.close()
-        conn.close()
         flash('Usuario actualizado', 'success')
         return redirect(url_for('usuarios'))
     
     cur.execute('SELECT * FROM usuarios WHERE id = %s', (id,))
     usuario = cur.fetchone()
     cur.close()
-    conn.close()
     return render_template('editar_usuario.html', usuario=usuario)
 
 @app.route('/usuarios/eliminar/<int:id>')
@@ -655,12 +3366,30 @@ def eliminar_usuario(id):
     cur.execute('DELETE FROM usuarios WHERE id = %s', (id,))
     conn.commit()
     cur.close()
-    conn.close()
     flash('Usuario eliminado', 'success')
     return redirect(url_for('usuarios'))
 
+@app.route('/metrics')
+def metricas_prometheus():
+    """Histogramas por ruta en formato Prometheus; con METRICS_TOKEN se accede con `Authorization: Bearer`."""
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not (METRICS_TOKEN and hmac.compare_digest(token, METRICS_TOKEN)) and session.get('rol') != 'admin':
+        return Response('No autorizado\n', status=401, mimetype='text/plain')
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registro = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+    else:
+        registro = REGISTRY
+    return Response(generate_latest(registro), mimetype=CONTENT_TYPE_LATEST)
+
+@app.route('/admin/pool')
+@admin_required
+def estadisticas_pool():
+    return jsonify(dict(db_pool.estadisticas(), replicas=replicas.estadisticas(), eventos=eventos_pedidos.estadisticas()))
+
 @app.route('/cambiar-contrasena', methods=['GET', 'POST'])
 @login_required
+@limiter.limit(LOGIN_LIMITE_USUARIO, key_func=usuario_de_la_sesion, methods=['POST'])
 def cambiar_contrasena():
     if request.method == 'POST':
         actual = request.form['password_actual']
@@ -676,21 +3405,407 @@ def cambiar_contrasena():
         cur.execute('SELECT password FROM usuarios WHERE id = %s', (session['user_id'],))
         user = cur.fetchone()
         
-        if not check_password_hash(user['password'], actual):
+        if not verificar_password(user['password'], actual):
             flash('Contraseña actual incorrecta', 'error')
             cur.close()
-            conn.close()
             return redirect(url_for('cambiar_contrasena'))
         
-        hashed = generate_password_hash(nueva)
+        hashed = hashear_password(nueva)
         cur.execute('UPDATE usuarios SET password = %s WHERE id = %s', (hashed, session['user_id']))
         conn.commit()
         cur.close()
-        conn.close()
         flash('Contraseña actualizada', 'success')
         return redirect(url_for('dashboard'))
     
     return render_template('cambiar_contrasena.html')
 
+@app.cli.command('verificar-estadisticas')
+@click.option('--fecha-inicio', default='')
+@click.option('--fecha-fin', default='')
+def verificar_estadisticas(fecha_inicio, fecha_fin):
+    """Compara las estadísticas calculadas en SQL con el ciclo de calcular_totales."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    sql = calcular_estadisticas(cur, fecha_inicio, fecha_fin, archivados=False)
+    condicion, params = filtro_fechas(fecha_inicio, fecha_fin)
+    cur.execute(f'SELECT * FROM pedidos WHERE {condicion}', params)
+    python = calcular_estadisticas_python(cur.fetchall())
+    cur.close()
+    
+    diferencias = [k for k in python if abs(python[k] - sql[k]) > 0.005]
+    for k in python:
+        marca = 'DIFERENTE' if k in diferencias else 'ok'
+        click.echo(f'{k:28} {python[k]:>16,.4f} {sql[k]:>16,.4f}  {marca}')
+    if diferencias:
+        raise SystemExit(1)
+
+@app.cli.command('reconstruir-resumen')
+def reconstruir_resumen():
+    """Recalcula pedidos_resumen_diario desde la tabla pedidos."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    reconstruir_resumen_diario(cur)
+    marcar_pedidos_modificados(cur)
+    conn.commit()
+    cur.execute('SELECT COUNT(*) AS filas FROM pedidos_resumen_diario')
+    click.echo(f"Resumen reconstruido: {cur.fetchone()['filas']} filas (fecha, producto)")
+    cur.close()
+
+@app.cli.command('verificar-resumen')
+def verificar_resumen():
+    """Compara pedidos_resumen_diario contra los pedidos; termina con error si hay diferencias."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    diferencias = diferencias_resumen_diario(cur)
+    cur.close()
+    for fila in diferencias:
+        click.echo(f"{fila['fecha']} {fila['producto']}: " + ', '.join(
+            f"{c} {fila['resumen_' + c]} != {fila['calculado_' + c]}" for c in COLUMNAS_RESUMEN
+            if fila['resumen_' + c] != fila['calculado_' + c]))
+    if diferencias:
+        raise SystemExit(1)
+    click.echo('Resumen diario consistente')
+
+@app.cli.command('importar-pedidos')
+@click.argument('archivo', type=click.Path(exists=True, dir_okay=False))
+@click.option('--simular', is_flag=True, help='Sólo valida, no inserta.')
+@click.option('--omitir-invalidas', is_flag=True, help='Importa las filas válidas aunque otras tengan errores.')
+def importar_pedidos_cli(archivo, simular, omitir_invalidas):
+    """Importa pedidos históricos desde un CSV o XLSX."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    with open(archivo, 'rb') as contenido:
+        reporte = importar_pedidos(cur, leer_filas_importacion(contenido, archivo), catalogo_vigente(), simular=simular)
+    cur.close()
+    terminar_importacion(conn, reporte, omitir_invalidas)
+    for error in reporte['errores']:
+        click.echo(f"Fila {error['fila']}: {'; '.join(error['errores'])}")
+    click.echo(f"{reporte['filas']} filas, {reporte['validas']} válidas, {reporte['importadas']} importadas "
+               f"({reporte['filas_por_segundo']:,.0f} filas/s)")
+    if reporte['errores'] and not omitir_invalidas:
+        raise SystemExit(1)
+
+@app.cli.group('catalogo')
+def catalogo_cli():
+    """Consulta y publica versiones del catálogo de productos y tasas Visa."""
+
+@catalogo_cli.command('mostrar')
+@click.option('--version', type=int, default=None)
+def catalogo_mostrar(version):
+    """Imprime el catálogo (vigente o la versión indicada) como JSON."""
+    catalogo = catalogo_cache.version(version) if version else catalogo_vigente()
+    click.echo(json.dumps(catalogo, ensure_ascii=False, indent=2))
+
+@catalogo_cli.command('publicar')
+@click.argument('archivo', type=click.File('r', encoding='utf-8'))
+@click.option('--descripcion', default='')
+def catalogo_publicar(archivo, descripcion):
+    """Publica una nueva versión desde un JSON con productos, costos_visa y metodos_pago."""
+    datos = json.load(archivo)
+    conn = get_db_connection()
+    cur = conn.cursor()
+    version = publicar_catalogo(cur, datos['productos'], datos['costos_visa'], datos['metodos_pago'], descripcion)
+    conn.commit()
+    cur.close()
+    click.echo(f'Catálogo versión {version} publicado')
+
+URL_CSS = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+def nombre_con_hash(ruta, contenido):
+    base, extension = os.path.splitext(ruta)
+    return f'{base}.{hashlib.sha256(contenido).hexdigest()[:12]}{extension}'
+
+def reescribir_urls_css(texto, ruta_css, archivos):
+    """Apunta los url() relativos de un CSS (fuentes, imágenes) a sus copias con hash."""
+    carpeta = os.path.dirname(ruta_css)
+
+    def reemplazar(m):
+        url = m.group(2).strip()
+        if url.startswith(('data:', 'http:', 'https:', '//', '/', '#')):
+            return m.group(0)
+        destino = os.path.normpath(os.path.join(carpeta, re.split(r'[?#]', url)[0])).replace(os.sep, '/')
+        if destino not in archivos:
+            return m.group(0)
+        return 'url("{}")'.format(os.path.relpath(archivos[destino], carpeta).replace(os.sep, '/'))
+    return URL_CSS.sub(reemplazar, texto)
+
+def variantes_de_imagen(contenido, extension_original):
+    """Versiones AVIF/WebP de una imagen (y el PNG recomprimido); sólo las que pesan menos que el original."""
+    from PIL import Image, features
+
+    imagen = Image.open(io.BytesIO(contenido))
+    formatos = [('WEBP', '.webp', 'image/webp', {'quality': 85, 'method': 6})]
+    if extension_original == '.png':
+        formatos.append(('PNG', '.png', 'image/png', {'optimize': True}))
+    if features.check('avif'):
+        formatos.append(('AVIF', '.avif', 'image/avif', {'quality': 60}))
+    for formato, extension, tipo, opciones in formatos:
+        salida = io.BytesIO()
+        imagen.save(salida, formato, **opciones)
+        if len(salida.getvalue()) < len(contenido):
+            yield extension, tipo, salida.getvalue()
+
+def escribir_asset(dist, ruta, contenido):
+    """Escribe un archivo de dist y sus .gz/.br si comprimen; devuelve los tamaños escritos."""
+    import brotli
+
+    destino = os.path.join(dist, ruta)
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    with open(destino, 'wb') as archivo:
+        archivo.write(contenido)
+    tamanos = {'bytes': len(contenido)}
+    if ruta.endswith(ASSETS_COMPRIMIBLES):
+        for extension, comprimido in (('.gz', gzip.compress(contenido, 9, mtime=0)),
+                                      ('.br', brotli.compress(contenido, quality=11))):
+            if len(comprimido) < len(contenido) * 0.9:
+                with open(destino + extension, 'wb') as archivo:
+                    archivo.write(comprimido)
+                tamanos[extension] = len(comprimido)
+    return tamanos
+
+def construir_assets(limpiar=False):
+    """Copia static/ a static/dist con el hash del contenido en el nombre y escribe el manifiesto.
+
+    Los archivos anteriores se conservan (salvo con `limpiar`): durante un despliegue
+    gradual el HTML viejo todavía los pide. Devuelve [(ruta, ruta con hash, tamaños)].
+    """
+    dist = os.path.join(app.static_folder, ASSETS_DIST)
+    if limpiar:
+        shutil.rmtree(dist, ignore_errors=True)
+    rutas = []
+    for carpeta, subcarpetas, archivos in os.walk(app.static_folder):
+        if os.path.samefile(carpeta, app.static_folder):
+            subcarpetas[:] = [s for s in subcarpetas if s != ASSETS_DIST]
+        rutas.extend(os.path.relpath(os.path.join(carpeta, a), app.static_folder).replace(os.sep, '/') for a in archivos)
+
+    manifiesto = {'archivos': {}, 'variantes': {}}
+    reporte = []
+    # Los CSS al final: sus url() apuntan a las fuentes e imágenes ya copiadas
+    for ruta in sorted(rutas, key=lambda r: (r.endswith('.css'), r)):
+        with open(os.path.join(app.static_folder, ruta), 'rb') as archivo:
+            contenido = archivo.read()
+        if ruta.endswith('.css'):
+            contenido = reescribir_urls_css(contenido.decode('utf-8'), ruta, manifiesto['archivos']).encode('utf-8')
+        if ruta.lower().endswith(ASSETS_IMAGENES):
+            base, extension_original = os.path.splitext(ruta)
+            for extension, tipo, variante in variantes_de_imagen(contenido, extension_original.lower()):
+                if extension == extension_original.lower():
+                    contenido = variante
+                    continue
+                destino = nombre_con_hash(base + extension, variante)
+                reporte.append((base + extension, destino, escribir_asset(dist, destino, variante)))
+                manifiesto['archivos'][base + extension] = destino
+                manifiesto['variantes'].setdefault(ruta, []).append((destino, tipo))
+            # El navegador usa el primer <source> que soporta: AVIF antes que WebP
+            manifiesto['variantes'].get(ruta, []).sort(key=lambda v: v[1] != 'image/avif')
+        destino = nombre_con_hash(ruta, contenido)
+        reporte.append((ruta, destino, escribir_asset(dist, destino, contenido)))
+        manifiesto['archivos'][ruta] = destino
+
+    with open(ruta_manifiesto(), 'w', encoding='utf-8') as archivo:
+        json.dump(manifiesto, archivo, indent=2, sort_keys=True)
+    return reporte
+
+@app.cli.group('assets')
+def assets_cli():
+    """Archivos estáticos: librerías locales y copias con hash para caché permanente."""
+
+@assets_cli.command('vendorizar')
+def assets_vendorizar():
+    """Vuelve a bajar a static/vendor las librerías de ASSETS_VENDOR (requiere red; commitear el resultado).
+
+    Un archivo que no coincide con su hash fijado no se escribe: para cambiar de versión hay
+    que actualizar el origen y el hash en ASSETS_VENDOR.
+    """
+    fallidas = 0
+    for ruta, (url, esperado) in ASSETS_VENDOR.items():
+        if url is None:
+            continue
+        try:
+            with urllib.request.urlopen(url, timeout=30) as respuesta:
+                contenido = respuesta.read()
+        except OSError as e:
+            click.echo(f'{url}: {e}', err=True)
+            fallidas += 1
+            continue
+        if integridad(contenido) != esperado:
+            click.echo(f'{url}: el hash {integridad(contenido)} no coincide con {esperado}', err=True)
+            fallidas += 1
+            continue
+        destino = os.path.join(app.static_folder, ruta)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        with open(destino, 'wb') as archivo:
+            archivo.write(contenido)
+        click.echo(f'{ruta}: {len(contenido) / 1024:.1f} KB')
+    if fallidas:
+        raise click.ClickException(f'{fallidas} descarga(s) fallaron')
+
+@assets_cli.command('estilos')
+def assets_estilos():
+    """Compila static/css/login.css con el CLI de Tailwind (tailwindcss-bin, en requirements-dev.txt)."""
+    tailwind = shutil.which('tailwindcss')
+    if tailwind is None:
+        raise click.ClickException('No se encontró tailwindcss: pip install -r requirements-dev.txt')
+    carpeta = os.path.join(app.static_folder, 'css')
+    os.makedirs(carpeta, exist_ok=True)
+    # La entrada va junto a la salida: @source y url() son relativos a ella
+    with tempfile.NamedTemporaryFile('w', suffix='.css', dir=carpeta, encoding='utf-8', delete=False) as entrada:
+        entrada.write(ESTILOS_LOGIN)
+    try:
+        subprocess.run([tailwind, '-i', entrada.name, '-o', os.path.join(carpeta, 'login.css'), '--minify'], check=True)
+    except subprocess.CalledProcessError as e:
+        raise click.ClickException(f'tailwindcss terminó con código {e.returncode}')
+    finally:
+        os.remove(entrada.name)
+
+@assets_cli.command('construir')
+@click.option('--limpiar', is_flag=True, help='Borra static/dist antes de construir.')
+def assets_construir(limpiar):
+    """Genera static/dist y su manifiesto (correr en cada despliegue, antes de arrancar los workers)."""
+    alterados = assets_alterados()
+    if alterados:
+        raise click.ClickException('No coinciden con el hash de ASSETS_VENDOR: ' + ', '.join(alterados))
+    for ruta, destino, tamanos in construir_assets(limpiar):
+        comprimidos = '  '.join(f'{ext} {tamano / 1024:.1f} KB' for ext, tamano in tamanos.items() if ext != 'bytes')
+        click.echo(f"{ruta} -> {destino}  {tamanos['bytes'] / 1024:.1f} KB  {comprimidos}")
+
+@app.cli.group('db')
+def db_cli():
+    """Migraciones del esquema de la base de datos."""
+
+@db_cli.command('upgrade')
+def db_upgrade():
+    """Aplica las migraciones pendientes y los datos iniciales (correr una vez por despliegue)."""
+    aplicadas = aplicar_migraciones(get_db_connection(), click.echo)
+    if not aplicadas:
+        click.echo('Sin migraciones pendientes')
+
+@db_cli.command('estado')
+def db_estado():
+    """Muestra la versión del esquema y las migraciones pendientes."""
+    cur = get_db_connection().cursor()
+    actual = version_esquema(cur)
+    cur.close()
+    click.echo(f'Versión del esquema: {actual}')
+    for version, nombre, _ in listar_migraciones():
+        if version > actual:
+            click.echo(f'Pendiente: {version:04d} {nombre}')
+
+@db_cli.command('replicas')
+def db_replicas():
+    """Estado de las réplicas de lectura: conexión, última réplica aplicada y versión de los pedidos."""
+    if not replicas:
+        click.echo('Sin réplicas (DATABASE_READ_URL no está definida)')
+        return
+    cur = get_db_connection().cursor()
+    version_primario, _ = version_datos_pedidos(cur)
+    cur.close()
+    for indice, pool in enumerate(replicas.pools):
+        try:
+            conn = pool.obtener()
+        except (psycopg2.OperationalError, PoolAgotado) as e:
+            click.echo(f'Réplica {indice}: sin conexión ({str(e).strip()})')
+            continue
+        cur = conn.cursor()
+        cur.execute('SELECT pg_is_in_recovery() AS en_recuperacion, '
+                    'now() - pg_last_xact_replay_timestamp() AS desde_ultima_transaccion')
+        estado = cur.fetchone()
+        version, _ = version_datos_pedidos(cur)
+        cur.close()
+        pool.devolver(conn)
+        tipo = 'réplica' if estado['en_recuperacion'] else 'NO está en recuperación'
+        click.echo(f"Réplica {indice}: {tipo}, última transacción aplicada hace {estado['desde_ultima_transaccion']}, "
+                   f"versión de pedidos {version} (primario {version_primario})")
+
+@app.cli.group('particiones')
+def particiones_cli():
+    """Particiones anuales de pedidos: creación por adelantado, archivo y verificación de la poda."""
+
+@particiones_cli.command('listar')
+def particiones_listar():
+    """Muestra las particiones vigentes y archivadas."""
+    cur = get_db_connection().cursor()
+    for fila in listar_particiones(cur):
+        estado = 'archivada' if fila['archivada'] else 'vigente'
+        click.echo(f"{fila['tabla']:24} {estado:10} {fila['pedidos']:>10,} pedidos {fila['tamano'] / 1024 / 1024:>10.1f} MB")
+    cur.close()
+
+@particiones_cli.command('crear')
+@click.option('--anios-adelante', type=int, default=PARTICIONES_ANIOS_ADELANTE, show_default=True)
+def particiones_crear(anios_adelante):
+    """Crea las particiones del año en curso y de los siguientes (cron anual o `flask db upgrade`)."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    creadas = crear_particiones_adelante(cur, anios_adelante)
+    conn.commit()
+    cur.close()
+    click.echo(f"Particiones creadas: {', '.join(creadas)}" if creadas else 'Sin particiones nuevas')
+
+@particiones_cli.command('archivar')
+@click.argument('anio', type=int)
+def particiones_archivar(anio):
+    """Separa de pedidos la partición de un año cerrado y guarda sus totales."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        archivar_anio(cur, anio)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    conn.commit()
+    cur.close()
+    click.echo(f'Año {anio} archivado en archivo.pedidos_{anio}')
+
+@particiones_cli.command('restaurar')
+@click.argument('anio', type=int)
+def particiones_restaurar(anio):
+    """Vuelve a adjuntar a pedidos la partición archivada de un año."""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        restaurar_anio(cur, anio)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    conn.commit()
+    cur.close()
+    click.echo(f'Año {anio} restaurado')
+
+@particiones_cli.command('verificar-poda')
+@click.option('--anio', type=int, default=None, help='Año del filtro (por defecto el año en curso).')
+def particiones_verificar_poda(anio):
+    """Comprueba con EXPLAIN que los filtros por fecha sólo recorren las particiones de su rango."""
+    anio = anio or date.today().year
+    cur = get_db_connection().cursor()
+    vigentes = {fila['tabla']: fila['anio'] for fila in listar_particiones(cur) if not fila['archivada']}
+    if f'pedidos_{anio}' not in vigentes:
+        raise click.ClickException(f'No hay partición vigente para {anio}')
+
+    def listado(fecha_inicio, fecha_fin):
+        # Misma forma que el listado, la exportación y el conteo de exportaciones
+        condicion, params = filtro_fechas(fecha_inicio, fecha_fin)
+        return f'SELECT * FROM pedidos WHERE {condicion} ORDER BY fecha DESC, id DESC', params
+
+    ctes, params_calculados = sql_pedidos_calculados(*filtro_fechas(f'{anio}-01-01', f'{anio}-12-31'))
+    casos = [
+        ('año completo', listado(f'{anio}-01-01', f'{anio}-12-31'), lambda a: a == anio),
+        ('un mes', listado(f'{anio}-03-01', f'{anio}-03-31'), lambda a: a == anio),
+        ('desde', listado(f'{anio}-01-01', ''), lambda a: a >= anio),
+        ('hasta', listado('', f'{anio}-12-31'), lambda a: a <= anio),
+        ('página siguiente', sql_pagina_pedidos(cursor_despues=(date(anio, 6, 30), 0)), lambda a: a <= anio),
+        ('página anterior', sql_pagina_pedidos(cursor_antes=(date(anio, 6, 30), 0)), lambda a: a >= anio),
+        ('totales calculados', (ctes + 'SELECT * FROM pedidos_calculados', params_calculados), lambda a: a == anio),
+    ]
+    fallidos = 0
+    for nombre, (sql, params), incluida in casos:
+        recorridas = particiones_del_plan(cur, sql, params)
+        esperadas = {tabla for tabla, a in vigentes.items() if incluida(a)}
+        marca = 'ok' if recorridas == esperadas else 'DIFERENTE'
+        fallidos += marca != 'ok'
+        click.echo(f"{nombre:20} {', '.join(sorted(recorridas)) or '-':48} {marca}")
+    cur.close()
+    if fallidos:
+        raise SystemExit(1)
+
+app.logger.info('App cargada en %.1f ms', (time.perf_counter() - ARRANQUE) * 1000)
+
 if __name__ == '__main__':
     app.run(debug=True)
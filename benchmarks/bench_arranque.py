@@ -0,0 +1,66 @@
+"""Tiempo de arranque de un worker: importar app.py y cargar las plantillas.
+
+Cada medición corre en un proceso nuevo, como un worker de gunicorn. Las
+plantillas se miden con el caché de bytecode de Jinja vacío (primer worker) y
+ya lleno (los siguientes).
+
+    python benchmarks/bench_arranque.py --repeticiones 15
+
+Para comparar con otra versión, apuntar --app-dir a un checkout de ella
+(p. ej. `git worktree add /tmp/eterno-anterior HEAD~1`).
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+CODIGO = '''
+import time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+with app.app.app_context():
+    for nombre in app.app.jinja_env.list_templates():
+        app.app.jinja_env.get_template(nombre)
+t2 = time.perf_counter()
+print((t1 - t0) * 1000, (t2 - t1) * 1000)
+'''
+
+def medir(app_dir, cache_dir):
+    entorno = dict(os.environ, JINJA_CACHE_DIR=cache_dir)
+    salida = subprocess.run([sys.executable, '-c', CODIGO], cwd=app_dir, env=entorno,
+                            capture_output=True, text=True, check=True).stdout.split()
+    return float(salida[-2]), float(salida[-1])
+
+def resumen(valores):
+    return f'mediana {statistics.median(valores):7.1f} ms  min {min(valores):7.1f} ms'
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeticiones', type=int, default=10)
+    parser.add_argument('--app-dir', default=RAIZ)
+    args = parser.parse_args()
+
+    importar, frio, caliente = [], [], []
+    for _ in range(args.repeticiones):
+        cache_dir = tempfile.mkdtemp(prefix='eterno_jinja_')
+        try:
+            t_importar, t_frio = medir(args.app_dir, cache_dir)
+            _, t_caliente = medir(args.app_dir, cache_dir)
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+        importar.append(t_importar)
+        frio.append(t_frio)
+        caliente.append(t_caliente)
+
+    print(f"{'import app':32}{resumen(importar)}")
+    print(f"{'plantillas (caché vacío)':32}{resumen(frio)}")
+    print(f"{'plantillas (caché de bytecode)':32}{resumen(caliente)}")
+
+if __name__ == '__main__':
+    main()
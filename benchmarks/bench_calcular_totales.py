@@ -0,0 +1,106 @@
+"""Micro-benchmark de calcular_totales contra calcular_totales_batch.
+
+Genera pedidos aleatorios (incluye productos desconocidos, cuotas fuera de la
+tabla, anticipos mayores al total y descuentos que dejan medios centavos),
+comprueba que ambas versiones den los mismos centavos fila por fila, y que
+coincidan con una referencia en Decimal que redondea como ROUND(x, 2) de
+PostgreSQL. Mide el tiempo de cada una.
+
+    python benchmarks/bench_calcular_totales.py --tamanos 10000,100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from decimal import Decimal, ROUND_HALF_UP
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from app import (PRODUCTOS_CONFIG, COSTOS_VISA, CAMPOS_TOTALES, a_centavos, a_diezmilesimos,
+                 calcular_totales, calcular_totales_batch)
+
+# Catálogo fijo a partir de los valores iniciales: el benchmark no necesita base de datos
+CATALOGO = {'version': 0, 'productos': PRODUCTOS_CONFIG, 'costos_visa': COSTOS_VISA, 'metodos_pago': []}
+
+DERIVADOS = ['saldo_restante_c', 'costo_total_c', 'utilidad_c']
+
+def generar_columnas(n, rng):
+    """Columnas como las devuelve psycopg2: descuento DECIMAL(5,4) y anticipo DECIMAL(10,2)."""
+    productos = list(PRODUCTOS_CONFIG) + ['Descontinuado']
+    cuotas = [0] + list(COSTOS_VISA) + [1, 5, 24]
+    return {
+        'productos': [rng.choice(productos) if rng.random() < 0.99 else 'Descontinuado' for _ in range(n)],
+        'cantidades': [rng.randint(1, 5) for _ in range(n)],
+        'descuentos': [Decimal(rng.choice(['0', '0', '0.05', '0.1', '0.125', '0.0333', f'{rng.random():.4f}', '1']))
+                       for _ in range(n)],
+        'anticipos': [Decimal(rng.choice(['0', '1000', '5000', f'{rng.uniform(0, 80000):.2f}'])) for _ in range(n)],
+        'cuotas_visa_anticipo': [rng.choice(cuotas) for _ in range(n)],
+        'cuotas_visa_saldo': [rng.choice(cuotas) for _ in range(n)]
+    }
+
+def escalar(columnas):
+    resultados = []
+    for fila in zip(*columnas.values()):
+        try:
+            resultados.append(calcular_totales(*fila, catalogo=CATALOGO))
+        except KeyError:
+            resultados.append(None)
+    return resultados
+
+def lote(columnas):
+    return calcular_totales_batch(
+        columnas['productos'], columnas['cantidades'],
+        [a_diezmilesimos(d) for d in columnas['descuentos']],
+        [a_centavos(a) for a in columnas['anticipos']],
+        columnas['cuotas_visa_anticipo'], columnas['cuotas_visa_saldo'], catalogo=CATALOGO)
+
+def referencia_decimal(producto, cantidad, descuento, anticipo, cuotas_anticipo, cuotas_saldo):
+    """(total_venta, costo_visa_anticipo, costo_visa_saldo) en centavos con la aritmética de sql_pedidos_calculados."""
+    redondear = lambda x: int((x * 100).quantize(Decimal(1), ROUND_HALF_UP))
+    tasa = lambda cuotas: Decimal(str(COSTOS_VISA.get(cuotas, 0)))
+    total_venta = Decimal(str(PRODUCTOS_CONFIG[producto]['precio'])) * cantidad * (1 - descuento)
+    total_venta = Decimal(redondear(total_venta)) / 100
+    return (redondear(total_venta), redondear(anticipo * tasa(cuotas_anticipo)),
+            redondear((total_venta - anticipo) * tasa(cuotas_saldo)))
+
+def comparar(columnas, resultados, totales):
+    for i, (fila, esperado) in enumerate(zip(zip(*columnas.values()), resultados)):
+        if esperado is None:
+            assert not totales['valido'][i], f'fila {i}: debía ser inválida'
+            continue
+        assert totales['valido'][i], f'fila {i}: debía ser válida'
+        for campo in CAMPOS_TOTALES + tuple(DERIVADOS):
+            valor = getattr(esperado, campo)
+            assert valor == totales[campo][i], f'fila {i} {campo}: {valor} != {totales[campo][i]}'
+        for concepto, valor in esperado.costos_detalle_c.items():
+            assert valor == totales['costos_detalle_c'][concepto][i], f'fila {i} {concepto}'
+        calculado = (esperado.total_venta_c, esperado.costo_visa_anticipo_c, esperado.costo_visa_saldo_c)
+        assert calculado == referencia_decimal(*fila), f'fila {i}: {calculado} != {referencia_decimal(*fila)}'
+
+def medir(funcion, columnas, repeticiones):
+    mejor = float('inf')
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion(columnas)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor, resultado
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tamanos', default='10000,100000')
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--semilla', type=int, default=2026)
+    args = parser.parse_args()
+    
+    rng = random.Random(args.semilla)
+    for n in [int(t) for t in args.tamanos.split(',')]:
+        columnas = generar_columnas(n, rng)
+        t_escalar, resultados = medir(escalar, columnas, args.repeticiones)
+        t_lote, totales = medir(lote, columnas, args.repeticiones)
+        comparar(columnas, resultados, totales)
+        print(f'{n:>8} pedidos  escalar {t_escalar * 1000:9.1f} ms  lote {t_lote * 1000:8.1f} ms  '
+              f'x{t_escalar / t_lote:5.1f}  (centavos idénticos entre sí y con la referencia Decimal)')
+
+if __name__ == '__main__':
+    main()
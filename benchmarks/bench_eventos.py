@@ -0,0 +1,101 @@
+"""Dashboard en vivo: costo de las conexiones SSE inactivas y latencia del reparto.
+
+Levanta la app en un servidor con hilos, abre N conexiones a /api/eventos,
+mide la memoria de Python que ocupan mientras esperan (tracemalloc) y luego
+crea pedidos: para cada uno, el tiempo desde el commit hasta que el evento
+llega a todas las conexiones. Los pedidos creados se eliminan al final.
+
+    BENCH_DATABASE_URL=postgresql://localhost/eterno_bench \\
+        python benchmarks/bench_eventos.py --conexiones 10,100 --pedidos 20
+"""
+import argparse
+import http.client
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+
+if not os.environ.get('BENCH_DATABASE_URL'):
+    sys.exit('Defina BENCH_DATABASE_URL (se agregan y eliminan pedidos de prueba)')
+os.environ['DATABASE_URL'] = os.environ['BENCH_DATABASE_URL']
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from werkzeug.serving import make_server
+
+import app as eterno
+
+PEDIDO = {'fecha': '2026-01-05', 'cliente': 'Bench Eventos', 'producto': 'Grande', 'cantidad': '1', 'descuento': '0',
+          'anticipo': '1000', 'metodo_pago_anticipo': 'Efectivo', 'cuotas_visa_anticipo': '0', 'fecha_sesion': '',
+          'metodo_pago_saldo': '', 'cuotas_visa_saldo': '0'}
+
+def escuchar(puerto, cookie, llegadas, listo):
+    """Lee una conexión SSE y anota cuándo llega cada evento `pedido`."""
+    conn = http.client.HTTPConnection('127.0.0.1', puerto, timeout=120)
+    conn.request('GET', '/api/eventos', headers={'Cookie': cookie})
+    respuesta = conn.getresponse()
+    listo.release()
+    for linea in respuesta:
+        if linea.startswith(b'id: '):
+            evento_id = int(linea[4:])
+            llegadas.setdefault(evento_id, []).append(time.perf_counter())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--conexiones', default='10,100')
+    parser.add_argument('--pedidos', type=int, default=20)
+    args = parser.parse_args()
+
+    with eterno.app.app_context():
+        eterno.aplicar_migraciones(eterno.get_db_connection(), aviso=lambda _: None)
+    eterno.limiter.enabled = False
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    eterno.eventos_pedidos.max_clientes = 10 ** 6
+    servidor = make_server('127.0.0.1', 0, eterno.app, threaded=True)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    cliente = eterno.app.test_client()
+    cliente.post('/login', data={'username': 'admin', 'password': 'eterno2026'})
+    cookie = f"session={cliente.get_cookie('session').value}"
+
+    for n in [int(c) for c in args.conexiones.split(',')]:
+        llegadas = {}
+        listo = threading.Semaphore(0)
+        tracemalloc.start()
+        antes, _ = tracemalloc.get_traced_memory()
+        for _ in range(n):
+            threading.Thread(target=escuchar, args=(servidor.port, cookie, llegadas, listo), daemon=True).start()
+        for _ in range(n):
+            listo.acquire()
+        time.sleep(1)
+        inactivas, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        latencias = []
+        for _ in range(args.pedidos):
+            inicio = time.perf_counter()
+            cliente.post('/nuevo-pedido', data=PEDIDO)
+            with eterno.app.app_context():
+                cur = eterno.get_db_connection().cursor()
+                cur.execute('SELECT MAX(id) AS id FROM eventos_pedidos')
+                evento_id = cur.fetchone()['id']
+                cur.close()
+            while len(llegadas.get(evento_id, [])) < n:
+                time.sleep(0.001)
+            latencias.append((max(llegadas[evento_id]) - inicio) * 1000)
+        print(f'{n:>6} conexiones  {(inactivas - antes) / n / 1024:6.1f} KB por conexión inactiva  '
+              f'commit -> todas: p50 {statistics.median(latencias):6.1f} ms  máx {max(latencias):6.1f} ms', flush=True)
+
+    with eterno.app.app_context():
+        cur = eterno.get_db_connection().cursor()
+        cur.execute("SELECT id FROM pedidos WHERE cliente = 'Bench Eventos'")
+        ids = [fila['id'] for fila in cur.fetchall()]
+        cur.close()
+    for pedido_id in ids:
+        cliente.get(f'/eliminar-pedido/{pedido_id}')
+    servidor.shutdown()
+
+if __name__ == '__main__':
+    main()
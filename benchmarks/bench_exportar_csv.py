@@ -0,0 +1,90 @@
+"""Exportación de pedidos: CSV con COPY TO STDOUT contra el Excel de openpyxl.
+
+Descarga /exportar-excel (sin el caché de exportaciones), /exportar-csv y
+/exportar-csv?gzip=1 completos y mide filas por segundo, tiempo al primer byte,
+bytes enviados y el pico de memoria de Python (tracemalloc, incluye el hilo
+que hace el COPY).
+
+La base de BENCH_DATABASE_URL se vacía: usar una base sólo para esto.
+
+    BENCH_DATABASE_URL=postgresql://localhost/eterno_bench \\
+        python benchmarks/bench_exportar_csv.py --tamanos 10000,100000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+if not os.environ.get('BENCH_DATABASE_URL'):
+    sys.exit('Defina BENCH_DATABASE_URL (la base se vacía en cada tamaño)')
+os.environ['DATABASE_URL'] = os.environ['BENCH_DATABASE_URL']
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from datos_sinteticos import eterno, sembrar
+
+def borrar_exportaciones():
+    with eterno.app.app_context():
+        conn = eterno.get_db_connection()
+        cur = conn.cursor()
+        cur.execute('DELETE FROM exportaciones')
+        conn.commit()
+        cur.close()
+
+def descargar(cliente, url):
+    """(primer byte, total) en ms y bytes recibidos, leyendo la respuesta como lo haría el cliente."""
+    borrar_exportaciones()
+    inicio = time.perf_counter()
+    respuesta = cliente.get(url, buffered=False)
+    if respuesta.status_code != 200:
+        raise RuntimeError(f'{url}: {respuesta.status_code}')
+    primer_byte = None
+    recibidos = 0
+    for bloque in respuesta.response:
+        if primer_byte is None:
+            primer_byte = time.perf_counter() - inicio
+        recibidos += len(bloque)
+    respuesta.close()
+    total = time.perf_counter() - inicio
+    return (primer_byte or total) * 1000, total * 1000, recibidos
+
+def medir(cliente, url, repeticiones):
+    descargar(cliente, url)  # calentamiento
+    medidas = [descargar(cliente, url) for _ in range(repeticiones)]
+    tracemalloc.start()
+    descargar(cliente, url)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'primer_byte_ms': statistics.median(m[0] for m in medidas),
+        'total_ms': statistics.median(m[1] for m in medidas),
+        'bytes': medidas[0][2],
+        'memoria_pico_kb': pico / 1024
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tamanos', default='10000,100000')
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--semilla', type=int, default=1)
+    args = parser.parse_args()
+
+    with eterno.app.app_context():
+        eterno.aplicar_migraciones(eterno.get_db_connection(), aviso=lambda _: None)
+    eterno.limiter.enabled = False
+    for n in [int(t) for t in args.tamanos.split(',')]:
+        sembrar(n, args.semilla)
+        cliente = eterno.app.test_client()
+        cliente.post('/login', data={'username': 'admin', 'password': 'eterno2026'})
+        for nombre, url in (('excel', '/exportar-excel'),
+                            ('csv', '/exportar-csv'),
+                            ('csv gzip', '/exportar-csv?gzip=1')):
+            r = medir(cliente, url, args.repeticiones)
+            print(f"{n:>8} {nombre:9} {n / r['total_ms'] * 1000:>10.0f} filas/s  total {r['total_ms']:>9.1f} ms  "
+                  f"primer byte {r['primer_byte_ms']:>8.1f} ms  {r['bytes'] / 1024:>8.0f} KB  "
+                  f"memoria pico {r['memoria_pico_kb']:>8.0f} KB", flush=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""Throughput de la importación masiva de pedidos (filas/s) desde CSV y XLSX.
+
+Genera archivos sintéticos, los importa dentro de una transacción y la
+revierte al terminar: la base queda igual. Necesita DATABASE_URL con el
+esquema migrado (`flask db upgrade`).
+
+    python benchmarks/bench_importacion.py --tamanos 1000,10000
+"""
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from datos_sinteticos import eterno, generar_filas
+
+def archivo_csv(filas):
+    texto = io.StringIO()
+    escritor = csv.writer(texto)
+    escritor.writerow(eterno.COLUMNAS_IMPORTACION)
+    escritor.writerows(filas)
+    return io.BytesIO(texto.getvalue().encode('utf-8'))
+
+def archivo_xlsx(filas):
+    from openpyxl import Workbook
+    libro = Workbook(write_only=True)
+    hoja = libro.create_sheet()
+    hoja.append(eterno.COLUMNAS_IMPORTACION)
+    for fila in filas:
+        hoja.append(fila)
+    contenido = io.BytesIO()
+    libro.save(contenido)
+    contenido.seek(0)
+    return contenido
+
+def medir(formato, contenido, catalogo, simular):
+    with eterno.app.app_context():
+        conn = eterno.get_db_connection()
+        cur = conn.cursor()
+        filas = eterno.leer_filas_importacion(contenido, f'pedidos.{formato}')
+        reporte = eterno.importar_pedidos(cur, filas, catalogo, simular=simular)
+        conn.rollback()
+        cur.close()
+    if reporte['errores']:
+        raise SystemExit(f"{formato}: {len(reporte['errores'])} filas con errores, p. ej. {reporte['errores'][0]}")
+    return reporte
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tamanos', default='1000,10000')
+    parser.add_argument('--semilla', type=int, default=1)
+    args = parser.parse_args()
+
+    with eterno.app.app_context():
+        catalogo = eterno.catalogo_vigente()
+    rng = random.Random(args.semilla)
+    print(f"{'filas':>8} {'formato':>7} {'validar':>14} {'importar':>14}")
+    for n in [int(t) for t in args.tamanos.split(',')]:
+        filas = list(generar_filas(n, catalogo, rng))
+        for formato, crear in (('csv', archivo_csv), ('xlsx', archivo_xlsx)):
+            validar = medir(formato, crear(filas), catalogo, simular=True)
+            importar = medir(formato, crear(filas), catalogo, simular=False)
+            print(f"{n:>8} {formato:>7} {validar['filas_por_segundo']:>10,.0f} f/s {importar['filas_por_segundo']:>10,.0f} f/s")
+
+if __name__ == '__main__':
+    main()
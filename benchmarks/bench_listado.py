@@ -0,0 +1,93 @@
+"""Listado completo de pedidos: envío en streaming contra render completo en memoria.
+
+Compara /pedidos/listado (stream_template + cursor del servidor por lotes) con
+el camino anterior: leer todos los pedidos con fetchall, armar la lista con
+sus totales y recién entonces renderizar. Mide el tiempo al primer byte, el
+tiempo total y el pico de memoria de Python (tracemalloc).
+
+La base de BENCH_DATABASE_URL se vacía: usar una base sólo para esto.
+
+    BENCH_DATABASE_URL=postgresql://localhost/eterno_bench \\
+        python benchmarks/bench_listado.py --tamanos 10000,100000
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+if not os.environ.get('BENCH_DATABASE_URL'):
+    sys.exit('Defina BENCH_DATABASE_URL (la base se vacía en cada tamaño)')
+os.environ['DATABASE_URL'] = os.environ['BENCH_DATABASE_URL']
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from datos_sinteticos import eterno, sembrar
+
+def streaming(cliente, gzip):
+    """(primer byte, total) en ms y bytes enviados por /pedidos/listado."""
+    inicio = time.perf_counter()
+    respuesta = cliente.get('/pedidos/listado', buffered=False,
+                            headers={'Accept-Encoding': 'gzip' if gzip else 'identity'})
+    primer_byte = None
+    enviados = 0
+    for bloque in respuesta.response:
+        if primer_byte is None:
+            primer_byte = time.perf_counter() - inicio
+        enviados += len(bloque)
+    respuesta.close()
+    return primer_byte * 1000, (time.perf_counter() - inicio) * 1000, enviados
+
+def en_memoria(cliente):
+    """El camino anterior: todo se calcula y renderiza antes de enviar el primer byte."""
+    inicio = time.perf_counter()
+    with eterno.app.test_request_context('/pedidos/listado'):
+        eterno.session.update(user_id=1, rol='admin')
+        cur = eterno.get_db_connection().cursor()
+        estadisticas = eterno.calcular_estadisticas(cur, '', '')
+        cur.execute('SELECT * FROM pedidos ORDER BY fecha DESC, id DESC')
+        pedidos = eterno.pedidos_con_totales(cur.fetchall())
+        cur.close()
+        html = eterno.render_template('listado_pedidos.html', pedidos=pedidos, estadisticas=estadisticas,
+                                      fecha_inicio='', fecha_fin='')
+    total = (time.perf_counter() - inicio) * 1000
+    return total, total, len(html.encode('utf-8'))
+
+def medir(funcion, repeticiones):
+    funcion()  # calentamiento
+    medidas = [funcion() for _ in range(repeticiones)]
+    tracemalloc.start()
+    funcion()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'primer_byte_ms': statistics.median(m[0] for m in medidas),
+        'total_ms': statistics.median(m[1] for m in medidas),
+        'bytes': medidas[0][2],
+        'memoria_pico_kb': pico / 1024
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tamanos', default='10000,100000')
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--semilla', type=int, default=1)
+    args = parser.parse_args()
+
+    with eterno.app.app_context():
+        eterno.aplicar_migraciones(eterno.get_db_connection(), aviso=lambda _: None)
+    eterno.limiter.enabled = False
+    for n in [int(t) for t in args.tamanos.split(',')]:
+        sembrar(n, args.semilla)
+        cliente = eterno.app.test_client()
+        cliente.post('/login', data={'username': 'admin', 'password': 'eterno2026'})
+        for nombre, funcion in (('en memoria', lambda: en_memoria(cliente)),
+                                ('streaming', lambda: streaming(cliente, False)),
+                                ('streaming gzip', lambda: streaming(cliente, True))):
+            r = medir(funcion, args.repeticiones)
+            print(f"{n:>8} {nombre:16} primer byte {r['primer_byte_ms']:>9.1f} ms  total {r['total_ms']:>9.1f} ms  "
+                  f"{r['bytes'] / 1024:>9.0f} KB  memoria pico {r['memoria_pico_kb']:>10.0f} KB", flush=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""Montos en centavos: memoria por pedido y coincidencia exacta con PostgreSQL.
+
+Lee todos los pedidos y compara la memoria que retiene la lista del listado
+con PedidoCalculado (__slots__, centavos enteros) contra la forma anterior
+(un dict por pedido con los campos y 13 totales en float). Después compara
+pedido por pedido y en las sumas los centavos de Python con los NUMERIC de
+sql_pedidos_calculados; termina con error si algún centavo difiere.
+
+La base de BENCH_DATABASE_URL se vacía: usar una base sólo para esto.
+
+    BENCH_DATABASE_URL=postgresql://localhost/eterno_bench \\
+        python benchmarks/bench_montos.py --tamanos 10000,100000
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+if not os.environ.get('BENCH_DATABASE_URL'):
+    sys.exit('Defina BENCH_DATABASE_URL (la base se vacía en cada tamaño)')
+os.environ['DATABASE_URL'] = os.environ['BENCH_DATABASE_URL']
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from datos_sinteticos import eterno, sembrar
+
+# Columnas de sql_pedidos_calculados y su equivalente en centavos
+COLUMNAS_SQL = {'total_venta': 'total_venta_c', 'anticipo_neto': 'anticipo_c', 'saldo_restante': 'saldo_restante_c',
+                'costo_produccion': 'costo_produccion_c', 'costo_visa_anticipo': 'costo_visa_anticipo_c',
+                'costo_visa_saldo': 'costo_visa_saldo_c'}
+
+TOTALES_ANTERIORES = ['precio_unitario', 'subtotal', 'total_venta', 'anticipo', 'saldo_restante', 'costo_produccion',
+                      'costo_visa_anticipo', 'costo_visa_saldo', 'costo_visa_total', 'costo_total', 'utilidad',
+                      'porcentaje_utilidad', 'disponible_anticipo']
+
+def como_dict(pedido):
+    """La fila como la armaba antes pedidos_con_totales: dict con los campos del pedido y los totales en float."""
+    fila = {campo: getattr(pedido, campo) for campo in eterno.PedidoCalculado.__slots__}
+    fila['cantidad'] = pedido.cantidad
+    fila.update({llave: float(getattr(pedido, llave)) for llave in TOTALES_ANTERIORES})
+    return fila
+
+def retenido(construir):
+    """(resultado, bytes que siguen reservados mientras se conserva el resultado, ms)."""
+    gc.collect()
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    resultado = construir()
+    ms = (time.perf_counter() - inicio) * 1000
+    actual, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return resultado, actual, ms
+
+def comparar_con_sql(cur, registros):
+    """Diferencias entre los centavos de cada registro y los NUMERIC de sql_pedidos_calculados, y en las sumas."""
+    ctes, params = eterno.sql_pedidos_calculados()
+    cur.execute(ctes + f"SELECT id, {', '.join(COLUMNAS_SQL)} FROM pedidos_calculados", params)
+    por_id = {fila['id']: fila for fila in cur.fetchall()}
+    diferencias = []
+    sumas = dict.fromkeys(COLUMNAS_SQL, 0)
+    for registro in registros:
+        fila = por_id.pop(registro.id)
+        for columna, campo in COLUMNAS_SQL.items():
+            sumas[columna] += getattr(registro, campo)
+            if fila[columna] * 100 != getattr(registro, campo):
+                diferencias.append(f'pedido {registro.id} {columna}: {fila[columna]} != {getattr(registro, campo)}')
+    diferencias += [f'pedido {pedido_id} sólo en SQL' for pedido_id in por_id]
+    cur.execute(ctes + 'SELECT ' + ', '.join(f'SUM({c}) AS {c}' for c in COLUMNAS_SQL) + ' FROM pedidos_calculados', params)
+    for columna, suma in cur.fetchone().items():
+        if (suma or 0) * 100 != sumas[columna]:
+            diferencias.append(f'suma {columna}: {suma} != {sumas[columna] / 100}')
+    return diferencias
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tamanos', default='10000,100000')
+    parser.add_argument('--semilla', type=int, default=1)
+    args = parser.parse_args()
+
+    with eterno.app.app_context():
+        eterno.aplicar_migraciones(eterno.get_db_connection(), aviso=lambda _: None)
+    fallas = 0
+    for n in [int(t) for t in args.tamanos.split(',')]:
+        sembrar(n, args.semilla)
+        with eterno.app.app_context():
+            cur = eterno.get_db_connection().cursor()
+            cur.execute('SELECT * FROM pedidos')
+            pedidos = cur.fetchall()
+            registros, bytes_registros, ms_registros = retenido(lambda: eterno.pedidos_con_totales(pedidos))
+            _, bytes_dicts, ms_dicts = retenido(lambda: [como_dict(p) for p in registros])
+            diferencias = comparar_con_sql(cur, registros)
+            cur.close()
+        fallas += len(diferencias)
+        print(f'{n:>8} pedidos  PedidoCalculado {bytes_registros / len(registros):6.0f} B/pedido ({ms_registros:7.1f} ms)  '
+              f'dict anterior {bytes_dicts / len(registros):6.0f} B/pedido  '
+              f'SQL: {"centavos idénticos" if not diferencias else f"{len(diferencias)} diferencias"}', flush=True)
+        for diferencia in diferencias[:10]:
+            print('    ' + diferencia)
+    if fallas:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
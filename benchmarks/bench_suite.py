@@ -0,0 +1,215 @@
+"""Suite de rendimiento: latencia (percentiles) y memoria de las rutas principales.
+
+Siembra la base de BENCH_DATABASE_URL con pedidos sintéticos para cada tamaño
+y mide con el test client de Flask:
+
+- dashboard, /api/estadisticas y /api/pedidos, con y sin filtro de fechas
+- /api/clientes/buscar con un apellido, un prefijo corto y un nombre completo
+- /exportar-excel (sin el caché de exportaciones)
+- POST /login y POST /nuevo-pedido
+- calcular_totales (ciclo escalar) y calcular_totales_batch sobre todos los pedidos
+
+La base de BENCH_DATABASE_URL se vacía: usar una base sólo para esto.
+
+    BENCH_DATABASE_URL=postgresql://localhost/eterno_bench \\
+        python benchmarks/bench_suite.py --tamanos 1000,10000,100000 --salida resultados.json
+
+    # Compara contra una corrida guardada; termina con error si hay regresiones
+    python benchmarks/bench_suite.py --tamanos 1000,10000 --comparar base.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+if not os.environ.get('BENCH_DATABASE_URL'):
+    sys.exit('Defina BENCH_DATABASE_URL (la base se vacía en cada tamaño)')
+os.environ['DATABASE_URL'] = os.environ['BENCH_DATABASE_URL']
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from datos_sinteticos import eterno, sembrar
+
+USUARIO = 'admin'
+PASSWORD = 'eterno2026'
+FILTRO = {'fecha_inicio': '2024-06-01', 'fecha_fin': '2024-08-31'}
+PEDIDO = {'fecha': '2025-01-15', 'cliente': 'Benchmark', 'producto': 'Grande', 'cantidad': '2', 'descuento': '10',
+          'anticipo': '5000', 'metodo_pago_anticipo': 'Efectivo', 'cuotas_visa_anticipo': '3',
+          'fecha_sesion': '2025-02-15', 'metodo_pago_saldo': 'Pendiente', 'cuotas_visa_saldo': '6'}
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, round(p / 100 * (len(ordenados) - 1)))]
+
+def medir(funcion, repeticiones, preparar=None):
+    """Latencias en ms de `funcion` y el pico de memoria de Python (tracemalloc) de una llamada."""
+    funcion()  # calentamiento: caché del catálogo, plantillas, planes de consulta
+    latencias = []
+    for _ in range(repeticiones):
+        if preparar:
+            preparar()
+        inicio = time.perf_counter()
+        funcion()
+        latencias.append((time.perf_counter() - inicio) * 1000)
+    if preparar:
+        preparar()
+    tracemalloc.start()
+    funcion()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'n': repeticiones,
+        'p50_ms': round(statistics.median(latencias), 3),
+        'p90_ms': round(percentil(latencias, 90), 3),
+        'p99_ms': round(percentil(latencias, 99), 3),
+        'max_ms': round(max(latencias), 3),
+        'memoria_pico_kb': round(pico / 1024, 1)
+    }
+
+def pedir(cliente, metodo, url, **kwargs):
+    def funcion():
+        respuesta = getattr(cliente, metodo)(url, **kwargs)
+        if respuesta.status_code >= 400:
+            raise RuntimeError(f'{metodo.upper()} {url}: {respuesta.status_code}')
+        respuesta.close()
+    return funcion
+
+def borrar_exportaciones():
+    with eterno.app.app_context():
+        conn = eterno.get_db_connection()
+        cur = conn.cursor()
+        cur.execute('DELETE FROM exportaciones')
+        conn.commit()
+        cur.close()
+
+def leer_pedidos():
+    with eterno.app.app_context():
+        cur = eterno.get_db_connection().cursor()
+        cur.execute('SELECT * FROM pedidos')
+        pedidos = cur.fetchall()
+        cur.close()
+    return pedidos
+
+def ciclo_calcular_totales(pedidos):
+    def funcion():
+        for p in pedidos:
+            eterno.calcular_totales(p['producto'], p['cantidad'], p['descuento'], p['anticipo'],
+                                    p['cuotas_visa_anticipo'], p['cuotas_visa_saldo'], eterno.catalogo_de(p))
+    return funcion
+
+def medir_tamano(n, args):
+    sembrar(n, args.semilla)
+    eterno.limiter.enabled = False  # los límites del login cortarían las repeticiones
+    cliente = eterno.app.test_client()
+    cliente.post('/login', data={'username': USUARIO, 'password': PASSWORD})
+    r = args.repeticiones
+    lentas = args.repeticiones_lentas
+    pedidos = leer_pedidos()
+
+    resultados = {}
+    escenarios = [
+        ('dashboard', pedir(cliente, 'get', '/dashboard'), r, None),
+        ('api_estadisticas', pedir(cliente, 'get', '/api/estadisticas'), r, None),
+        ('api_estadisticas_filtrado', pedir(cliente, 'get', '/api/estadisticas', query_string=FILTRO), r, None),
+        ('api_pedidos', pedir(cliente, 'get', '/api/pedidos'), r, None),
+        ('api_pedidos_filtrado', pedir(cliente, 'get', '/api/pedidos', query_string=FILTRO), r, None),
+        ('buscar_cliente', pedir(cliente, 'get', '/api/clientes/buscar', query_string={'q': 'lopez'}), r, None),
+        ('buscar_cliente_corto', pedir(cliente, 'get', '/api/clientes/buscar', query_string={'q': 'ma'}), r, None),
+        ('buscar_cliente_completo', pedir(cliente, 'get', '/api/clientes/buscar', query_string={'q': 'maria perez gom'}), r, None),
+        ('exportar_excel', pedir(cliente, 'get', '/exportar-excel'), lentas, borrar_exportaciones),
+        ('exportar_excel_filtrado', pedir(cliente, 'get', '/exportar-excel', query_string=FILTRO), lentas, borrar_exportaciones),
+        ('calcular_totales', ciclo_calcular_totales(pedidos), lentas, None),
+        ('calcular_totales_batch', lambda: eterno.totales_de_pedidos(pedidos), lentas, None),
+        ('login', pedir(eterno.app.test_client(), 'post', '/login', data={'username': USUARIO, 'password': PASSWORD}), r, None),
+        # Al final: agrega pedidos a la base
+        ('nuevo_pedido', pedir(cliente, 'post', '/nuevo-pedido', data=PEDIDO), r, None),
+    ]
+    for nombre, funcion, repeticiones, preparar in escenarios:
+        if args.solo and nombre not in args.solo:
+            continue
+        try:
+            resultados[nombre] = medir(funcion, repeticiones, preparar)
+        except RuntimeError as e:
+            # Una ruta que falla queda registrada; --comparar la marca si antes funcionaba
+            resultados[nombre] = {'error': str(e)}
+            print(f'{n:>8} {nombre:28} ERROR {e}', flush=True)
+            continue
+        print(f"{n:>8} {nombre:28} p50 {resultados[nombre]['p50_ms']:>10.2f} ms  "
+              f"p99 {resultados[nombre]['p99_ms']:>10.2f} ms  {resultados[nombre]['memoria_pico_kb']:>10.1f} KB", flush=True)
+    return resultados
+
+def comparar(actual, base, umbral, minimo_ms):
+    """Escenarios cuyo p50 o pico de memoria creció más que `umbral` (fracción) respecto a la base."""
+    regresiones = []
+    for tamano, escenarios in actual['resultados'].items():
+        for nombre, medida in escenarios.items():
+            anterior = base['resultados'].get(tamano, {}).get(nombre)
+            if not anterior or 'error' in anterior:
+                continue
+            if 'error' in medida:
+                regresiones.append(f"{tamano} {nombre}: {medida['error']}")
+                continue
+            for metrica, minimo in (('p50_ms', minimo_ms), ('memoria_pico_kb', 64)):
+                if medida[metrica] > anterior[metrica] * (1 + umbral) and medida[metrica] - anterior[metrica] > minimo:
+                    regresiones.append(f'{tamano} {nombre} {metrica}: {anterior[metrica]} -> {medida[metrica]} '
+                                       f'(+{(medida[metrica] / anterior[metrica] - 1) * 100:.0f}%)')
+    return regresiones
+
+def commit_actual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ''
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tamanos', default='1000,10000,100000')
+    parser.add_argument('--repeticiones', type=int, default=30)
+    parser.add_argument('--repeticiones-lentas', type=int, default=5, help='Para exportación y calcular_totales.')
+    parser.add_argument('--semilla', type=int, default=1)
+    parser.add_argument('--solo', type=lambda v: v.split(','), default=None, help='Escenarios a medir, separados por coma.')
+    parser.add_argument('--salida', default=None, help='Archivo JSON con los resultados.')
+    parser.add_argument('--comparar', default=None, help='JSON de una corrida anterior (línea base).')
+    parser.add_argument('--umbral', type=float, default=0.2, help='Crecimiento tolerado antes de marcar regresión.')
+    parser.add_argument('--minimo-ms', type=float, default=1.0, help='Diferencia mínima de p50 para marcar regresión.')
+    args = parser.parse_args()
+
+    with eterno.app.app_context():
+        eterno.aplicar_migraciones(eterno.get_db_connection(), aviso=lambda _: None)
+    resultados = {
+        'meta': {
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'commit': commit_actual(),
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'repeticiones': args.repeticiones,
+            'repeticiones_lentas': args.repeticiones_lentas,
+            'semilla': args.semilla
+        },
+        'resultados': {}
+    }
+    for n in [int(t) for t in args.tamanos.split(',')]:
+        resultados['resultados'][str(n)] = medir_tamano(n, args)
+
+    if args.salida:
+        with open(args.salida, 'w', encoding='utf-8') as archivo:
+            json.dump(resultados, archivo, indent=2)
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as archivo:
+            base = json.load(archivo)
+        regresiones = comparar(resultados, base, args.umbral, args.minimo_ms)
+        for regresion in regresiones:
+            print(f'REGRESIÓN {regresion}')
+        if regresiones:
+            sys.exit(1)
+        print(f"Sin regresiones respecto a {args.comparar} ({base['meta'].get('commit', '')})")
+
+if __name__ == '__main__':
+    main()
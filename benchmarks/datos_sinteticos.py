@@ -0,0 +1,53 @@
+"""Pedidos sintéticos reproducibles para los benchmarks.
+
+Las filas usan el formato del archivo de importación (descuento en %), así
+que sembrar la base pasa por la misma validación que una importación real.
+"""
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import app as eterno
+
+FECHA_INICIAL = date(2024, 1, 1)
+DIAS = 900
+# Nombres con tildes para que la búsqueda de clientes se mida con datos parecidos a los reales
+NOMBRES = ['María', 'José', 'Ana', 'Lucía', 'Andrés', 'Sofía', 'Jesús', 'Mónica', 'Iván', 'Raúl',
+           'Verónica', 'Julián', 'Inés', 'Óscar', 'Begoña', 'Carmen', 'Héctor', 'Rocío', 'Tomás', 'Noé']
+APELLIDOS = ['López', 'Pérez', 'García', 'Hernández', 'Martínez', 'Gómez', 'Díaz', 'Sánchez', 'Ramírez', 'Núñez',
+             'Muñoz', 'Castañeda', 'Álvarez', 'Méndez', 'Ordóñez', 'Chávez', 'Juárez', 'Cifuentes', 'Monzón', 'Barrios']
+
+def generar_filas(n, catalogo, rng):
+    """n filas en el orden de COLUMNAS_IMPORTACION, repartidas en productos, descuentos, cuotas y fechas."""
+    productos = list(catalogo['productos'])
+    cuotas = [0, 0] + list(catalogo['costos_visa'])
+    metodos = [''] + catalogo['metodos_pago']
+    for i in range(n):
+        fecha = FECHA_INICIAL + timedelta(days=rng.randrange(DIAS))
+        sesion = fecha + timedelta(days=rng.randint(7, 60)) if rng.random() < 0.9 else None
+        cliente = f'{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)} {rng.choice(APELLIDOS)}'
+        yield [fecha.isoformat(), cliente, rng.choice(productos), rng.randint(1, 4),
+               rng.choice([0, 0, 0, 5, 10, 12.5]), rng.choice([0, 1000, 2500, 5000, round(rng.uniform(0, 20000), 2)]),
+               rng.choice(metodos), rng.choice(cuotas), sesion.isoformat() if sesion else '',
+               rng.choice(['Pendiente'] + catalogo['metodos_pago']), rng.choice(cuotas)]
+
+def sembrar(n, semilla=1):
+    """Vacía pedidos (y lo que depende de ellos) e inserta n pedidos sintéticos. Devuelve el reporte de importación."""
+    with eterno.app.app_context():
+        conn = eterno.get_db_connection()
+        cur = conn.cursor()
+        cur.execute('TRUNCATE pedidos, pedidos_resumen_diario, exportaciones RESTART IDENTITY')
+        catalogo = eterno.catalogo_vigente()
+        filas = ((numero, dict(zip(eterno.COLUMNAS_IMPORTACION, fila)))
+                 for numero, fila in enumerate(generar_filas(n, catalogo, random.Random(semilla)), start=2))
+        reporte = eterno.importar_pedidos(cur, filas, catalogo)
+        if reporte['errores']:
+            conn.rollback()
+            raise RuntimeError(f"Filas sintéticas inválidas: {reporte['errores'][:3]}")
+        conn.commit()
+        cur.execute('ANALYZE pedidos')
+        cur.close()
+    return reporte
@@ -0,0 +1,23 @@
+"""Configuración de gunicorn: `gunicorn app:app` la lee del directorio de trabajo.
+
+Workers gthread: las conexiones del dashboard en vivo (/api/eventos) quedan
+abiertas hasta EVENTOS_DURACION_MAX y cada una ocupa un hilo, así que el
+worker necesita hilos para ellas y para las demás peticiones.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
+# En gthread el latido del worker no depende de las peticiones: una conexión de eventos larga no lo vence
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = 30
+keepalive = 5
+
+def post_worker_init(worker):
+    # Cupo de conexiones de eventos de este worker: sus hilos menos EVENTOS_HILOS_RESERVADOS
+    from gunicorn.workers.gthread import ThreadWorker
+    from app import limitar_eventos_a_hilos
+    cupo = limitar_eventos_a_hilos(worker.cfg.threads if isinstance(worker, ThreadWorker) else 0)
+    worker.log.info('Dashboard en vivo: hasta %s conexiones de eventos en este worker', cupo)
@@ -0,0 +1,36 @@
+-- Tablas base: usuarios y pedidos
+CREATE TABLE IF NOT EXISTS usuarios (
+    id SERIAL PRIMARY KEY,
+    username VARCHAR(50) UNIQUE NOT NULL,
+    password VARCHAR(255) NOT NULL,
+    nombre VARCHAR(100) NOT NULL,
+    rol VARCHAR(20) DEFAULT 'usuario',
+    activo BOOLEAN DEFAULT TRUE,
+    fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS pedidos (
+    id SERIAL PRIMARY KEY,
+    fecha DATE NOT NULL,
+    cliente VARCHAR(100) NOT NULL,
+    producto VARCHAR(50) NOT NULL,
+    cantidad INTEGER DEFAULT 1,
+    precio_unitario DECIMAL(10,2) NOT NULL,
+    descuento DECIMAL(5,4) DEFAULT 0,
+    anticipo DECIMAL(10,2) DEFAULT 0,
+    metodo_pago_anticipo VARCHAR(50),
+    cuotas_visa_anticipo INTEGER DEFAULT 0,
+    fecha_sesion DATE,
+    metodo_pago_saldo VARCHAR(50),
+    cuotas_visa_saldo INTEGER DEFAULT 0,
+    usuario_id INTEGER REFERENCES usuarios(id),
+    fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Columnas agregadas después de la primera versión de la tabla
+ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS anticipo DECIMAL(10,2) DEFAULT 0;
+ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS metodo_pago_anticipo VARCHAR(50);
+ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS cuotas_visa_anticipo INTEGER DEFAULT 0;
+ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS fecha_sesion DATE;
+ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS metodo_pago_saldo VARCHAR(50);
+ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS cuotas_visa_saldo INTEGER DEFAULT 0;
@@ -0,0 +1,2 @@
+-- Índice para la paginación por cursor (fecha, id) del dashboard
+CREATE INDEX IF NOT EXISTS idx_pedidos_fecha_id ON pedidos (fecha, id);
@@ -0,0 +1,41 @@
+-- Versión de los datos de pedidos: la incrementa un trigger en cada escritura
+CREATE TABLE IF NOT EXISTS datos_version (
+    tabla VARCHAR(50) PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    actualizado TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+INSERT INTO datos_version (tabla) VALUES ('pedidos') ON CONFLICT DO NOTHING;
+
+CREATE OR REPLACE FUNCTION incrementar_version_pedidos() RETURNS trigger AS $$
+BEGIN
+    UPDATE datos_version SET version = version + 1, actualizado = CURRENT_TIMESTAMP WHERE tabla = 'pedidos';
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS pedidos_version ON pedidos;
+CREATE TRIGGER pedidos_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON pedidos
+FOR EACH STATEMENT EXECUTE FUNCTION incrementar_version_pedidos();
+
+-- Trabajos de exportación a Excel en segundo plano
+CREATE TABLE IF NOT EXISTS exportaciones (
+    id SERIAL PRIMARY KEY,
+    fecha_inicio VARCHAR(10) NOT NULL DEFAULT '',
+    fecha_fin VARCHAR(10) NOT NULL DEFAULT '',
+    version_datos BIGINT NOT NULL,
+    estado VARCHAR(20) NOT NULL DEFAULT 'pendiente',
+    progreso INTEGER NOT NULL DEFAULT 0,
+    total INTEGER NOT NULL DEFAULT 0,
+    archivo VARCHAR(255),
+    tamano BIGINT,
+    error TEXT,
+    usuario_id INTEGER REFERENCES usuarios(id),
+    fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    actualizado TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    terminado TIMESTAMP
+);
+
+-- Un solo trabajo vigente por (rango, versión): es la llave del caché de archivos
+CREATE UNIQUE INDEX IF NOT EXISTS idx_exportaciones_vigentes
+ON exportaciones (fecha_inicio, fecha_fin, version_datos)
+WHERE estado IN ('pendiente', 'procesando', 'listo');
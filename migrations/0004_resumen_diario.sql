@@ -0,0 +1,15 @@
+-- Resumen diario por producto, mantenido por las rutas de escritura.
+-- Se llena en el paso de datos de `flask db upgrade` si está vacío.
+CREATE TABLE IF NOT EXISTS pedidos_resumen_diario (
+    fecha DATE NOT NULL,
+    producto VARCHAR(50) NOT NULL,
+    pedidos INTEGER NOT NULL DEFAULT 0,
+    unidades INTEGER NOT NULL DEFAULT 0,
+    anticipo NUMERIC NOT NULL DEFAULT 0,
+    saldo NUMERIC NOT NULL DEFAULT 0,
+    total_venta NUMERIC NOT NULL DEFAULT 0,
+    costo_produccion NUMERIC NOT NULL DEFAULT 0,
+    costo_visa NUMERIC NOT NULL DEFAULT 0,
+    utilidad NUMERIC NOT NULL DEFAULT 0,
+    PRIMARY KEY (fecha, producto)
+);
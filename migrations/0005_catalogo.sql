@@ -0,0 +1,40 @@
+-- Catálogo versionado de productos, tasas Visa y métodos de pago
+CREATE TABLE IF NOT EXISTS catalogo_versiones (
+    version SERIAL PRIMARY KEY,
+    descripcion TEXT,
+    usuario_id INTEGER REFERENCES usuarios(id),
+    fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS catalogo_productos (
+    version INTEGER NOT NULL REFERENCES catalogo_versiones(version),
+    producto VARCHAR(50) NOT NULL,
+    medidas VARCHAR(50),
+    precio DECIMAL(10,2) NOT NULL,
+    costos JSONB NOT NULL,
+    costo_unitario DECIMAL(10,2) NOT NULL,
+    orden INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (version, producto)
+);
+
+CREATE TABLE IF NOT EXISTS catalogo_visa (
+    version INTEGER NOT NULL REFERENCES catalogo_versiones(version),
+    cuotas INTEGER NOT NULL,
+    tasa DECIMAL(6,4) NOT NULL,
+    PRIMARY KEY (version, cuotas)
+);
+
+CREATE TABLE IF NOT EXISTS catalogo_metodos_pago (
+    version INTEGER NOT NULL REFERENCES catalogo_versiones(version),
+    metodo VARCHAR(50) NOT NULL,
+    orden INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (version, metodo)
+);
+
+CREATE OR REPLACE FUNCTION catalogo_version_vigente() RETURNS INTEGER AS $$
+    SELECT MAX(version) FROM catalogo_versiones
+$$ LANGUAGE sql STABLE;
+
+-- Cada pedido guarda la versión del catálogo con la que se cotizó
+ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS catalogo_version INTEGER REFERENCES catalogo_versiones(version);
+ALTER TABLE pedidos ALTER COLUMN catalogo_version SET DEFAULT catalogo_version_vigente();
@@ -0,0 +1,7 @@
+-- Estado de cobro del saldo de cada pedido
+ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS saldo_pagado BOOLEAN NOT NULL DEFAULT FALSE;
+ALTER TABLE pedidos ADD COLUMN IF NOT EXISTS fecha_pago_saldo TIMESTAMP;
+
+-- Sólo los pedidos por cobrar, en el orden de la vista de saldos pendientes:
+-- el índice no crece con el historial de saldos ya pagados
+CREATE INDEX IF NOT EXISTS idx_pedidos_saldo_pendiente ON pedidos (fecha_sesion, id) WHERE NOT saldo_pagado;
@@ -0,0 +1,13 @@
+-- Búsqueda de clientes sin extensiones (pg_trgm/unaccent no siempre están instaladas).
+-- normalizar_texto quita tildes y pasa a minúsculas; normalizar_busqueda en app.py
+-- hace lo mismo con el texto buscado.
+CREATE OR REPLACE FUNCTION normalizar_texto(texto TEXT) RETURNS TEXT
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT lower(translate(texto,
+        'ÁÀÂÄÉÈÊËÍÌÎÏÓÒÔÖÚÙÛÜÑÇáàâäéèêëíìîïóòôöúùûüñç',
+        'AAAAEEEEIIIIOOOOUUUUNCaaaaeeeeiiiioooouuuunc'))
+$$;
+
+-- Cada palabra del nombre queda en el índice: 'lop:*' encuentra a "María López"
+CREATE INDEX IF NOT EXISTS idx_pedidos_cliente_busqueda
+    ON pedidos USING GIN (to_tsvector('simple', normalizar_texto(cliente)));
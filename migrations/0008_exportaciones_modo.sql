@@ -0,0 +1,8 @@
+-- Tipo de exportación: 'pedidos' (sólo el listado) o 'analitico' (más hojas de resumen)
+ALTER TABLE exportaciones ADD COLUMN IF NOT EXISTS modo VARCHAR(20) NOT NULL DEFAULT 'pedidos';
+
+-- El modo forma parte de la llave del caché de archivos
+DROP INDEX IF EXISTS idx_exportaciones_vigentes;
+CREATE UNIQUE INDEX idx_exportaciones_vigentes
+ON exportaciones (fecha_inicio, fecha_fin, modo, version_datos)
+WHERE estado IN ('pendiente', 'procesando', 'listo');
@@ -0,0 +1,114 @@
+-- Pedidos particionados por año de `fecha`: los filtros por fecha sólo recorren
+-- las particiones del rango. Los años cerrados se pueden archivar (DETACH) con
+-- `flask particiones archivar`; su tabla pasa al esquema archivo.
+CREATE SCHEMA IF NOT EXISTS archivo;
+
+-- Años archivados con sus totales, tomados de pedidos_resumen_diario al archivar.
+-- Las filas del resumen se conservan: el dashboard sigue incluyendo esos años.
+CREATE TABLE IF NOT EXISTS pedidos_archivados (
+    anio INTEGER PRIMARY KEY,
+    tabla VARCHAR(100) NOT NULL,
+    pedidos INTEGER NOT NULL DEFAULT 0,
+    unidades INTEGER NOT NULL DEFAULT 0,
+    anticipo NUMERIC NOT NULL DEFAULT 0,
+    saldo NUMERIC NOT NULL DEFAULT 0,
+    total_venta NUMERIC NOT NULL DEFAULT 0,
+    costo_produccion NUMERIC NOT NULL DEFAULT 0,
+    costo_visa NUMERIC NOT NULL DEFAULT 0,
+    utilidad NUMERIC NOT NULL DEFAULT 0,
+    archivado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE OR REPLACE FUNCTION fecha_archivada(f DATE) RETURNS BOOLEAN AS $$
+    SELECT EXISTS (SELECT 1 FROM pedidos_archivados WHERE anio = EXTRACT(YEAR FROM f))
+$$ LANGUAGE sql STABLE;
+
+-- Crea la partición del año si falta. Devuelve 'creada', 'existente' o 'archivada'
+-- (un año archivado no se vuelve a crear: hay que restaurarlo).
+CREATE OR REPLACE FUNCTION crear_particion_pedidos(anio_particion INTEGER) RETURNS TEXT AS $$
+DECLARE
+    tabla TEXT := format('pedidos_%s', anio_particion);
+BEGIN
+    IF to_regclass(format('public.%I', tabla)) IS NOT NULL THEN
+        RETURN 'existente';
+    END IF;
+    IF EXISTS (SELECT 1 FROM pedidos_archivados WHERE anio = anio_particion) THEN
+        RETURN 'archivada';
+    END IF;
+    -- Sólo se bloquea para crear: dos procesos pueden pedir el mismo año a la vez
+    PERFORM pg_advisory_xact_lock(7365002);
+    IF to_regclass(format('public.%I', tabla)) IS NOT NULL THEN
+        RETURN 'existente';
+    END IF;
+    EXECUTE format('CREATE TABLE public.%I PARTITION OF pedidos FOR VALUES FROM (%L) TO (%L)',
+                   tabla, make_date(anio_particion, 1, 1), make_date(anio_particion + 1, 1, 1));
+    RETURN 'creada';
+END
+$$ LANGUAGE plpgsql;
+
+ALTER TABLE pedidos RENAME TO pedidos_sin_particionar;
+-- Libera los nombres de las restricciones para la tabla nueva
+ALTER TABLE pedidos_sin_particionar
+    DROP CONSTRAINT IF EXISTS pedidos_pkey,
+    DROP CONSTRAINT IF EXISTS pedidos_usuario_id_fkey,
+    DROP CONSTRAINT IF EXISTS pedidos_catalogo_version_fkey;
+
+-- La llave primaria de una tabla particionada debe incluir la columna de partición
+CREATE TABLE pedidos (
+    id INTEGER NOT NULL DEFAULT nextval('pedidos_id_seq'),
+    fecha DATE NOT NULL,
+    cliente VARCHAR(100) NOT NULL,
+    producto VARCHAR(50) NOT NULL,
+    cantidad INTEGER DEFAULT 1,
+    precio_unitario DECIMAL(10,2) NOT NULL,
+    descuento DECIMAL(5,4) DEFAULT 0,
+    anticipo DECIMAL(10,2) DEFAULT 0,
+    metodo_pago_anticipo VARCHAR(50),
+    cuotas_visa_anticipo INTEGER DEFAULT 0,
+    fecha_sesion DATE,
+    metodo_pago_saldo VARCHAR(50),
+    cuotas_visa_saldo INTEGER DEFAULT 0,
+    usuario_id INTEGER REFERENCES usuarios(id),
+    fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    catalogo_version INTEGER REFERENCES catalogo_versiones(version) DEFAULT catalogo_version_vigente(),
+    saldo_pagado BOOLEAN NOT NULL DEFAULT FALSE,
+    fecha_pago_saldo TIMESTAMP,
+    PRIMARY KEY (id, fecha)
+) PARTITION BY RANGE (fecha);
+
+ALTER SEQUENCE pedidos_id_seq OWNED BY pedidos.id;
+
+-- Una partición por cada año con pedidos, más el año en curso y el siguiente
+DO $$
+DECLARE
+    anio INTEGER;
+    desde INTEGER := LEAST(EXTRACT(YEAR FROM CURRENT_DATE),
+                           COALESCE((SELECT EXTRACT(YEAR FROM MIN(fecha)) FROM pedidos_sin_particionar), 9999));
+    hasta INTEGER := GREATEST(EXTRACT(YEAR FROM CURRENT_DATE) + 1,
+                              COALESCE((SELECT EXTRACT(YEAR FROM MAX(fecha)) FROM pedidos_sin_particionar), 0));
+BEGIN
+    FOR anio IN desde..hasta LOOP
+        PERFORM crear_particion_pedidos(anio);
+    END LOOP;
+END
+$$;
+
+INSERT INTO pedidos (id, fecha, cliente, producto, cantidad, precio_unitario, descuento, anticipo,
+                     metodo_pago_anticipo, cuotas_visa_anticipo, fecha_sesion, metodo_pago_saldo,
+                     cuotas_visa_saldo, usuario_id, fecha_creacion, catalogo_version, saldo_pagado, fecha_pago_saldo)
+SELECT id, fecha, cliente, producto, cantidad, precio_unitario, descuento, anticipo,
+       metodo_pago_anticipo, cuotas_visa_anticipo, fecha_sesion, metodo_pago_saldo,
+       cuotas_visa_saldo, usuario_id, fecha_creacion, catalogo_version, saldo_pagado, fecha_pago_saldo
+FROM pedidos_sin_particionar;
+
+DROP TABLE pedidos_sin_particionar;
+
+-- Los índices se crean en cada partición (también en las que se agreguen después)
+CREATE INDEX idx_pedidos_fecha_id ON pedidos (fecha, id);
+CREATE INDEX idx_pedidos_saldo_pendiente ON pedidos (fecha_sesion, id) WHERE NOT saldo_pagado;
+CREATE INDEX idx_pedidos_cliente_busqueda ON pedidos USING GIN (to_tsvector('simple', normalizar_texto(cliente)));
+
+CREATE TRIGGER pedidos_version AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON pedidos
+FOR EACH STATEMENT EXECUTE FUNCTION incrementar_version_pedidos();
+
+ANALYZE pedidos;
@@ -0,0 +1,8 @@
+-- Los montos por pedido se redondean a centavos (ROUND(x, 2) en
+-- sql_pedidos_calculados, enteros en calcular_totales). El resumen de los años
+-- vigentes se vuelve a calcular al terminar `flask db upgrade`; los años
+-- archivados conservan los totales con los que se archivaron.
+DELETE FROM pedidos_resumen_diario WHERE NOT fecha_archivada(fecha);
+
+-- Invalida los Excel ya generados con los montos sin redondear
+UPDATE datos_version SET version = version + 1, actualizado = CURRENT_TIMESTAMP WHERE tabla = 'pedidos';
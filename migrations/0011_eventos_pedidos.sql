@@ -0,0 +1,12 @@
+-- Eventos de pedidos para el dashboard en vivo (/api/eventos). Cada escritura
+-- guarda el suyo en la misma transacción y lo avisa con NOTIFY; la tabla sirve
+-- para reenviar lo que un navegador se perdió al reconectar (Last-Event-ID).
+-- Los listeners borran los eventos con más de EVENTOS_RETENCION_HORAS.
+CREATE TABLE IF NOT EXISTS eventos_pedidos (
+    id BIGSERIAL PRIMARY KEY,
+    tipo VARCHAR(20) NOT NULL,
+    datos JSONB NOT NULL DEFAULT '{}',
+    creado TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_eventos_pedidos_creado ON eventos_pedidos (creado);
@@ -0,0 +1,16 @@
+-- normalizar_texto quita también ã, õ, ø, ý, š, ł y otras letras con tilde que antes
+-- quedaban en el índice. La tabla es la misma que TILDES_ORIGEN/TILDES_DESTINO en
+-- app.py: normalizar_busqueda quita exactamente lo mismo del texto buscado.
+CREATE OR REPLACE FUNCTION normalizar_texto(texto TEXT) RETURNS TEXT
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+    SELECT lower(translate(texto,
+        'ÁÀÂÄÃÅĀĂĄáàâäãåāăąÉÈÊËĒĖĘĚéèêëēėęěÍÌÎÏĪĮíìîïīįıÓÒÔÖÕØŌŐóòôöõøōő'
+        'ÚÙÛÜŪŮŰŲúùûüūůűųÝŸýÿÑŃŇñńňÇĆČçćčĎĐďđĞğŁłŘřŚŞŠśşšŢŤţťŹŻŽźżž',
+        'AAAAAAAAAaaaaaaaaaEEEEEEEEeeeeeeeeIIIIIIiiiiiiiOOOOOOOOoooooooo'
+        'UUUUUUUUuuuuuuuuYYyyNNNnnnCCCcccDDddGgLlRrSSSsssTTttZZZzzz'))
+$$;
+
+-- El índice guarda lo que devolvía la función anterior: se vuelve a crear
+DROP INDEX IF EXISTS idx_pedidos_cliente_busqueda;
+CREATE INDEX idx_pedidos_cliente_busqueda
+    ON pedidos USING GIN (to_tsvector('simple', normalizar_texto(cliente)));
@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+@pytest.fixture
+def cur():
+    """Cursor de DATABASE_URL dentro de una transacción que se deshace al terminar.
+
+    Las pruebas que lo usan se saltan si no hay DATABASE_URL o si la base no
+    tiene todas las migraciones (`flask db upgrade`).
+    """
+    if not os.environ.get('DATABASE_URL'):
+        pytest.skip('Defina DATABASE_URL para las pruebas con base de datos')
+    import app
+    with app.app.app_context():
+        conn = app.get_db_connection()
+        cursor = conn.cursor()
+        try:
+            if app.version_esquema(cursor) < app.listar_migraciones()[-1][0]:
+                pytest.skip('La base de DATABASE_URL no tiene todas las migraciones')
+            yield cursor
+        finally:
+            cursor.close()
+            conn.rollback()
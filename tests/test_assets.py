@@ -0,0 +1,33 @@
+"""Las librerías commiteadas en static/vendor coinciden con el hash fijado en ASSETS_VENDOR y
+ninguna plantilla carga recursos de un CDN. No necesita base de datos."""
+import os
+import re
+
+import pytest
+
+from app import ASSETS_VENDOR, app, assets_alterados, politica_csp
+
+CARPETA_PLANTILLAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'templates')
+
+def test_vendor_coincide_con_hashes():
+    with app.app_context():
+        assert assets_alterados() == []
+
+def test_csp_sin_hosts_externos():
+    with app.test_request_context():
+        politica = politica_csp()
+    assert all(fuente.startswith("'") or fuente == 'data:'
+               for fuentes in politica.values()
+               for fuente in ([fuentes] if isinstance(fuentes, str) else fuentes))
+
+@pytest.mark.parametrize('plantilla', sorted(os.listdir(CARPETA_PLANTILLAS)))
+def test_plantillas_sin_cdn(plantilla):
+    with open(os.path.join(CARPETA_PLANTILLAS, plantilla), encoding='utf-8') as archivo:
+        texto = archivo.read()
+    assert not re.search(r'''(?:src|href)=["']https?://''', texto)
+    # asset_url sólo para rutas conocidas de static/vendor, con su integrity
+    for ruta in re.findall(r"asset_url\('(vendor/[^']+)'\)", texto):
+        assert ruta in ASSETS_VENDOR
+        assert f"asset_integridad('{ruta}')" in texto
+    # Font Awesome no se carga: los íconos son de Bootstrap Icons
+    assert not re.search(r'\bfa[srb]? fa-', texto)
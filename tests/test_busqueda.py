@@ -0,0 +1,39 @@
+"""normalizar_busqueda (Python) y normalizar_texto() (SQL) quitan exactamente las mismas tildes."""
+import unicodedata
+
+import pytest
+
+import app
+
+NOMBRES = ['María José López', 'João Gonçalves', 'Søren Øster', 'Ýmir Ólafsson', 'Łukasz Wałęsa', 'Šárka Dvořák',
+           'ÑUÑOA Çelik', 'Ana-Lucía O\'Brien', 'Begoña_Núñez 2024', 'Straße']
+
+# (nombre guardado, lo que escribe el usuario sin tildes)
+BUSCADOS = [('João Gonçalves', 'joao gonc'), ('Søren Øster', 'oster'), ('Łukasz Wałęsa', 'lukasz walesa'),
+            ('Šárka Dvořák', 'dvorak sar'), ('Ýmir Ólafsson', 'ymir'), ('María José López', 'lopez mar'),
+            ('Straße', 'straße')]
+
+def test_tabla_de_tildes_consistente():
+    assert len(app.TILDES_ORIGEN) == len(app.TILDES_DESTINO) == len(set(app.TILDES_ORIGEN))
+    for origen, destino in zip(app.TILDES_ORIGEN, app.TILDES_DESTINO):
+        # Donde Unicode la descompone, la letra base es el reemplazo (ø, ł, đ, ı no se descomponen)
+        base = unicodedata.normalize('NFKD', origen)[0]
+        assert base == destino or base == origen, origen
+
+def test_normalizar_busqueda():
+    assert app.normalizar_busqueda('  João Øster-López ') == ['joao', 'oster', 'lopez']
+    assert app.normalizar_busqueda('maria_jose') == ['maria', 'jose']
+    assert app.normalizar_busqueda('') == []
+
+@pytest.mark.parametrize('texto', [app.TILDES_ORIGEN] + NOMBRES)
+def test_igual_que_la_base(cur, texto):
+    cur.execute('SELECT normalizar_texto(%s) AS texto', (texto,))
+    assert cur.fetchone()['texto'] == app.normalizar_texto(texto)
+
+@pytest.mark.parametrize('nombre, escrito', BUSCADOS)
+def test_busqueda_sin_tildes_encuentra_el_nombre(cur, nombre, escrito):
+    """Lo que escribe el usuario coincide con el índice de clientes, como en /api/clientes/buscar."""
+    consulta = ' & '.join(f'{palabra}:*' for palabra in app.normalizar_busqueda(escrito))
+    cur.execute("SELECT to_tsvector('simple', normalizar_texto(%s)) @@ to_tsquery('simple', %s) AS coincide",
+                (nombre, consulta))
+    assert cur.fetchone()['coincide'], consulta
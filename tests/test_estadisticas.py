@@ -0,0 +1,64 @@
+"""Las estadísticas de SQL (sql_pedidos_calculados y pedidos_resumen_diario) coinciden con el
+ciclo de calcular_totales. Necesita DATABASE_URL; todo ocurre en una transacción que se deshace."""
+import random
+
+import pytest
+
+import app
+
+# Año sin pedidos reales: los filtros de las pruebas sólo ven los pedidos sembrados
+ANIO = 2099
+DESDE, HASTA = f'{ANIO}-01-01', f'{ANIO}-12-31'
+
+def filas_sinteticas(n, catalogo, rng):
+    """Filas de importación con todos los productos, descuentos que dejan medios centavos y cuotas Visa."""
+    cuotas = [0] + sorted(catalogo['costos_visa'])
+    for numero in range(2, n + 2):
+        yield numero, {
+            'fecha': f'{ANIO}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}',
+            'cliente': f'Prueba {numero}',
+            'producto': rng.choice(sorted(catalogo['productos'])),
+            'cantidad': rng.randint(1, 5),
+            'descuento': rng.choice([0, 5, 12.5, 3.33, round(rng.uniform(0, 100), 2)]),
+            'anticipo': rng.choice([0, 1000, round(rng.uniform(0, 60000), 2)]),
+            'cuotas_visa_anticipo': rng.choice(cuotas),
+            'cuotas_visa_saldo': rng.choice(cuotas)
+        }
+
+@pytest.fixture
+def sembrado(cur):
+    """Importa pedidos sintéticos con importar_pedidos, que también suma al resumen diario."""
+    catalogo = app.catalogo_vigente()
+    reporte = app.importar_pedidos(cur, filas_sinteticas(300, catalogo, random.Random(ANIO)), catalogo)
+    assert reporte['errores'] == [] and reporte['importadas'] == 300
+    return cur
+
+@pytest.mark.parametrize('desde, hasta', [(DESDE, HASTA), (f'{ANIO}-03-01', f'{ANIO}-05-31'), (f'{ANIO}-07-15', '')])
+def test_estadisticas_sql_igual_a_python(sembrado, desde, hasta):
+    cur = sembrado
+    sql = app.calcular_estadisticas(cur, desde, hasta or HASTA)
+    condicion, params = app.filtro_fechas(desde, hasta or HASTA)
+    cur.execute(f'SELECT * FROM pedidos WHERE {condicion}', params)
+    python = app.calcular_estadisticas_python(cur.fetchall())
+    
+    assert python['total_pedidos'] > 0
+    for clave, valor in python.items():
+        if clave in app.ESTADISTICAS_CONTEOS:
+            assert sql[clave] == valor, clave
+        else:
+            assert sql[clave] == pytest.approx(valor, abs=0.005), clave
+
+def test_totales_por_pedido_sql_igual_a_python(sembrado):
+    cur = sembrado
+    ctes, params = app.sql_pedidos_calculados(*app.filtro_fechas(DESDE, HASTA))
+    cur.execute(ctes + '''
+        SELECT p.*, c.total_venta, c.saldo_restante, c.costo_produccion, c.costo_visa_anticipo, c.costo_visa_saldo
+        FROM pedidos p JOIN pedidos_calculados c USING (id, fecha)
+    ''', params)
+    filas = cur.fetchall()
+    assert len(filas) == 300
+    for fila in filas:
+        totales = app.calcular_totales(fila['producto'], fila['cantidad'], fila['descuento'], fila['anticipo'],
+                                       fila['cuotas_visa_anticipo'], fila['cuotas_visa_saldo'], app.catalogo_de(fila))
+        for campo in ('total_venta', 'saldo_restante', 'costo_produccion', 'costo_visa_anticipo', 'costo_visa_saldo'):
+            assert app.a_centavos(fila[campo]) == getattr(totales, campo + '_c'), (fila['id'], campo)
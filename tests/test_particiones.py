@@ -0,0 +1,45 @@
+"""Los filtros por fecha sólo recorren las particiones pedidos_AAAA de su rango (EXPLAIN, con
+particiones_del_plan). Necesita DATABASE_URL; las particiones de prueba se crean en una transacción
+que se deshace."""
+from datetime import date
+
+import pytest
+
+import app
+
+ANIO = 2098
+
+def listado(fecha_inicio, fecha_fin):
+    # Misma consulta que el listado completo (pedidos_por_lotes) y la exportación a Excel
+    condicion, params = app.filtro_fechas(fecha_inicio, fecha_fin)
+    return f'SELECT * FROM pedidos WHERE {condicion} ORDER BY fecha DESC, id DESC', params
+
+def calculados(fecha_inicio, fecha_fin):
+    ctes, params = app.sql_pedidos_calculados(*app.filtro_fechas(fecha_inicio, fecha_fin))
+    return ctes + 'SELECT * FROM pedidos_calculados', params
+
+CASOS = [
+    ('año completo', listado(f'{ANIO}-01-01', f'{ANIO}-12-31'), lambda a: a == ANIO),
+    ('un mes', listado(f'{ANIO}-03-01', f'{ANIO}-03-31'), lambda a: a == ANIO),
+    ('dos años', listado(f'{ANIO - 1}-12-01', f'{ANIO}-01-31'), lambda a: a in (ANIO - 1, ANIO)),
+    ('desde', listado(f'{ANIO}-01-01', ''), lambda a: a >= ANIO),
+    ('hasta', listado('', f'{ANIO}-12-31'), lambda a: a <= ANIO),
+    ('página filtrada', app.sql_pagina_pedidos(f'{ANIO}-02-01', f'{ANIO}-02-28'), lambda a: a == ANIO),
+    ('página siguiente', app.sql_pagina_pedidos(cursor_despues=(date(ANIO, 6, 30), 0)), lambda a: a <= ANIO),
+    ('página anterior', app.sql_pagina_pedidos(cursor_antes=(date(ANIO, 6, 30), 0)), lambda a: a >= ANIO),
+    ('totales calculados', calculados(f'{ANIO}-01-01', f'{ANIO}-12-31'), lambda a: a == ANIO),
+    ('totales de un mes', calculados(f'{ANIO}-05-01', f'{ANIO}-05-31'), lambda a: a == ANIO),
+]
+
+@pytest.fixture
+def particiones(cur):
+    """{tabla: año} de las particiones vigentes, con las de ANIO y sus años vecinos creadas."""
+    for anio in (ANIO - 1, ANIO, ANIO + 1):
+        app.crear_particion(cur, anio)
+    return {fila['tabla']: fila['anio'] for fila in app.listar_particiones(cur) if not fila['archivada']}
+
+@pytest.mark.parametrize('nombre, consulta, incluida', CASOS, ids=[caso[0] for caso in CASOS])
+def test_poda_de_particiones(cur, particiones, nombre, consulta, incluida):
+    sql, params = consulta
+    esperadas = {tabla for tabla, anio in particiones.items() if incluida(anio)}
+    assert app.particiones_del_plan(cur, sql, params) == esperadas
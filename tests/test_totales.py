@@ -0,0 +1,79 @@
+"""calcular_totales (escalar) y calcular_totales_batch dan los mismos centavos, y coinciden con
+una referencia en Decimal que redondea como ROUND(x, 2) de PostgreSQL. No necesita base de datos."""
+from decimal import Decimal, ROUND_HALF_UP
+
+import pytest
+from hypothesis import given, settings, strategies as st
+
+from app import (PRODUCTOS_CONFIG, COSTOS_VISA, CAMPOS_TOTALES, a_centavos, a_diezmilesimos,
+                 calcular_totales, calcular_totales_batch)
+
+# Catálogo fijo a partir de los valores iniciales
+CATALOGO = {'version': 0, 'productos': PRODUCTOS_CONFIG, 'costos_visa': COSTOS_VISA, 'metodos_pago': []}
+
+DERIVADOS = ('saldo_restante_c', 'costo_total_c', 'utilidad_c')
+
+# Cuotas de la tabla Visa, sin Visa (0) y cantidades que no están en la tabla
+CUOTAS = [0] + sorted(COSTOS_VISA) + [1, 5, 24, -3]
+
+# Columnas como las devuelve psycopg2: descuento DECIMAL(5,4) y anticipo DECIMAL(10,2)
+pedidos = st.tuples(
+    st.sampled_from(sorted(PRODUCTOS_CONFIG)),
+    st.integers(min_value=-3, max_value=500),
+    st.one_of(st.sampled_from([Decimal('0'), Decimal('1'), Decimal('0.125'), Decimal('-0.05')]),
+              st.decimals(min_value=-1, max_value=1, places=4)),
+    st.one_of(st.sampled_from([Decimal('0'), Decimal('-0.01'), Decimal('0.01')]),
+              st.decimals(min_value=-100000, max_value=10000000, places=2)),
+    st.sampled_from(CUOTAS),
+    st.sampled_from(CUOTAS)
+)
+
+def redondear(valor):
+    """Centavos de `valor` (quetzales) con medio centavo lejos del cero, como ROUND(x, 2)."""
+    return int((valor * 100).quantize(Decimal(1), ROUND_HALF_UP))
+
+def referencia_decimal(producto, cantidad, descuento, anticipo, cuotas_anticipo, cuotas_saldo):
+    """Los campos de CAMPOS_TOTALES en centavos, con la aritmética de sql_pedidos_calculados."""
+    config = PRODUCTOS_CONFIG[producto]
+    tasa = lambda cuotas: Decimal(str(COSTOS_VISA[cuotas])) if cuotas in COSTOS_VISA and cuotas > 0 else Decimal(0)
+    total_venta = Decimal(redondear(Decimal(str(config['precio'])) * cantidad * (1 - descuento))) / 100
+    return {
+        'cantidad': cantidad,
+        'precio_unitario_c': redondear(Decimal(str(config['precio']))),
+        'total_venta_c': redondear(total_venta),
+        'anticipo_c': redondear(anticipo),
+        'costo_produccion_c': sum(redondear(Decimal(str(costo))) for costo in config['costos'].values()) * cantidad,
+        'costo_visa_anticipo_c': redondear(anticipo * tasa(cuotas_anticipo)),
+        'costo_visa_saldo_c': redondear((total_venta - anticipo) * tasa(cuotas_saldo))
+    }
+
+def batch(filas, productos=None):
+    productos, cantidades, descuentos, anticipos, cuotas_anticipo, cuotas_saldo = zip(*filas)
+    return calcular_totales_batch(productos, cantidades, [a_diezmilesimos(d) for d in descuentos],
+                                  [a_centavos(a) for a in anticipos], cuotas_anticipo, cuotas_saldo, catalogo=CATALOGO)
+
+@settings(max_examples=300, deadline=None)
+@given(st.lists(pedidos, min_size=1, max_size=40))
+def test_escalar_batch_y_decimal_coinciden(filas):
+    totales = batch(filas)
+    for i, fila in enumerate(filas):
+        escalar = calcular_totales(*fila, catalogo=CATALOGO)
+        esperado = referencia_decimal(*fila)
+        assert totales['valido'][i]
+        for campo in CAMPOS_TOTALES:
+            assert getattr(escalar, campo) == esperado[campo], campo
+            assert int(totales[campo][i]) == esperado[campo], campo
+        for campo in DERIVADOS:
+            assert int(totales[campo][i]) == getattr(escalar, campo), campo
+        for concepto, valor in escalar.costos_detalle_c.items():
+            assert int(totales['costos_detalle_c'][concepto][i]) == valor, concepto
+
+@pytest.mark.parametrize('producto, cantidad', [('Descontinuado', 1), (sorted(PRODUCTOS_CONFIG)[0], None)])
+def test_pedido_invalido(producto, cantidad):
+    """Donde la versión escalar falla, el batch marca la fila como inválida sin afectar a las demás."""
+    valida = (sorted(PRODUCTOS_CONFIG)[0], 2, Decimal('0.1'), Decimal('500'), 3, 6)
+    with pytest.raises((KeyError, TypeError)):
+        calcular_totales(producto, cantidad, catalogo=CATALOGO)
+    totales = batch([(producto, cantidad, Decimal(0), Decimal(0), 0, 0), valida])
+    assert totales['valido'].tolist() == [False, True]
+    assert int(totales['total_venta_c'][1]) == calcular_totales(*valida, catalogo=CATALOGO).total_venta_c